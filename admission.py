@@ -0,0 +1,233 @@
+"""
+准入控制 - 有界优先级队列，预计排队时间超过SLO时快速返回503并附带Retry-After
+优先级数值越小越优先（分诊 > 自诊 > ... > 闲聊），过载时低优先级请求先被丢弃
+"""
+import asyncio
+import functools
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.responses import StreamingResponse
+
+from config import Config
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, route: str, reason: str, retry_after: float):
+        super().__init__("服务繁忙，请稍后重试")
+        self.route = route
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Ticket:
+    """一次准入申请"""
+
+    def __init__(self, route: str, priority: int, seq: int):
+        self.route = route
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.perf_counter()
+        self.admitted_at: Optional[float] = None
+        self.future: Optional["asyncio.Future"] = None
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """优先级准入控制器：并发名额 + 有界优先级队列 + 基于EWMA服务时间的排队时间预测"""
+
+    def __init__(self, max_concurrency: int = 64, max_queue: int = 256, slo_seconds: float = 10.0,
+                 initial_service_time: float = 5.0, priorities: Optional[Dict[str, int]] = None,
+                 default_priority: int = 5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.slo_seconds = slo_seconds
+        self.priorities = priorities or {}
+        self.default_priority = default_priority
+        self.service_time = initial_service_time
+        self.in_flight = 0
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Any] = {
+            "admitted": 0, "completed": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0,
+            "shed": {"queue_full": 0, "slo": 0, "evicted": 0}, "shed_by_route": {}
+        }
+
+    def priority_of(self, route: str) -> int:
+        return self.priorities.get(route, self.default_priority)
+
+    def projected_wait(self, priority: int) -> float:
+        """按排在前面的请求数预测排队时间"""
+        ahead = sum(1 for ticket in self._queue if ticket.priority <= priority)
+        if self.in_flight < self.max_concurrency and ahead == 0:
+            return 0.0
+        return (ahead + 1) / self.max_concurrency * self.service_time
+
+    def _shed(self, route: str, reason: str, retry_after: float) -> AdmissionRejected:
+        self._counters["shed"][reason] += 1
+        by_route = self._counters["shed_by_route"]
+        by_route[route] = by_route.get(route, 0) + 1
+        return AdmissionRejected(route, reason, retry_after)
+
+    async def acquire(self, route: str) -> _Ticket:
+        """申请准入：有空闲名额时立即放行，否则按优先级排队，无法在SLO内服务时立即拒绝"""
+        ticket = _Ticket(route, self.priority_of(route), next(self._seq))
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._queue:
+                self._admit(ticket)
+                return ticket
+
+            wait = self.projected_wait(ticket.priority)
+            if wait > self.slo_seconds:
+                raise self._shed(route, "slo", wait)
+
+            if len(self._queue) >= self.max_queue:
+                worst = max(self._queue)
+                if worst < ticket:
+                    raise self._shed(route, "queue_full", wait)
+                # 队列已满时挤掉优先级最低的排队请求
+                self._queue.remove(worst)
+                heapq.heapify(self._queue)
+                worst.future.set_exception(self._shed(worst.route, "evicted", self.service_time))
+
+            ticket.future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, ticket)
+
+        try:
+            await ticket.future
+        except BaseException:
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                elif ticket.admitted_at is not None:
+                    # 已获得名额但调用方已取消
+                    self._release_locked(ticket)
+            raise
+        return ticket
+
+    def _admit(self, ticket: _Ticket):
+        ticket.admitted_at = time.perf_counter()
+        self.in_flight += 1
+        waited = (ticket.admitted_at - ticket.enqueued_at) * 1000
+        self._counters["admitted"] += 1
+        self._counters["total_wait_ms"] += waited
+        self._counters["max_wait_ms"] = max(self._counters["max_wait_ms"], waited)
+
+    def release(self, ticket: _Ticket):
+        """释放名额并放行队首请求，同时更新服务时间EWMA"""
+        with self._lock:
+            self._release_locked(ticket)
+
+    def _release_locked(self, ticket: _Ticket):
+        self.in_flight -= 1
+        self._counters["completed"] += 1
+        elapsed = time.perf_counter() - ticket.admitted_at
+        self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+        while self._queue and self.in_flight < self.max_concurrency:
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue
+            self._admit(waiter)
+            waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、排队时间与丢弃统计"""
+        with self._lock:
+            depth: Dict[str, int] = {}
+            for ticket in self._queue:
+                depth[ticket.route] = depth.get(ticket.route, 0) + 1
+            counters = {
+                **self._counters,
+                "shed": dict(self._counters["shed"]),
+                "shed_by_route": dict(self._counters["shed_by_route"])
+            }
+            counters.update({
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._queue),
+                "queue_depth_by_route": depth,
+                "service_time_ewma_ms": self.service_time * 1000
+            })
+        counters["avg_wait_ms"] = counters["total_wait_ms"] / counters["admitted"] if counters["admitted"] else 0.0
+        return counters
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """获取进程内共享的准入控制器"""
+    global _controller
+    if _controller is None:
+        settings = Config.ADMISSION
+        _controller = AdmissionController(
+            max_concurrency=settings.get("max_concurrency", 64),
+            max_queue=settings.get("max_queue", 256),
+            slo_seconds=settings.get("slo_seconds", 10.0),
+            initial_service_time=settings.get("initial_service_time", 5.0),
+            priorities=settings.get("priorities", {}),
+            default_priority=settings.get("default_priority", 5)
+        )
+    return _controller
+
+
+class _AdmittedResponse:
+    """
+    混入类：占用准入名额的流式响应在__call__结束时释放名额，
+    正常结束、客户端断开、发送失败或尚未开始迭代响应体就出错都会释放
+    """
+
+    _admission_release: Callable[[], None]
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._admission_release()
+
+
+@functools.lru_cache(maxsize=None)
+def _admitted_class(response_class: type) -> type:
+    return type(f"Admitted{response_class.__name__}", (_AdmittedResponse, response_class), {})
+
+
+def _release_on_finish(response: StreamingResponse, controller: AdmissionController, ticket: _Ticket):
+    """流式响应结束（或客户端断开）后再释放名额"""
+    response._admission_release = functools.partial(controller.release, ticket)
+    response.__class__ = _admitted_class(type(response))
+
+
+def admission_controlled(route: str, route_of: Optional[Callable[..., str]] = None):
+    """
+    接口装饰器：请求先经过准入控制
+    route_of可根据请求参数决定优先级路由（如按本地意图预测区分分诊/闲聊）
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            if not Config.ADMISSION.get("enabled", True):
+                return await endpoint(*args, **kwargs)
+
+            controller = get_admission_controller()
+            ticket = await controller.acquire(route_of(**kwargs) if route_of else route)
+            release = True
+            try:
+                response = await endpoint(*args, **kwargs)
+                if isinstance(response, StreamingResponse):
+                    _release_on_finish(response, controller, ticket)
+                    release = False
+                return response
+            finally:
+                if release:
+                    controller.release(ticket)
+        return wrapper
+    return decorator
@@ -1,33 +1,162 @@
 """
 医疗智能体类
 """
-from typing import Dict, List, Any, Optional
-from utils import LLMClient, ResponseFormatter
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple, Type
+from utils import LLMClient, ResponseFormatter, estimate_tokens, split_text_chunks
+from hedging import LatencyTracker
+from intent_classifier import get_local_intent_classifier
+from cache import get_response_cache, hash_text
+from semantic_cache import get_semantic_cache
+from image_cache import get_image_cache
 from config import Config
 
 
 class BaseAgent:
-    """智能体基类"""
+    """智能体基类（长生命周期单例，处理过程中不修改实例状态）"""
     
-    def __init__(self, agent_name: str):
-        self.agent_name = agent_name
-        self.llm_client = LLMClient()
-        self.config = Config.AGENTS_CONFIG.get(agent_name, {})
+    agent_type = ""  # 注册名，由register_agent设置
+    result_key = "result"  # 成功响应中结果字段名
+    error_label = "处理"  # 错误信息前缀
+    user_template = "{}"  # 用户消息模板
+    model = Config.TEXT_MODEL
+    temperature = 0.7
+    max_tokens = 2000
+    
+    def __init__(self, agent_name: Optional[str] = None):
+        self.agent_name = agent_name or self.agent_type
+        self.llm_client = LLMClient(self.agent_name)
+        self.config = Config.AGENTS_CONFIG.get(self.agent_name, {})
+        # 系统提示词与消息前缀只构造一次，后续请求直接复用
+        self.system_prompt = self.get_system_prompt()
+        self.prompt_hash = hash_text(self.system_prompt)
+        self.message_prefix: Tuple[Dict[str, str], ...] = (
+            {"role": "system", "content": self.system_prompt},
+        )
+        self.cache = get_response_cache() if self.config.get("cache") else None
+        self.semantic_cache = (
+            get_semantic_cache(f"{self.agent_name}:{self.model}:{self.temperature}")
+            if self.config.get("semantic_cache") else None
+        )
     
     def get_system_prompt(self) -> str:
         """获取系统提示词"""
         return ""
     
+    def build_messages(self, user_input: str, **kwargs) -> List[Dict[str, str]]:
+        """构造对话消息"""
+        return [
+            *self.message_prefix,
+            {"role": "user", "content": self.user_template.format(user_input)}
+        ]
+    
+    def cache_key(self, user_input: str) -> Optional[str]:
+        """响应缓存键，未启用缓存时返回None"""
+        if self.cache is None:
+            return None
+        return self.cache.make_key(
+            user_input, self.agent_name, self.model, self.temperature, self.prompt_hash
+        )
+    
+    async def lookup_cache(self, user_input: str) -> Optional[str]:
+        """依次查询精确缓存与语义缓存（语义缓存的向量编码与相似度检索在线程中执行，不阻塞事件循环）"""
+        cache_key = self.cache_key(user_input)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        if self.semantic_cache is not None:
+            cached = await asyncio.to_thread(self.semantic_cache.get, user_input)
+            if cached is not None:
+                return cached
+        return None
+    
+    async def store_cache(self, user_input: str, response: str):
+        """写入精确缓存与语义缓存（语义缓存在线程中写入）"""
+        cache_key = self.cache_key(user_input)
+        if cache_key is not None:
+            self.cache.set(cache_key, response)
+        if self.semantic_cache is not None:
+            await asyncio.to_thread(self.semantic_cache.set, user_input, response)
+    
+    async def complete(self, user_input: str, **kwargs) -> str:
+        """调用大模型生成回答（命中缓存时直接返回）"""
+        cached = await self.lookup_cache(user_input)
+        if cached is not None:
+            return cached
+        
+        response = await self.llm_client.chat_completion(
+            messages=self.build_messages(user_input, **kwargs),
+            model=self.model,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        
+        await self.store_cache(user_input, response)
+        return response
+    
     async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
         """处理用户输入"""
-        raise NotImplementedError
+        try:
+            response = await self.complete(user_input, **kwargs)
+            
+            return ResponseFormatter.success_response({self.result_key: response})
+            
+        except Exception as e:
+            return ResponseFormatter.error_response(f"{self.error_label}失败: {str(e)}")
+    
+    async def process_stream(self, user_input: str, **kwargs) -> AsyncIterator[str]:
+        """流式处理用户输入，逐段产出增量文本"""
+        try:
+            cached = await self.lookup_cache(user_input)
+            if cached is not None:
+                yield cached
+                return
+            
+            chunks = []
+            async for content in self.llm_client.chat_completion_stream(
+                messages=self.build_messages(user_input, **kwargs),
+                model=self.model,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            ):
+                chunks.append(content)
+                yield content
+            
+            await self.store_cache(user_input, "".join(chunks))
+                
+        except Exception as e:
+            raise Exception(f"{self.error_label}失败: {str(e)}")
+
+
+# 智能体注册表：智能体类型 -> 智能体类
+AGENT_REGISTRY: Dict[str, Type[BaseAgent]] = {}
 
 
+def register_agent(agent_type: str) -> Callable[[Type[BaseAgent]], Type[BaseAgent]]:
+    """注册智能体类（类装饰器）"""
+    def decorator(cls: Type[BaseAgent]) -> Type[BaseAgent]:
+        if agent_type in AGENT_REGISTRY:
+            raise ValueError(f"智能体类型重复注册: {agent_type}")
+        cls.agent_type = agent_type
+        AGENT_REGISTRY[agent_type] = cls
+        return cls
+    return decorator
+
+
+@register_agent("intent_recognition")
 class IntentRecognitionAgent(BaseAgent):
     """意图识别智能体"""
     
+    error_label = "意图识别"
+    temperature = 0.1  # 降低随机性，提高准确性
+    
     def __init__(self):
-        super().__init__("intent_recognition")
+        super().__init__()
+        self.local_classifier = get_local_intent_classifier()
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的医疗意图识别智能体。你的任务是判断用户输入是医疗意图还是非医疗用途。
@@ -66,15 +195,12 @@ class IntentRecognitionAgent(BaseAgent):
     async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
         """处理意图识别"""
         try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": user_input}
-            ]
+            # 本地快速通道：高置信度时直接返回，跳过大模型调用
+            local_intent = self.local_classifier.classify(user_input)
+            if local_intent is not None:
+                return ResponseFormatter.success_response(local_intent)
             
-            response = await self.llm_client.chat_completion(
-                messages=messages,
-                temperature=0.1  # 降低随机性，提高准确性
-            )
+            response = await self.complete(user_input)
             
             # 解析JSON响应
             intent_result = ResponseFormatter.parse_json_response(response)
@@ -85,11 +211,13 @@ class IntentRecognitionAgent(BaseAgent):
             return ResponseFormatter.error_response(f"意图识别失败: {str(e)}")
 
 
+@register_agent("chat")
 class ChatAgent(BaseAgent):
     """闲聊智能体"""
     
-    def __init__(self):
-        super().__init__("chat")
+    result_key = "reply"
+    error_label = "闲聊处理"
+    user_template = "{}"
     
     def get_system_prompt(self) -> str:
         return """你是一个友善的AI助手。用户向你提出非医疗相关的问题，请自然、友好地回复。
@@ -101,28 +229,15 @@ class ChatAgent(BaseAgent):
 4. 回复要简洁明了，避免过长
 
 请直接回复用户，不需要特殊格式。"""
-    
-    async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
-        """处理闲聊"""
-        try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": user_input}
-            ]
-            
-            response = await self.llm_client.chat_completion(messages=messages)
-            
-            return ResponseFormatter.success_response({"reply": response})
-            
-        except Exception as e:
-            return ResponseFormatter.error_response(f"闲聊处理失败: {str(e)}")
 
 
+@register_agent("triage")
 class TriageAgent(BaseAgent):
     """智能分诊智能体"""
     
-    def __init__(self):
-        super().__init__("triage")
+    result_key = "triage_result"
+    error_label = "智能分诊"
+    user_template = "患者病情：{}"
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的智能分诊医生。根据患者描述的症状和病情，为患者推荐最适合的就诊科室。
@@ -144,28 +259,16 @@ class TriageAgent(BaseAgent):
 推荐理由：[简要说明为什么推荐这个科室]
 
 请基于医学专业知识给出准确的分诊建议。"""
-    
-    async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
-        """处理智能分诊"""
-        try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": f"患者病情：{user_input}"}
-            ]
-            
-            response = await self.llm_client.chat_completion(messages=messages)
-            
-            return ResponseFormatter.success_response({"triage_result": response})
-            
-        except Exception as e:
-            return ResponseFormatter.error_response(f"智能分诊失败: {str(e)}")
 
 
+@register_agent("self_diagnosis")
 class SelfDiagnosisAgent(BaseAgent):
     """症状自诊智能体"""
     
-    def __init__(self):
-        super().__init__("self_diagnosis")
+    result_key = "diagnosis_result"
+    error_label = "症状自诊"
+    user_template = "患者症状描述：{}"
+    max_tokens = 3000  # 增加token数量以获得更详细的分析
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的临床医生，擅长根据患者症状进行病情分析和诊断。请遵循医学诊疗规范，模拟医生问诊过程。
@@ -193,31 +296,16 @@ class SelfDiagnosisAgent(BaseAgent):
 [重要注意事项、复诊时间、紧急情况处理等]
 
 重要声明：此分析仅供参考，不能替代专业医生诊断，建议及时就医。"""
-    
-    async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
-        """处理症状自诊"""
-        try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": f"患者症状描述：{user_input}"}
-            ]
-            
-            response = await self.llm_client.chat_completion(
-                messages=messages,
-                max_tokens=3000  # 增加token数量以获得更详细的分析
-            )
-            
-            return ResponseFormatter.success_response({"diagnosis_result": response})
-            
-        except Exception as e:
-            return ResponseFormatter.error_response(f"症状自诊失败: {str(e)}")
 
 
+@register_agent("case_generation")
 class CaseGenerationAgent(BaseAgent):
     """病例生成智能体"""
     
-    def __init__(self):
-        super().__init__("case_generation")
+    result_key = "case_result"
+    error_label = "病例生成"
+    user_template = "患者信息：{}"
+    max_tokens = 3000
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的医疗文档整理专家，擅长将患者的病情描述整理成标准的结构化病历。
@@ -252,31 +340,16 @@ class CaseGenerationAgent(BaseAgent):
 [说明哪些信息已收集，哪些需要进一步补充]
 
 请根据患者提供的信息进行整理，缺失的信息标注为"待补充"。"""
-    
-    async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
-        """处理病例生成"""
-        try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": f"患者信息：{user_input}"}
-            ]
-            
-            response = await self.llm_client.chat_completion(
-                messages=messages,
-                max_tokens=3000
-            )
-            
-            return ResponseFormatter.success_response({"case_result": response})
-            
-        except Exception as e:
-            return ResponseFormatter.error_response(f"病例生成失败: {str(e)}")
 
 
+@register_agent("report_interpretation")
 class ReportInterpretationAgent(BaseAgent):
     """报告解读智能体"""
     
-    def __init__(self):
-        super().__init__("report_interpretation")
+    result_key = "interpretation_result"
+    error_label = "报告解读"
+    user_template = "请解读以下医学报告：\n\n{}"
+    max_tokens = 3000
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的医学报告解读专家，能够为医生和患者提供检查检验报告的专业解读。
@@ -305,30 +378,238 @@ class ReportInterpretationAgent(BaseAgent):
 
 请用专业但易懂的语言进行解读。"""
     
-    async def process(self, report_text: str, **kwargs) -> Dict[str, Any]:
-        """处理报告解读"""
+    chunk_system_prompt = """你是一个专业的医学报告解读专家。你将收到一份长篇医学报告中的一个片段，请只提取该片段中的关键信息，供后续汇总解读使用。
+
+提取要求：
+1. 报告类型、检查项目与检查目的（如片段中出现）
+2. 所有异常指标：名称、结果、参考范围、偏高/偏低
+3. 重要的正常指标
+4. 影像/病理等描述性结论
+
+输出要求：
+- 简洁罗列，不做展开解释，不输出健康建议
+- 片段中没有的信息不要编造"""
+    
+    chunk_template = "报告片段（{label}）：\n\n{chunk}"
+    reduce_template = "以下是一份长篇医学报告按分段提取的要点，请整合后按要求的输出格式进行完整解读：\n\n{notes}"
+    truncation_note = "\n\n注意：报告篇幅超过分段解读上限，末尾部分内容未能纳入以上要点，请在解读开头提醒用户核对原报告的后续内容。"
+    
+    def __init__(self):
+        super().__init__()
+        self.chunking = Config.REPORT_CHUNKING
+        self.chunk_prefix: Tuple[Dict[str, str], ...] = (
+            {"role": "system", "content": self.chunk_system_prompt},
+        )
+    
+    def split_report(self, report_text: str) -> Tuple[Optional[List[str]], bool]:
+        """报告超过分段阈值时返回(分段列表, 是否截断)，否则分段列表为None（单次解读）"""
+        if not self.chunking.get("enabled") or estimate_tokens(report_text) <= self.chunking.get("min_tokens", 6000):
+            return None, False
+        chunks, truncated = split_text_chunks(
+            report_text,
+            self.chunking.get("chunk_tokens", 3000),
+            self.chunking.get("max_chunks", 16),
+            self.chunking.get("max_chunk_tokens", 12000)
+        )
+        if truncated:
+            _record_truncation()
+        return (chunks, truncated) if len(chunks) > 1 else (None, False)
+    
+    async def extract_chunk(self, label: str, chunk: str, semaphore: asyncio.Semaphore) -> str:
+        """提取单个分段的要点"""
+        async with semaphore:
+            return await self.llm_client.chat_completion(
+                messages=[
+                    *self.chunk_prefix,
+                    {"role": "user", "content": self.chunk_template.format(label=label, chunk=chunk)}
+                ],
+                model=self.model,
+                temperature=self.temperature,
+                max_tokens=self.chunking.get("map_max_tokens", 1000)
+            )
+    
+    async def map_chunks(self, chunks: List[str]) -> List[str]:
+        """并发提取各分段要点（单个报告内的并发受max_concurrency限制）"""
+        semaphore = asyncio.Semaphore(self.chunking.get("max_concurrency", 4))
+        return await asyncio.gather(*(
+            self.extract_chunk(f"第{i}/{len(chunks)}段", chunk, semaphore) for i, chunk in enumerate(chunks, 1)
+        ))
+    
+    async def map_pages(self, pages: AsyncIterator[str]) -> Tuple[str, Optional[List[str]], bool]:
+        """
+        边解析边解读：累计文本超过分段阈值后，每凑满一段立即提交要点提取，不必等待整份文档解析完成
+        返回(完整报告文本, 各分段要点, 是否截断)；报告未超过阈值时要点为None（由调用方单次解读）
+        达到分段上限后剩余内容并入最后一段，最后一段超过max_chunk_tokens的部分不再解读（记为截断）
+        """
+        chunk_tokens = self.chunking.get("chunk_tokens", 3000)
+        max_chunks = self.chunking.get("max_chunks", 16)
+        max_chunk_tokens = max(chunk_tokens, self.chunking.get("max_chunk_tokens", 12000))
+        truncated = False
+        semaphore = asyncio.Semaphore(self.chunking.get("max_concurrency", 4))
+        tasks: List[asyncio.Task] = []
+        received: List[str] = []
+        pending = ""
+        
+        def submit(chunk: str):
+            tasks.append(asyncio.create_task(self.extract_chunk(f"第{len(tasks) + 1}段", chunk, semaphore)))
+        
         try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": f"请解读以下医学报告：\n\n{report_text}"}
-            ]
+            async for page in pages:
+                received.append(page)
+                pending = f"{pending}\n{page}" if pending else page
+                chunking = tasks or (
+                    self.chunking.get("enabled")
+                    and estimate_tokens("\n".join(received)) > self.chunking.get("min_tokens", 6000)
+                )
+                # 保留最后一段继续累积；达到分段上限后剩余内容并入最后一段（不超过max_chunk_tokens）
+                if chunking and len(tasks) < max_chunks - 1 and estimate_tokens(pending) > chunk_tokens:
+                    chunks, _ = split_text_chunks(pending, chunk_tokens)
+                    ready = min(len(chunks) - 1, max_chunks - 1 - len(tasks))
+                    for chunk in chunks[:ready]:
+                        submit(chunk)
+                    pending = "\n".join(chunks[ready:])
+                elif tasks and len(tasks) >= max_chunks - 1 and estimate_tokens(pending) > max_chunk_tokens:
+                    pending = split_text_chunks(pending, max_chunk_tokens)[0][0]
+                    truncated = True
             
-            response = await self.llm_client.chat_completion(
-                messages=messages,
-                max_tokens=3000
-            )
+            report_text = "\n".join(received)
+            if not tasks:
+                return report_text, None, False
+            # 单个超大页面（如文档缓存命中时整份报告作为一页产出）也不超过max_chunk_tokens
+            if estimate_tokens(pending) > max_chunk_tokens:
+                pending = split_text_chunks(pending, max_chunk_tokens)[0][0]
+                truncated = True
+            if pending.strip():
+                submit(pending)
+            if truncated:
+                _record_truncation()
+            return report_text, list(await asyncio.gather(*tasks)), truncated
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def build_reduce_messages(self, notes: List[str], truncated: bool = False) -> List[Dict[str, str]]:
+        """汇总消息：沿用原系统提示词，保证输出为【报告概述】/【异常指标分析】…结构；截断时提示模型告知用户"""
+        merged = "\n\n".join(f"【第{i}段要点】\n{note}" for i, note in enumerate(notes, 1))
+        content = self.reduce_template.format(notes=merged) + (self.truncation_note if truncated else "")
+        return [
+            *self.message_prefix,
+            {"role": "user", "content": content}
+        ]
+    
+    async def reduce_notes(self, notes: List[str], truncated: bool = False) -> str:
+        """汇总各分段要点，生成完整解读"""
+        return await self.llm_client.chat_completion(
+            messages=self.build_reduce_messages(notes, truncated),
+            model=self.model,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+    
+    def stream_reduce_notes(self, notes: List[str], truncated: bool = False) -> AsyncIterator[str]:
+        """流式汇总各分段要点"""
+        return self.llm_client.chat_completion_stream(
+            messages=self.build_reduce_messages(notes, truncated),
+            model=self.model,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+    
+    async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
+        """解读报告：长报告走分段并发提取 + 汇总，短报告单次解读"""
+        start = time.perf_counter()
+        try:
+            chunks, truncated = self.split_report(user_input)
+            if chunks is None:
+                response = await self.complete(user_input)
+            else:
+                response = await self.reduce_notes(await self.map_chunks(chunks), truncated)
+            
+            _report_latency["chunked" if chunks else "single"].record(time.perf_counter() - start)
+            return ResponseFormatter.success_response({self.result_key: response})
             
-            return ResponseFormatter.success_response({"interpretation_result": response})
+        except Exception as e:
+            return ResponseFormatter.error_response(f"{self.error_label}失败: {str(e)}")
+    
+    async def process_stream(self, user_input: str, **kwargs) -> AsyncIterator[str]:
+        """流式解读：长报告先并发提取分段要点，再流式输出汇总解读"""
+        chunks, truncated = self.split_report(user_input)
+        if chunks is None:
+            async for content in super().process_stream(user_input, **kwargs):
+                yield content
+            return
+        
+        try:
+            async for content in self.stream_reduce_notes(await self.map_chunks(chunks), truncated):
+                yield content
+        except Exception as e:
+            raise Exception(f"{self.error_label}失败: {str(e)}")
+    
+    async def process_pages(self, pages: AsyncIterator[str]) -> Dict[str, Any]:
+        """解读逐页到达的报告（PDF边解析边解读）"""
+        start = time.perf_counter()
+        try:
+            report_text, notes, truncated = await self.map_pages(pages)
+            if notes is None:
+                response = await self.complete(report_text)
+            else:
+                response = await self.reduce_notes(notes, truncated)
+            
+            _report_latency["chunked" if notes else "single"].record(time.perf_counter() - start)
+            return ResponseFormatter.success_response({self.result_key: response})
             
         except Exception as e:
-            return ResponseFormatter.error_response(f"报告解读失败: {str(e)}")
+            return ResponseFormatter.error_response(f"{self.error_label}失败: {str(e)}")
+    
+    async def process_pages_stream(self, pages: AsyncIterator[str], **kwargs) -> AsyncIterator[str]:
+        """流式解读逐页到达的报告"""
+        try:
+            report_text, notes, truncated = await self.map_pages(pages)
+        except Exception as e:
+            raise Exception(f"{self.error_label}失败: {str(e)}")
+        if notes is None:
+            async for content in super().process_stream(report_text, **kwargs):
+                yield content
+            return
+        
+        try:
+            async for content in self.stream_reduce_notes(notes, truncated):
+                yield content
+        except Exception as e:
+            raise Exception(f"{self.error_label}失败: {str(e)}")
+
+
+# 报告解读耗时（单次解读 / 分段解读），用于对比两种模式的延迟
+_report_latency: Dict[str, LatencyTracker] = {"single": LatencyTracker(), "chunked": LatencyTracker()}
+# 超过分段上限、末尾内容未被解读的报告数
+_report_truncations = {"count": 0}
+_report_truncations_lock = threading.Lock()
 
 
+def _record_truncation():
+    with _report_truncations_lock:
+        _report_truncations["count"] += 1
+
+
+def report_pipeline_stats() -> Dict[str, Any]:
+    """报告解读各模式的请求数与延迟分位数（毫秒），以及被截断的报告数"""
+    stats = {"truncated": _report_truncations["count"]}
+    for mode, tracker in _report_latency.items():
+        stats[mode] = {"requests": len(tracker)}
+        for q in (50, 95):
+            value = tracker.percentile(q)
+            stats[mode][f"p{q}_ms"] = value * 1000 if value is not None else None
+    return stats
+
+
+@register_agent("health_education")
 class HealthEducationAgent(BaseAgent):
     """健康科普智能体"""
     
-    def __init__(self):
-        super().__init__("health_education")
+    result_key = "education_result"
+    error_label = "健康科普"
+    user_template = "请科普以下健康问题：{}"
+    max_tokens = 3000
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的医学科普专家，基于权威医学知识为患者提供准确、易懂的健康科普信息。
@@ -363,31 +644,20 @@ class HealthEducationAgent(BaseAgent):
 [重要提醒事项]
 
 请确保信息的科学性和准确性。"""
-    
-    async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
-        """处理健康科普"""
-        try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": f"请科普以下健康问题：{user_input}"}
-            ]
-            
-            response = await self.llm_client.chat_completion(
-                messages=messages,
-                max_tokens=3000
-            )
-            
-            return ResponseFormatter.success_response({"education_result": response})
-            
-        except Exception as e:
-            return ResponseFormatter.error_response(f"健康科普失败: {str(e)}")
 
 
+@register_agent("dermatology")
 class DermatologyAgent(BaseAgent):
     """皮肤病咨询智能体"""
     
+    result_key = "dermatology_result"
+    error_label = "皮肤病咨询"
+    model = Config.VISION_MODEL
+    max_tokens = 3000
+    
     def __init__(self):
-        super().__init__("dermatology")
+        super().__init__()
+        self.image_cache = get_image_cache() if self.config.get("image_cache") else None
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的皮肤科医生，擅长通过图片分析皮肤病变。请结合图片和患者描述的症状进行分析。
@@ -417,28 +687,58 @@ class DermatologyAgent(BaseAgent):
 
 重要声明：皮肤病诊断需要专业医生面诊确认，此分析仅供参考。"""
     
-    async def process(self, image_data: str, symptoms: str = "", **kwargs) -> Dict[str, Any]:
-        """处理皮肤病咨询"""
+    def build_prompt(self, symptoms: str = "") -> str:
+        """构造图文提示词"""
+        return f"{self.system_prompt}\n\n患者症状描述：{symptoms}"
+    
+    async def process(
+        self, image_data: str, symptoms: str = "", image_hash: Optional[int] = None, **kwargs
+    ) -> Dict[str, Any]:
+        """处理皮肤病咨询（提供图片感知哈希时，近似图片 + 相同症状直接复用缓存回答）"""
         try:
-            prompt = f"{self.get_system_prompt()}\n\n患者症状描述：{symptoms}"
+            use_cache = self.image_cache is not None and image_hash is not None
+            if use_cache:
+                cached = self.image_cache.get(image_hash, symptoms)
+                if cached is not None:
+                    return ResponseFormatter.success_response({self.result_key: cached})
             
             response = await self.llm_client.vision_completion(
-                text_prompt=prompt,
+                text_prompt=self.build_prompt(symptoms),
                 image_data=image_data,
-                max_tokens=3000
+                model=self.model,
+                max_tokens=self.max_tokens
             )
             
-            return ResponseFormatter.success_response({"dermatology_result": response})
+            if use_cache:
+                self.image_cache.set(image_hash, symptoms, response)
+            return ResponseFormatter.success_response({self.result_key: response})
             
         except Exception as e:
-            return ResponseFormatter.error_response(f"皮肤病咨询失败: {str(e)}")
+            return ResponseFormatter.error_response(f"{self.error_label}失败: {str(e)}")
+    
+    async def process_stream(self, image_data: str, symptoms: str = "", **kwargs) -> AsyncIterator[str]:
+        """流式处理皮肤病咨询"""
+        try:
+            async for content in self.llm_client.vision_completion_stream(
+                text_prompt=self.build_prompt(symptoms),
+                image_data=image_data,
+                model=self.model,
+                max_tokens=self.max_tokens
+            ):
+                yield content
+                
+        except Exception as e:
+            raise Exception(f"{self.error_label}失败: {str(e)}")
 
 
+@register_agent("medication")
 class MedicationAgent(BaseAgent):
     """药物咨询智能体"""
     
-    def __init__(self):
-        super().__init__("medication")
+    result_key = "medication_result"
+    error_label = "药物咨询"
+    user_template = "药物咨询问题：{}"
+    max_tokens = 3000
     
     def get_system_prompt(self) -> str:
         return """你是一个专业的药师，基于药品说明书为患者提供准确的用药指导。
@@ -475,46 +775,32 @@ class MedicationAgent(BaseAgent):
 [特殊人群用药注意事项]
 
 请确保用药指导的安全性和准确性。"""
-    
-    async def process(self, user_input: str, **kwargs) -> Dict[str, Any]:
-        """处理药物咨询"""
-        try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": f"药物咨询问题：{user_input}"}
-            ]
-            
-            response = await self.llm_client.chat_completion(
-                messages=messages,
-                max_tokens=3000
-            )
-            
-            return ResponseFormatter.success_response({"medication_result": response})
-            
-        except Exception as e:
-            return ResponseFormatter.error_response(f"药物咨询失败: {str(e)}")
 
 
 # 智能体工厂
 class AgentFactory:
-    """智能体工厂类"""
-    
-    @staticmethod
-    def create_agent(agent_type: str) -> BaseAgent:
-        """创建智能体实例"""
-        agents = {
-            "intent_recognition": IntentRecognitionAgent,
-            "chat": ChatAgent,
-            "triage": TriageAgent,
-            "self_diagnosis": SelfDiagnosisAgent,
-            "case_generation": CaseGenerationAgent,
-            "report_interpretation": ReportInterpretationAgent,
-            "health_education": HealthEducationAgent,
-            "dermatology": DermatologyAgent,
-            "medication": MedicationAgent
-        }
+    """智能体工厂类：按类型提供长生命周期的智能体单例"""
+    
+    _instances: Dict[str, BaseAgent] = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def initialize(cls):
+        """启动时创建全部已注册的智能体"""
+        for agent_type in AGENT_REGISTRY:
+            cls.create_agent(agent_type)
+    
+    @classmethod
+    def create_agent(cls, agent_type: str) -> BaseAgent:
+        """获取智能体实例（首次获取时创建，之后复用同一实例）"""
+        agent = cls._instances.get(agent_type)
+        if agent is not None:
+            return agent
         
-        if agent_type not in agents:
+        if agent_type not in AGENT_REGISTRY:
             raise ValueError(f"未知的智能体类型: {agent_type}")
         
-        return agents[agent_type]()
+        with cls._lock:
+            if agent_type not in cls._instances:
+                cls._instances[agent_type] = AGENT_REGISTRY[agent_type]()
+            return cls._instances[agent_type]
@@ -0,0 +1,51 @@
+"""
+压测用应用启动器：把上游指向本地模拟服务后启动main.app（由load_bench.py以子进程方式启动）
+
+默认关闭响应/语义/图片/文档缓存，使每个请求都走完整的处理链路；--keep-caches保留生产配置。
+
+用法：
+    python benchmarks/bench_app.py --port 8100 --upstream http://127.0.0.1:8101
+"""
+import argparse
+import os
+import sys
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+
+def apply_overrides(args: argparse.Namespace):
+    Config.DASHSCOPE_BASE_URL = args.upstream
+    Config.DASHSCOPE_API_KEY = Config.DASHSCOPE_API_KEY or "mock"
+    if not args.keep_caches:
+        for settings in Config.AGENTS_CONFIG.values():
+            for flag in ("cache", "semantic_cache", "image_cache"):
+                if flag in settings:
+                    settings[flag] = False
+        Config.DOCUMENT_CACHE["enabled"] = False
+    if args.no_rate_limit:
+        Config.RATE_LIMIT["enabled"] = False
+    if args.executor:
+        Config.FILE_PROCESSING["executor"] = args.executor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以模拟上游启动医疗智能体服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--upstream", default="http://127.0.0.1:8101", help="模拟百炼服务地址")
+    parser.add_argument("--keep-caches", action="store_true", help="保留缓存配置（默认全部关闭）")
+    parser.add_argument("--no-rate-limit", action="store_true", help="关闭客户端限流")
+    parser.add_argument("--executor", choices=["process", "thread"], default=None, help="文件处理执行器模式")
+    args = parser.parse_args()
+    apply_overrides(args)
+
+    import main as app_module
+    uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
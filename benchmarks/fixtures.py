@@ -0,0 +1,91 @@
+"""
+压测样例文件：在内存中生成PDF/DOCX/JPEG报告与皮肤图片，不依赖仓库中的二进制文件
+variant参数用于生成内容不同的副本（避免被文档缓存、图片缓存或相同请求合并命中）
+"""
+import io
+import random
+from typing import List, Optional
+
+import docx
+from PIL import Image, ImageDraw, ImageFilter
+
+
+def report_lines(page: int, rows: int = 40, variant: int = 0) -> List[str]:
+    """一页化验报告（ASCII，便于写入无需嵌入字体的PDF）"""
+    lines = [f"Lab report #{variant} page {page}  item  result  reference  unit"]
+    for item in range(rows):
+        value = 4.5 + (item * 7 + page + variant) % 9 * 0.3
+        flag = " H" if value > 6.5 else ""
+        lines.append(f"ITEM-{page}-{item}  {value:.1f}{flag}  3.5-6.5  mmol/L")
+    return lines
+
+
+def make_pdf(pages: int = 6, image_every: int = 3, variant: int = 0) -> bytes:
+    """生成多页PDF：每image_every页中有一页是没有文本层的纯图片页（模拟扫描件）"""
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = font + 2 * pages + 1
+    kids = []
+    for page in range(1, pages + 1):
+        if image_every and page % image_every == 0:
+            content = b"q 500 0 0 700 40 60 cm 0.6 g 0 0 1 1 re f Q"
+            resources = b"<< >>"
+        else:
+            content = b"\n".join(
+                b"BT /F1 10 Tf 40 %d Td (%s) Tj ET" % (800 - 14 * i, line.encode("ascii"))
+                for i, line in enumerate(report_lines(page, variant=variant)[:55])
+            )
+            resources = b"<< /Font << /F1 %d 0 R >> >>" % font
+        stream = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Resources %s /Contents %d 0 R >>"
+            % (pages_id, resources, stream)
+        ))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def make_docx(pages: int = 3, variant: int = 0) -> bytes:
+    """生成Word格式化验报告"""
+    document = docx.Document()
+    document.add_heading(f"血常规检验报告 #{variant}", level=1)
+    for page in range(1, pages + 1):
+        for line in report_lines(page, variant=variant):
+            document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_jpeg(size=(3000, 4000), variant: int = 0, quality: int = 92, seed: Optional[int] = None) -> bytes:
+    """生成手机拍摄尺寸的皮肤照片（肤色背景 + 随机皮损 + 噪声）"""
+    rng = random.Random(variant if seed is None else seed)
+    small = (size[0] // 8, size[1] // 8)
+    image = Image.new("RGB", small, (224 - rng.randint(0, 30), 172 - rng.randint(0, 30), 140))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(3, 8)):
+        x, y = rng.randint(0, small[0]), rng.randint(0, small[1])
+        r = rng.randint(small[0] // 30, small[0] // 8)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(180 + rng.randint(0, 40), 70, 70))
+    image = image.filter(ImageFilter.GaussianBlur(3)).resize(size, Image.Resampling.BILINEAR)
+    noise = Image.effect_noise(size, 12).convert("RGB")
+    image = Image.blend(image, noise, 0.08)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,357 @@
+"""
+离线压测：本地模拟百炼服务 + 以子进程启动的应用，逐个接口施加并发负载
+
+每个场景输出：请求数、失败数、吞吐（请求/秒）、延迟p50/p95/p99、首字节时间（TTFB）p50/p95、
+应用进程（含文件处理子进程）峰值RSS，以及场景期间的上游请求数与注入的错误数。
+结果可保存为JSON，并与基线对比发现LLMClient / FileProcessor / FastAPI层的性能回退。
+
+用法：
+    python benchmarks/load_bench.py
+    python benchmarks/load_bench.py --scenarios medical_chat report_pdf --concurrency 16 --requests 200
+    python benchmarks/load_bench.py --mock-ttft 0.8 --mock-error-429 0.05 --mock-time-scale 0.2
+    python benchmarks/load_bench.py --output bench.json
+    python benchmarks/load_bench.py --baseline bench.json --tolerance 0.2   # 退化超过20%时退出码为1
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import fixtures  # noqa: E402
+import mock_dashscope  # noqa: E402
+
+CHAT_MESSAGES = [
+    "我头痛发热三天了，应该挂什么科？",
+    "最近总是胃疼，饭后更明显，可能是什么问题？",
+    "帮我整理一下病历：咳嗽一周，有痰，无发热",
+    "今天天气怎么样？"
+]
+
+
+class FixturePool:
+    """按需生成并缓存样例文件的若干副本，轮流使用"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._files: Dict[str, List[bytes]] = {}
+        self._builders: Dict[str, Callable[[int], bytes]] = {
+            "pdf": lambda variant: fixtures.make_pdf(pages=12, variant=variant),
+            "docx": lambda variant: fixtures.make_docx(pages=4, variant=variant),
+            "jpeg": lambda variant: fixtures.make_jpeg(variant=variant)
+        }
+
+    def get(self, kind: str, index: int) -> bytes:
+        files = self._files.setdefault(kind, [])
+        variant = index % self.size
+        while len(files) <= variant:
+            files.append(self._builders[kind](len(files)))
+        return files[variant]
+
+
+def text_request(field: str):
+    def build(index: int, pool: FixturePool) -> Dict[str, Any]:
+        return {"json": {field: f"{CHAT_MESSAGES[index % len(CHAT_MESSAGES)]}（#{index}）"}}
+    return build
+
+
+def upload_request(kind: str, filename: str, data: Optional[Dict[str, str]] = None):
+    def build(index: int, pool: FixturePool) -> Dict[str, Any]:
+        request = {"files": {"file": (filename, pool.get(kind, index))}}
+        if data:
+            request["data"] = data
+        return request
+    return build
+
+
+# 场景名 -> (接口路径, 是否SSE, 请求构造函数)
+SCENARIOS: Dict[str, Any] = {
+    "medical_chat": ("/api/medical-chat", False, text_request("message")),
+    "medical_chat_stream": ("/api/medical-chat/stream", True, text_request("message")),
+    "health_education": ("/api/health-education", False, text_request("question")),
+    "health_education_stream": ("/api/health-education/stream", True, text_request("question")),
+    "medication": ("/api/medication-consultation", False, text_request("question")),
+    "medication_stream": ("/api/medication-consultation/stream", True, text_request("question")),
+    "report_pdf": ("/api/report-interpretation", False, upload_request("pdf", "report.pdf")),
+    "report_pdf_stream": ("/api/report-interpretation/stream", True, upload_request("pdf", "report.pdf")),
+    "report_docx": ("/api/report-interpretation", False, upload_request("docx", "report.docx")),
+    "dermatology_jpeg": ("/api/dermatology-consultation", False,
+                         upload_request("jpeg", "skin.jpg", {"symptoms": "手臂红疹伴瘙痒一周"}))
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """进程及其子进程（文件处理进程池）的RSS之和（MB，仅Linux）"""
+    try:
+        total = 0
+        pids = [pid]
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+        for item in pids:
+            try:
+                with open(f"/proc/{item}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1])
+            except FileNotFoundError:
+                continue
+        return total / 1024
+    except (FileNotFoundError, PermissionError):
+        return None
+
+
+def wait_ready(url: str, process: Optional[subprocess.Popen], timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"服务启动失败：{url}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"等待服务就绪超时：{url}")
+
+
+async def send(client: httpx.AsyncClient, path: str, stream: bool, request: Dict[str, Any]) -> Dict[str, Any]:
+    """发送单个请求，记录延迟、首字节时间与是否成功（HTTP 200且响应中success为真 / SSE以done结束）"""
+    start = time.perf_counter()
+    ttfb = None
+    body = bytearray()
+    try:
+        async with client.stream("POST", path, **request) as response:
+            async for chunk in response.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                body += chunk
+            status = response.status_code
+    except httpx.HTTPError as e:
+        return {"ok": False, "status": type(e).__name__, "latency": time.perf_counter() - start, "ttfb": None}
+
+    latency = time.perf_counter() - start
+    if status != 200:
+        ok = False
+    elif stream:
+        ok = b"event: done" in body and b"event: error" not in body
+    else:
+        try:
+            ok = bool(json.loads(body).get("success"))
+        except ValueError:
+            ok = False
+    return {"ok": ok, "status": status, "latency": latency, "ttfb": ttfb}
+
+
+async def run_scenario(name: str, args: argparse.Namespace, pool: FixturePool, app_pid: Optional[int]) -> Dict[str, Any]:
+    path, stream, build = SCENARIOS[name]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.app_url, limits=limits, timeout=timeout) as client, \
+            httpx.AsyncClient(base_url=args.upstream_url, timeout=5.0) as upstream:
+        # 预热（不计入结果），同时生成样例文件
+        for index in range(args.warmup):
+            await send(client, path, stream, build(-1 - index, pool))
+        for index in range(min(args.requests, pool.size)):
+            build(index, pool)
+
+        upstream_before = (await upstream.get("/stats")).json()
+        samples: List[Dict[str, Any]] = []
+        next_index = 0
+        peak_rss = [process_rss_mb(app_pid) if app_pid else None]
+        done = asyncio.Event()
+
+        async def worker():
+            nonlocal next_index
+            while next_index < args.requests:
+                index = next_index
+                next_index += 1
+                samples.append(await send(client, path, stream, build(index, pool)))
+
+        async def sample_rss():
+            while not done.is_set():
+                rss = process_rss_mb(app_pid)
+                if rss is not None:
+                    peak_rss[0] = max(peak_rss[0] or 0.0, rss)
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample_rss()) if app_pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        if sampler is not None:
+            await sampler
+        upstream_after = (await upstream.get("/stats")).json()
+
+    latencies = [s["latency"] * 1000 for s in samples if s["ok"]]
+    ttfbs = [s["ttfb"] * 1000 for s in samples if s["ok"] and s["ttfb"] is not None]
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if not sample["ok"]:
+            errors[str(sample["status"])] = errors.get(str(sample["status"]), 0) + 1
+    return {
+        "scenario": name,
+        "requests": len(samples),
+        "failed": len(samples) - len(latencies),
+        "errors": errors,
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "ttfb_p50_ms": percentile(ttfbs, 50),
+        "ttfb_p95_ms": percentile(ttfbs, 95),
+        "peak_rss_mb": peak_rss[0],
+        "upstream_requests": upstream_after["requests"] - upstream_before["requests"],
+        "upstream_injected_errors": (upstream_after["injected_429"] + upstream_after["injected_5xx"]
+                                     - upstream_before["injected_429"] - upstream_before["injected_5xx"])
+    }
+
+
+def fmt(value: Optional[float], digits: int = 0) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_results(results: List[Dict[str, Any]]):
+    header = (f"{'scenario':<24}{'req':>6}{'fail':>6}{'rps':>8}{'p50':>8}{'p95':>8}{'p99':>8}"
+              f"{'ttfb50':>8}{'ttfb95':>8}{'rss_mb':>8}{'upstr':>7}{'inj':>5}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<24}{r['requests']:>6}{r['failed']:>6}{fmt(r['throughput_rps'], 1):>8}"
+              f"{fmt(r['p50_ms']):>8}{fmt(r['p95_ms']):>8}{fmt(r['p99_ms']):>8}"
+              f"{fmt(r['ttfb_p50_ms']):>8}{fmt(r['ttfb_p95_ms']):>8}{fmt(r['peak_rss_mb'], 1):>8}"
+              f"{r['upstream_requests']:>7}{r['upstream_injected_errors']:>5}")
+        if r["errors"]:
+            print(f"{'':<24}errors: {r['errors']}")
+
+
+def compare_baseline(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """与基线对比：p95延迟、TTFB p95升高或吞吐下降超过tolerance视为退化"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["scenario"])
+        if base is None:
+            continue
+        for metric in ("p95_ms", "ttfb_p95_ms"):
+            if r[metric] and base[metric] and r[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{r['scenario']}: {metric} {base[metric]:.0f} -> {r[metric]:.0f}")
+        if base["throughput_rps"] and r["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{r['scenario']}: throughput_rps {base['throughput_rps']:.1f} -> {r['throughput_rps']:.1f}"
+            )
+        if r["failed"] > base["failed"]:
+            regressions.append(f"{r['scenario']}: failed {base['failed']} -> {r['failed']}")
+    return regressions
+
+
+def start_services(args: argparse.Namespace) -> List[subprocess.Popen]:
+    """按需启动模拟上游与应用子进程"""
+    processes = []
+    if not args.upstream_url:
+        port = free_port()
+        args.upstream_url = f"http://127.0.0.1:{port}"
+        command = [sys.executable, os.path.join(BENCH_DIR, "mock_dashscope.py"), "--port", str(port)]
+        if args.seed is not None:
+            command += ["--seed", str(args.seed)]
+        for name, value in mock_dashscope.settings_from_args(args, "mock-").items():
+            command += [f"--{name.replace('_', '-')}", str(value)]
+        processes.append(subprocess.Popen(command))
+        wait_ready(f"{args.upstream_url}/health", processes[-1])
+
+    args.app_pid = None
+    if not args.app_url:
+        port = free_port()
+        args.app_url = f"http://127.0.0.1:{port}"
+        command = [sys.executable, os.path.join(BENCH_DIR, "bench_app.py"),
+                   "--port", str(port), "--upstream", args.upstream_url]
+        if args.keep_caches:
+            command.append("--keep-caches")
+        if args.no_rate_limit:
+            command.append("--no-rate-limit")
+        if args.executor:
+            command += ["--executor", args.executor]
+        # 应用以仓库根目录为工作目录（缓存等相对路径与正常启动一致）
+        processes.append(subprocess.Popen(command, cwd=os.path.dirname(BENCH_DIR)))
+        args.app_pid = processes[-1].pid
+        wait_ready(f"{args.app_url}/api/health", processes[-1])
+    return processes
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    pool = FixturePool(max(args.concurrency * 2, 8))
+    results = []
+    for name in args.scenarios:
+        result = await run_scenario(name, args, pool, args.app_pid)
+        results.append(result)
+        print(f"[{name}] done: {result['requests']} requests, {result['failed']} failed", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="医疗智能体离线压测")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=2, help="每个场景的预热请求数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时（秒）")
+    parser.add_argument("--app-url", default="", help="压测已运行的应用（不启动子进程，不统计RSS）")
+    parser.add_argument("--upstream-url", default="", help="使用已运行的模拟上游")
+    parser.add_argument("--keep-caches", action="store_true", help="保留应用缓存（默认关闭以测量完整链路）")
+    parser.add_argument("--no-rate-limit", action="store_true", help="关闭应用的客户端限流")
+    parser.add_argument("--executor", choices=["process", "thread"], default=None, help="文件处理执行器模式")
+    parser.add_argument("--seed", type=int, default=None, help="模拟上游随机种子")
+    parser.add_argument("--output", default="", help="结果保存为JSON")
+    parser.add_argument("--baseline", default="", help="与之前保存的JSON结果对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例")
+    mock_dashscope.add_arguments(parser, "mock-")
+    args = parser.parse_args()
+
+    processes = start_services(args)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, "results": results}, f,
+                      ensure_ascii=False, indent=2)
+    if args.baseline:
+        regressions = compare_baseline(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+本地模拟百炼（OpenAI兼容）服务：POST /chat/completions，支持流式输出与429/5xx故障注入
+
+延迟模型：首token延迟服从对数正态分布（中位数ttft、离散度ttft_sigma），之后按token_rate逐token生成；
+输出token数在output_tokens附近随机，并受请求的max_tokens限制。
+意图识别请求（系统提示词包含"意图识别"）返回合法的意图JSON，其余请求返回占位文本。
+
+用法：
+    python benchmarks/mock_dashscope.py --port 8101
+    python benchmarks/mock_dashscope.py --port 8101 --ttft 0.8 --token-rate 30 --error-429 0.05 --error-5xx 0.02
+    GET /stats 查看请求数与注入的错误数
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import zlib
+from typing import Any, Dict, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+INTENT_RESPONSES = [
+    '{"医疗意图": "智能分诊智能体"}',
+    '{"医疗意图": "症状自诊智能体"}',
+    '{"医疗意图": "病例生成智能体"}',
+    '{"非医疗意图": ""}'
+]
+FILLER = "根据您描述的情况，建议注意休息、多饮水，如症状持续或加重请及时就医。"
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    "ttft": 0.5,  # 首token延迟中位数（秒）
+    "ttft_sigma": 0.3,  # 对数正态分布的sigma，越大长尾越明显
+    "token_rate": 40.0,  # 每秒生成token数
+    "output_tokens": 300,  # 平均输出token数
+    "chunk_tokens": 4,  # 流式输出每个分段的token数
+    "error_429": 0.0,  # 返回429的概率
+    "error_5xx": 0.0,  # 返回500/503的概率
+    "retry_after": 1,  # 429响应的Retry-After（秒）
+    "time_scale": 1.0  # 所有延迟乘以该系数（<1加速）
+}
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """粗略估算提示词token数（图片按固定1000 token计）"""
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content)
+        else:
+            for part in content or []:
+                tokens += len(part.get("text", "")) if part.get("type") == "text" else 1000
+    return tokens
+
+
+def create_app(settings: Dict[str, Any]) -> FastAPI:
+    app = FastAPI(title="Mock DashScope")
+    counters = {"requests": 0, "stream_requests": 0, "injected_429": 0, "injected_5xx": 0,
+                "prompt_tokens": 0, "completion_tokens": 0}
+    started_at = time.time()
+
+    def scaled(seconds: float) -> float:
+        return seconds * settings["time_scale"]
+
+    def sample_ttft() -> float:
+        return settings["ttft"] * math.exp(random.gauss(0.0, settings["ttft_sigma"]))
+
+    def build_reply(body: Dict[str, Any]) -> Tuple[str, str]:
+        """返回(回答, finish_reason)：超过请求的max_tokens时截断并返回length"""
+        messages = body.get("messages", [])
+        system = messages[0].get("content") if messages and messages[0].get("role") == "system" else ""
+        if isinstance(system, str) and "意图识别" in system:
+            key = json.dumps(messages[-1], ensure_ascii=False).encode("utf-8")
+            return INTENT_RESPONSES[zlib.crc32(key) % len(INTENT_RESPONSES)], "stop"
+        wanted = max(1, int(random.gauss(settings["output_tokens"], settings["output_tokens"] * 0.2)))
+        tokens = min(wanted, body.get("max_tokens") or wanted)
+        return (FILLER * (tokens // len(FILLER) + 1))[:tokens], "stop" if tokens == wanted else "length"
+
+    def injected_error():
+        roll = random.random()
+        if roll < settings["error_429"]:
+            counters["injected_429"] += 1
+            return JSONResponse(
+                {"error": {"message": "Requests rate limit exceeded", "type": "rate_limit_error"}},
+                status_code=429, headers={"Retry-After": str(settings["retry_after"])}
+            )
+        if roll < settings["error_429"] + settings["error_5xx"]:
+            counters["injected_5xx"] += 1
+            return JSONResponse({"error": {"message": "Internal error", "type": "server_error"}},
+                                status_code=random.choice([500, 503]))
+        return None
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        error = injected_error()
+        if error is not None:
+            await asyncio.sleep(scaled(settings["ttft"] * 0.1))
+            return error
+
+        reply, finish_reason = build_reply(body)
+        usage = {"prompt_tokens": estimate_prompt_tokens(body.get("messages", [])), "completion_tokens": len(reply)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        counters["prompt_tokens"] += usage["prompt_tokens"]
+        counters["completion_tokens"] += usage["completion_tokens"]
+
+        if not body.get("stream"):
+            await asyncio.sleep(scaled(sample_ttft() + len(reply) / settings["token_rate"]))
+            return {
+                "id": f"chatcmpl-mock-{counters['requests']}",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": finish_reason}],
+                "usage": usage
+            }
+
+        counters["stream_requests"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def events():
+            await asyncio.sleep(scaled(sample_ttft()))
+            step = settings["chunk_tokens"]
+            for start in range(0, len(reply), step):
+                chunk = reply[start:start + step]
+                yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": chunk}}]},
+                                            ensure_ascii=False) + "\n\n"
+                await asyncio.sleep(scaled(len(chunk) / settings["token_rate"]))
+            yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}) + "\n\n"
+            if include_usage:
+                yield "data: " + json.dumps({"choices": [], "usage": usage}) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return {**counters, "uptime": time.time() - started_at, "settings": settings}
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser, prefix: str = ""):
+    """注册模拟服务参数（压测脚本以--mock-前缀复用）"""
+    for name, value in DEFAULT_SETTINGS.items():
+        flag = f"--{prefix}{name.replace('_', '-')}"
+        parser.add_argument(flag, type=type(value), default=value, dest=f"{prefix.replace('-', '_')}{name}")
+
+
+def settings_from_args(args: argparse.Namespace, prefix: str = "") -> Dict[str, Any]:
+    return {name: getattr(args, f"{prefix.replace('-', '_')}{name}") for name in DEFAULT_SETTINGS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟百炼OpenAI兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（用于复现故障注入）")
+    add_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+长报告解读延迟基准测试：单次解读 vs 分段并发解读（map-reduce）
+
+上游为本地模拟：延迟 = 首token延迟 + 提示词token / prefill速率 + 输出token / 生成速率，
+输出长度取 min(max_tokens, 输入token * output_ratio)。
+
+用法：
+    python benchmarks/report_chunking_bench.py
+    python benchmarks/report_chunking_bench.py --pages 40 --decode-rate 40 --time-scale 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+from agents import AgentFactory  # noqa: E402
+from config import Config  # noqa: E402
+from utils import estimate_messages_tokens  # noqa: E402
+
+
+def build_report(pages: int) -> str:
+    """生成多页化验报告文本"""
+    sections = []
+    for page in range(1, pages + 1):
+        rows = [f"第{page}页 检验项目 结果 参考范围 单位"]
+        for item in range(40):
+            flag = "↑" if (page * item) % 17 == 0 else ""
+            rows.append(f"项目{page}-{item} {4.5 + item % 7 * 0.3:.1f}{flag} 3.5-5.5 mmol/L")
+        sections.append("\n".join(rows))
+    return "\n\n".join(sections)
+
+
+def mock_upstream(args):
+    """模拟上游：按token数计算延迟"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        prompt_tokens = estimate_messages_tokens(body["messages"])
+        completion_tokens = min(body["max_tokens"], int(prompt_tokens * args.output_ratio) + 50)
+        seconds = args.ttft + prompt_tokens / args.prefill_rate + completion_tokens / args.decode_rate
+        await asyncio.sleep(seconds * args.time_scale)
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "【报告概述】\n模拟解读"}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        })
+    return handler
+
+
+async def run(args):
+    Config.DASHSCOPE_BASE_URL = "http://mock"
+    Config.RATE_LIMIT["enabled"] = False
+    utils._http_client = httpx.AsyncClient(transport=httpx.MockTransport(mock_upstream(args)))
+    agent = AgentFactory.create_agent("report_interpretation")
+    report = build_report(args.pages)
+    chunks, _ = agent.split_report(report)
+    print(f"报告: {args.pages}页, 估算{utils.estimate_tokens(report)} tokens, 分段数: {len(chunks) if chunks else 1}")
+
+    results = {}
+    for mode in ("single", "chunked"):
+        agent.chunking = {**Config.REPORT_CHUNKING, "enabled": mode == "chunked"}
+        start = time.perf_counter()
+        result = await agent.process(report)
+        elapsed = (time.perf_counter() - start) / args.time_scale
+        assert result["success"], result
+        results[mode] = elapsed
+        print(f"{mode:8s} 模拟耗时: {elapsed:8.1f}s")
+    print(f"加速比: {results['single'] / results['chunked']:.2f}x")
+    await utils.close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长报告分段解读延迟对比")
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--ttft", type=float, default=0.8, help="首token延迟（秒）")
+    parser.add_argument("--prefill-rate", type=float, default=4000, help="提示词处理速率（token/秒）")
+    parser.add_argument("--decode-rate", type=float, default=40, help="生成速率（token/秒）")
+    parser.add_argument("--output-ratio", type=float, default=0.3, help="输出token / 输入token")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="实际等待时间缩放比例")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+语义缓存检索延迟基准测试
+
+用法：
+    python benchmarks/semantic_cache_bench.py                 # 默认规模 10k / 100k / 1M
+    python benchmarks/semantic_cache_bench.py --sizes 10000 100000 --index hnsw
+
+注意：1M条目 * 256维 float32 约占用1GB内存
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache  # noqa: E402
+
+
+class RandomEmbedder:
+    """按文本哈希生成的确定性随机单位向量：只测量检索开销，不代表真实向量模型的语义质量"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+def percentile(samples, q):
+    return float(np.percentile(np.asarray(samples), q))
+
+
+def bench(size: int, dim: int, index: str, queries: int):
+    """填充size条随机向量后测量端到端检索耗时（含向量化）与纯索引检索耗时"""
+    embedder = RandomEmbedder(dim=dim)
+    cache = SemanticCache(embedder=embedder, threshold=0.92, max_entries=size, index=index)
+
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    batch = 50000
+    for offset in range(0, size, batch):
+        n = min(batch, size - offset)
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for i in range(n):
+            slot = cache.index.allocate()
+            cache.index.put(slot, vectors[i])
+            cache.values[slot] = (float("inf"), "", (), "")
+    fill_seconds = time.perf_counter() - start
+
+    questions = [f"布洛芬的用法用量第{i}问" for i in range(queries)]
+    vector = embedder.embed(questions[0])
+
+    search_ms = []
+    for _ in range(queries):
+        t = time.perf_counter()
+        cache.index.search(vector)
+        search_ms.append((time.perf_counter() - t) * 1000)
+
+    lookup_ms = []
+    for q in questions:
+        t = time.perf_counter()
+        cache.get(q)
+        lookup_ms.append((time.perf_counter() - t) * 1000)
+
+    memory_mb = cache.index.vectors.nbytes / 1024 / 1024
+    print(
+        f"size={size:>8} index={index:<5} fill={fill_seconds:6.1f}s mem={memory_mb:7.1f}MB "
+        f"search p50={percentile(search_ms, 50):7.3f}ms p99={percentile(search_ms, 99):7.3f}ms "
+        f"lookup p50={percentile(lookup_ms, 50):7.3f}ms p99={percentile(lookup_ms, 99):7.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语义缓存检索延迟基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--index", choices=["numpy", "hnsw"], default="numpy")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        bench(size, args.dim, args.index, args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+上传内存占用基准测试：整文件读取（await file.read()） vs 分块落盘（spool_upload）
+
+用法：
+    python benchmarks/upload_memory_bench.py
+    python benchmarks/upload_memory_bench.py --sizes 1 5 9.5
+"""
+import argparse
+import asyncio
+import io
+import os
+import resource
+import sys
+import tempfile
+import tracemalloc
+
+from fastapi import UploadFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uploads import spool_upload  # noqa: E402
+
+
+def make_upload(size: int) -> UploadFile:
+    """构造与Starlette表单解析结果相同的UploadFile（超过1MB的部分已在磁盘上）"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    block = os.urandom(1024 * 1024)
+    remaining = size
+    while remaining > 0:
+        spooled.write(block[:min(remaining, len(block))])
+        remaining -= len(block)
+    spooled.seek(0)
+    return UploadFile(spooled, size=size, filename="report.pdf")
+
+
+async def read_whole(upload: UploadFile):
+    content = await upload.read()
+    stream = io.BytesIO(content)  # 原实现中解析器再包装一次
+    return len(stream.getvalue())
+
+
+async def read_spooled(upload: UploadFile):
+    with await spool_upload(upload) as spooled:
+        return spooled.size
+
+
+async def measure(reader, size: int) -> float:
+    upload = make_upload(size)
+    tracemalloc.start()
+    await reader(upload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await upload.close()
+    return peak / 1024 / 1024
+
+
+async def run(sizes):
+    print(f"{'size_mb':>8} {'read()_peak_mb':>15} {'spool_peak_mb':>14}")
+    for size_mb in sizes:
+        size = int(size_mb * 1024 * 1024)
+        whole = await measure(read_whole, size)
+        spooled = await measure(read_spooled, size)
+        print(f"{size_mb:8.1f} {whole:15.2f} {spooled:14.2f}")
+    print(f"进程峰值RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上传内存占用对比")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.5, 2, 5, 9.5], help="文件大小（MB）")
+    asyncio.run(run(parser.parse_args().sizes))
+
+
+if __name__ == "__main__":
+    main()
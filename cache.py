@@ -0,0 +1,194 @@
+"""
+响应缓存 - 相同输入 + 相同智能体/模型参数时直接复用已生成的回答
+支持内存LRU+TTL后端与SQLite持久化后端
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import Config
+
+
+def normalize_text(text: str) -> str:
+    """归一化用户输入：全半角统一、合并空白、转小写、去除结尾标点"""
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip("?？。.!！~～")
+
+
+def hash_text(text: str) -> str:
+    """计算文本的SHA-256摘要"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """内存缓存后端：LRU淘汰 + TTL过期"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # 键 -> (过期时间, 值)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCacheBackend:
+    """SQLite缓存后端：重启后仍然有效，按最近访问时间淘汰"""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now)
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ResponseCache:
+    """智能体响应缓存（精确匹配），统计命中/未命中次数"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def make_key(user_input: str, agent_name: str, model: str, temperature: float, prompt_hash: str) -> str:
+        """缓存键：归一化输入 + 智能体 + 模型 + 温度 + 系统提示词摘要（hash_text）"""
+        raw = json.dumps(
+            [normalize_text(user_input), agent_name, model, temperature, prompt_hash],
+            ensure_ascii=False
+        )
+        return hash_text(raw)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.backend.get(key)
+        with self._lock:
+            self._counters["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self.backend.set(key, value)
+        with self._lock:
+            self._counters["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        counters["entries"] = len(self.backend)
+        counters["backend"] = type(self.backend).__name__
+        return counters
+
+
+def create_cache_backend(settings: Dict[str, Any]):
+    """根据配置创建缓存后端"""
+    if settings.get("backend") == "sqlite":
+        return SQLiteCacheBackend(
+            settings.get("sqlite_path", "cache/response_cache.db"),
+            max_entries=settings.get("max_entries", 10000),
+            ttl=settings.get("ttl", 86400)
+        )
+    return MemoryCacheBackend(
+        max_entries=settings.get("max_entries", 1024),
+        ttl=settings.get("ttl", 3600)
+    )
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程内共享的响应缓存"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(create_cache_backend(Config.RESPONSE_CACHE))
+    return _response_cache
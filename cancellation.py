@@ -0,0 +1,102 @@
+"""
+客户端断开检测 - 用户离开页面后取消仍在进行的处理，并关闭上游连接/流
+统计被取消的请求数与节省的token（按该智能体近期平均输出长度估算）
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Dict, Optional
+
+from starlette.requests import Request
+
+
+class ClientDisconnected(Exception):
+    """客户端在处理完成前断开连接"""
+
+    def __init__(self):
+        super().__init__("客户端已断开连接")
+
+
+class CancellationTracker:
+    """取消统计：请求级取消次数、上游调用取消次数与节省的token"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._output_tokens: Dict[str, float] = {}
+        self._counters: Dict[str, Any] = {
+            "requests_cancelled": 0, "upstream_cancelled": 0, "tokens_saved": 0, "by_agent": {}
+        }
+
+    def record_request_cancelled(self):
+        with self._lock:
+            self._counters["requests_cancelled"] += 1
+
+    def record_completion(self, agent_name: str, usage: Optional[Dict[str, Any]]):
+        """记录完成调用的输出长度（EWMA），用于估算取消时节省的token"""
+        completion_tokens = (usage or {}).get("completion_tokens")
+        if not completion_tokens:
+            return
+        with self._lock:
+            previous = self._output_tokens.get(agent_name)
+            self._output_tokens[agent_name] = (
+                completion_tokens if previous is None else 0.9 * previous + 0.1 * completion_tokens
+            )
+
+    def record_cancelled(self, agent_name: str, max_tokens: int, generated_tokens: int = 0):
+        """上游调用被取消：节省量 = 预期输出长度 - 已生成长度（无历史数据时以max_tokens为预期）"""
+        with self._lock:
+            expected = self._output_tokens.get(agent_name, max_tokens)
+            saved = max(0, int(expected) - generated_tokens)
+            self._counters["upstream_cancelled"] += 1
+            self._counters["tokens_saved"] += saved
+            by_agent = self._counters["by_agent"].setdefault(agent_name, {"cancelled": 0, "tokens_saved": 0})
+            by_agent["cancelled"] += 1
+            by_agent["tokens_saved"] += saved
+
+    def stats(self) -> Dict[str, Any]:
+        """取消次数与节省token统计"""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["by_agent"] = {name: dict(values) for name, values in self._counters["by_agent"].items()}
+        return counters
+
+
+async def wait_for_disconnect(request: Request):
+    """等待客户端断开（请求体已读完后，receive只会在断开时返回http.disconnect）"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_disconnect(request: Request, awaitable: Awaitable[Any]) -> Any:
+    """执行处理；客户端先断开时取消处理（取消沿智能体传递到上游HTTP调用）并抛出ClientDisconnected"""
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        watcher.cancel()
+        task.cancel()
+        raise
+
+    watcher.cancel()
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        get_cancellation_tracker().record_request_cancelled()
+        raise ClientDisconnected()
+    return task.result()
+
+
+_tracker: Optional[CancellationTracker] = None
+
+
+def get_cancellation_tracker() -> CancellationTracker:
+    """获取进程内共享的取消统计"""
+    global _tracker
+    if _tracker is None:
+        _tracker = CancellationTracker()
+    return _tracker
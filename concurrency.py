@@ -0,0 +1,277 @@
+"""
+并发控制工具 - 相同请求合并（single-flight）、令牌桶限流与按智能体的并发限制
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from config import Config
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """根据完整请求体（消息 + 模型参数）计算合并键"""
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """一次进行中的上游调用"""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFanout:
+    """一次进行中的上游流式调用，已产出的分段会回放给后加入的订阅者"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task"] = None
+
+    def _notify(self):
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+    async def pump(self, stream_factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in stream_factory():
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+
+class SingleFlight:
+    """相同请求合并：并发的相同调用共享同一次上游请求，全部调用方取消时才取消上游"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _StreamFanout] = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "collapsed": 0, "stream_calls": 0, "stream_collapsed": 0}
+
+    def _record(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行调用；若已有相同键的调用在进行中，则等待并共享其结果"""
+        if not self.enabled:
+            return await fn()
+
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(self._calls, key, call))
+            self._record("calls")
+        else:
+            self._record("collapsed")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(self._calls, key, call)
+                call.task.cancel()
+
+    async def stream(self, key: str, stream_factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """流式调用合并：上游分段扇出给所有订阅者"""
+        if not self.enabled:
+            async for chunk in stream_factory():
+                yield chunk
+            return
+
+        fanout = self._streams.get(key)
+        if fanout is None:
+            fanout = _StreamFanout()
+            fanout.task = asyncio.ensure_future(fanout.pump(stream_factory))
+            self._streams[key] = fanout
+            fanout.task.add_done_callback(lambda _: self._forget(self._streams, key, fanout))
+            self._record("stream_calls")
+        else:
+            self._record("stream_collapsed")
+
+        fanout.subscribers += 1
+        try:
+            index = 0
+            while True:
+                while index < len(fanout.chunks):
+                    yield fanout.chunks[index]
+                    index += 1
+                if fanout.done:
+                    if fanout.error is not None:
+                        raise fanout.error
+                    return
+                await fanout.changed.wait()
+        finally:
+            fanout.subscribers -= 1
+            if fanout.subscribers == 0 and not fanout.task.done():
+                self._forget(self._streams, key, fanout)
+                fanout.task.cancel()
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, item: Any):
+        if registry.get(key) is item:
+            del registry[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        with self._lock:
+            counters = dict(self._counters)
+        counters["in_flight"] = len(self._calls) + len(self._streams)
+        return counters
+
+
+class AsyncTokenBucket:
+    """异步令牌桶：等待者按到达顺序（FIFO）排队，允许单次申请超过桶容量（记为欠额）"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0):
+        """申请令牌；持有锁等待，保证先到先得"""
+        async with self._lock:
+            self._refill()
+            needed = min(amount, self.capacity)
+            if self.tokens < needed:
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """上游配额限流：全局RPM/TPM令牌桶 + 按智能体的并发信号量与RPM/TPM预算"""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 agents_config: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.global_buckets = self._buckets(rpm, tpm)
+        self.agents_config = agents_config or {}
+        self._agent_buckets: Dict[str, Dict[str, AsyncTokenBucket]] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def _buckets(rpm: Optional[float], tpm: Optional[float]) -> Dict[str, AsyncTokenBucket]:
+        buckets = {}
+        if rpm:
+            buckets["requests"] = AsyncTokenBucket(rpm)
+        if tpm:
+            buckets["tokens"] = AsyncTokenBucket(tpm)
+        return buckets
+
+    def _agent_state(self, agent_name: str):
+        with self._lock:
+            if agent_name not in self._stats:
+                settings = self.agents_config.get(agent_name, {})
+                self._agent_buckets[agent_name] = self._buckets(settings.get("rpm"), settings.get("tpm"))
+                if settings.get("max_concurrency"):
+                    self._semaphores[agent_name] = asyncio.Semaphore(settings["max_concurrency"])
+                self._stats[agent_name] = {
+                    "requests": 0, "waiting": 0, "in_flight": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0
+                }
+            return self._agent_buckets[agent_name], self._semaphores.get(agent_name), self._stats[agent_name]
+
+    @staticmethod
+    async def _acquire_buckets(buckets: Dict[str, AsyncTokenBucket], tokens: int):
+        if "requests" in buckets:
+            await buckets["requests"].acquire(1)
+        if "tokens" in buckets:
+            await buckets["tokens"].acquire(tokens)
+
+    @asynccontextmanager
+    async def limit(self, agent_name: str, estimated_tokens: int):
+        """在配额内执行一次上游调用：依次等待智能体并发名额、智能体预算与全局配额"""
+        agent_buckets, semaphore, stats = self._agent_state(agent_name)
+        start = time.perf_counter()
+        stats["requests"] += 1
+        stats["waiting"] += 1
+        acquired = False
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+                acquired = True
+            await self._acquire_buckets(agent_buckets, estimated_tokens)
+            await self._acquire_buckets(self.global_buckets, estimated_tokens)
+        except BaseException:
+            if acquired:
+                semaphore.release()
+            raise
+        finally:
+            stats["waiting"] -= 1
+            waited = (time.perf_counter() - start) * 1000
+            stats["total_wait_ms"] += waited
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], waited)
+
+        stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            stats["in_flight"] -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """排队与配额统计"""
+        with self._lock:
+            agents = {name: dict(values) for name, values in self._stats.items()}
+        for values in agents.values():
+            values["avg_wait_ms"] = values["total_wait_ms"] / values["requests"] if values["requests"] else 0.0
+        return {
+            "global": {name: round(bucket.tokens, 1) for name, bucket in self.global_buckets.items()},
+            "agents": agents
+        }
+
+
+_single_flight: Optional[SingleFlight] = None
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """获取进程内共享的请求合并器"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight(enabled=Config.SINGLE_FLIGHT_ENABLED)
+    return _single_flight
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程内共享的限流器"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        settings = Config.RATE_LIMIT
+        enabled = settings.get("enabled", True)
+        _rate_limiter = RateLimiter(
+            rpm=settings.get("rpm") if enabled else None,
+            tpm=settings.get("tpm") if enabled else None,
+            agents_config=Config.AGENTS_CONFIG if enabled else {}
+        )
+    return _rate_limiter
@@ -11,10 +11,214 @@ class Config:
     DASHSCOPE_BASE_URL = ""
     DASHSCOPE_API_KEY = ""
     
+    # HTTP连接池配置（进程内共享的异步客户端）
+    HTTP_POOL_MAX_CONNECTIONS = 100  # 最大连接数
+    HTTP_POOL_MAX_KEEPALIVE = 20  # 最大保活连接数
+    HTTP_KEEPALIVE_EXPIRY = 30.0  # 空闲连接保活时间（秒）
+    HTTP2_ENABLED = False  # 是否启用HTTP/2（需要安装h2）
+    HTTP_CONNECT_TIMEOUT = 5.0  # 建立连接超时（秒）
+    HTTP_READ_TIMEOUT = 30.0  # 读取响应超时（秒）
+    HTTP_WRITE_TIMEOUT = 10.0  # 发送请求超时（秒）
+    HTTP_POOL_TIMEOUT = 5.0  # 等待连接池空闲连接超时（秒）
+    
+    # 上游重试：429/5xx与网络错误按指数退避（full jitter）重试，优先遵循Retry-After
+    LLM_RETRY = {
+        "max_attempts": 3,  # 含首次请求
+        "base_delay": 0.5,  # 退避基数（秒）
+        "max_delay": 8.0,  # 单次退避上限（秒）
+        "max_retry_after": 30.0,  # Retry-After超过该值时不再重试
+        "retry_statuses": [429, 500, 502, 503, 504]
+    }
+    
+    # 熔断器（按模型）：连续失败达到阈值后打开，冷却后半开探测
+    CIRCUIT_BREAKER = {
+        "failure_threshold": 5,
+        "recovery_timeout": 30.0,  # 打开状态持续时间（秒）
+        "half_open_max_calls": 1  # 半开状态允许的探测请求数
+    }
+    
+    # 对冲请求：主请求超过分位数延迟仍未返回（流式为首个分段）时发送副本，按智能体开启（AGENTS_CONFIG.hedge）
+    HEDGING = {
+        "percentile": 95,  # 对冲等待时间取该分位数的历史延迟
+        "min_samples": 20,  # 样本不足时使用initial_delay
+        "initial_delay": 2.0,  # 初始对冲等待时间（秒）
+        "min_delay": 0.05,
+        "max_hedge_ratio": 0.1,  # 副本请求数不超过请求总数的该比例
+        "window": 500  # 延迟统计窗口大小
+    }
+    
+    # 客户端限流：按账号配额排队等待，避免突发流量触发上游429
+    # 智能体级别的并发（max_concurrency）与预算（rpm/tpm）在AGENTS_CONFIG中配置
+    RATE_LIMIT = {
+        "enabled": True,
+        "rpm": 600,  # 每分钟请求数
+        "tpm": 1000000  # 每分钟token数（按提示词估算 + max_tokens计）
+    }
+    
+    # 相同请求合并：并发的完全相同的大模型请求共享同一次上游调用
+    SINGLE_FLIGHT_ENABLED = True
+    
+    # 准入控制：超出并发上限的请求按优先级排队，预计排队时间超过SLO时直接返回503
+    ADMISSION = {
+        "enabled": True,
+        "max_concurrency": 64,  # 同时处理的请求数
+        "max_queue": 256,  # 排队上限，满时挤掉优先级最低的排队请求
+        "slo_seconds": 10.0,  # 排队时间目标
+        "initial_service_time": 5.0,  # 服务时间EWMA的初始值（秒）
+        "default_priority": 5,
+        # 数值越小越优先；医疗对话按本地分类器预测的意图取优先级
+        "priorities": {
+            "triage": 0,
+            "self_diagnosis": 1,
+            "dermatology": 2,
+            "case_generation": 2,
+            "report_interpretation": 3,
+            "medication": 3,
+            "health_education": 4,
+            "chat": 9
+        }
+    }
+    
     # 模型配置
     TEXT_MODEL = "qwen3-max"  # 文本模型
     VISION_MODEL = "qwen3-vl-plus"  # 视觉模型
     
+    # 本地意图快速通道：置信度达到阈值时跳过大模型意图识别
+    INTENT_FAST_PATH = {
+        "enabled": True,
+        "threshold": 0.85,  # 线性模型置信度阈值
+        "training_data": ""  # 追加训练语料（JSONL：{"text": ..., "label": ...}）
+    }
+    
+    # 推测式并行路由：意图识别的同时预先启动最可能的下游智能体（按路由配置）
+    SPECULATIVE_ROUTING = {
+        "medical_chat": {
+            "enabled": False,  # 默认关闭，开启后会产生额外的token消耗
+            "max_branches": 1,  # 最多同时推测的下游智能体数量
+            "min_prior": 0.3,  # 先验概率低于该值的智能体不推测
+            "traffic_weight": 0.3,  # 近期流量分布在先验中的权重（其余来自本地分类器）
+            "traffic_window": 200  # 近期流量统计窗口大小
+        }
+    }
+    
+    # 响应缓存（精确匹配），各智能体通过AGENTS_CONFIG中的cache开关启用
+    RESPONSE_CACHE = {
+        "backend": "memory",  # memory（LRU+TTL） 或 sqlite（持久化）
+        "max_entries": 1024,
+        "ttl": 3600,  # 过期时间（秒）
+        "sqlite_path": "cache/response_cache.db"
+    }
+    
+    # 语义缓存（向量相似度），各智能体通过AGENTS_CONFIG中的semantic_cache开关启用
+    SEMANTIC_CACHE = {
+        "model": "",  # sentence-transformers模型名（如BAAI/bge-small-zh-v1.5），留空则不启用语义缓存
+        "threshold": 0.92,  # 相似度阈值，医疗回答宁缺毋滥
+        "max_entries": 10000,  # 每个智能体的最大条目数（内存上界 = max_entries * 向量维度 * 4字节）
+        "ttl": 3600,
+        "index": "numpy"  # numpy（暴力检索） 或 hnsw（需要安装hnswlib）
+    }
+    
+    # 图片近似缓存（感知哈希），各智能体通过AGENTS_CONFIG中的image_cache开关启用
+    IMAGE_CACHE = {
+        "algorithm": "phash",  # phash（对重新压缩、缩放更稳健） 或 dhash（更快）
+        "max_distance": 4,  # 64位哈希的汉明距离阈值，医疗场景宜从严
+        "max_entries": 2048,
+        "ttl": 3600
+    }
+    
+    # Prometheus指标：GET /metrics
+    METRICS = {
+        "enabled": True
+    }
+    
+    # 链路追踪：每个请求一个trace（X-Request-ID作为关联ID），意图识别、下游智能体、文件解析、大模型调用各为一个span
+    TRACING = {
+        "enabled": False,
+        "exporter": "file",  # file（JSONL）/ otlp（OTLP/HTTP JSON，发往Collector、Jaeger、Tempo等）/ none
+        "file_path": "logs/traces.jsonl",
+        "otlp_endpoint": "http://localhost:4318",
+        "service_name": "medical-agent",
+        "sample_rate": 1.0,  # 按trace_id确定性采样
+        "batch_size": 256,
+        "flush_interval": 2.0  # 后台导出间隔（秒）
+    }
+    
+    # 管理接口令牌：请求需携带请求头X-Admin-Token；留空时管理接口一律返回404（不对外暴露）
+    ADMIN_TOKEN = ""
+    
+    # 性能剖析：采样剖析接口（GET /api/admin/profile）与慢请求记录（GET /api/admin/slow-requests），需配置ADMIN_TOKEN
+    PROFILING = {
+        "enabled": False,
+        "max_seconds": 60,  # 单次剖析最长时间
+        "interval": 0.005,  # 采样间隔（秒）
+        "slow_request_threshold": 2.0,  # 超过该耗时（秒）的请求记录各阶段明细
+        "slow_request_capacity": 100,  # 环形缓冲区大小
+        "slow_request_routes": [
+            "/api/report-interpretation",
+            "/api/report-interpretation/stream",
+            "/api/dermatology-consultation"
+        ]
+    }
+    
+    # token用量账本：按智能体/接口/日期累计usage，GET /api/usage/daily 输出每日预算报告（需配置ADMIN_TOKEN）
+    TOKEN_BUDGET = {
+        "daily_tokens": 0,  # 每日token预算，0表示不设预算（只统计）
+        "per_agent": {},  # 智能体每日预算，例如 {"report_interpretation": 2000000}
+        "retention_days": 30,
+        "path": "logs/token_usage.json",  # 定期及关闭时写入、启动时恢复，留空则只保存在内存中
+        "flush_interval": 60  # 定期写入间隔（秒）
+    }
+    
+    # 自适应max_tokens：按近期实际输出长度的分位数（区分输入规模）设定非流式调用的max_tokens，智能体原有max_tokens为上限
+    # 被截断的回答以原上限重新请求；流式调用始终使用原上限
+    # 同时降低限流器按max_tokens预留的TPM配额；可在AGENTS_CONFIG中以adaptive_max_tokens单独开关
+    ADAPTIVE_MAX_TOKENS = {
+        "enabled": True,
+        "percentile": 0.99,
+        "headroom": 1.25,  # 分位数之上的余量系数
+        "min_samples": 50,  # 样本不足时使用原上限
+        "min_tokens": 256,
+        "window": 500  # 每个智能体/上限/输入规模保留的最近样本数
+    }
+    
+    # 文档缓存：按上传内容哈希缓存提取文本与解读结果，重复上传时不再解析和调用大模型
+    DOCUMENT_CACHE = {
+        "enabled": True,
+        "path": "cache/documents.db",
+        "max_bytes": 256 * 1024 * 1024,  # 磁盘占用上限，超出时按最近访问时间淘汰
+        "ttl": 7 * 86400
+    }
+    
+    # 长报告分段解读（map-reduce）：估算token超过阈值时按段落分块并发解读，再汇总为完整解读
+    REPORT_CHUNKING = {
+        "enabled": True,
+        "min_tokens": 6000,  # 报告估算token数超过该值时启用分段模式
+        "chunk_tokens": 3000,  # 每段的目标token数（按段落/行边界切分）
+        "max_chunks": 16,  # 分段上限，超出时均匀增大每段大小
+        "max_chunk_tokens": 12000,  # 单段硬上限（须远小于模型上下文）；仍放不下的末尾内容不再解读并在结果中提示
+        "max_concurrency": 4,  # 单个报告同时解读的分段数
+        "map_max_tokens": 1000  # 每段提取要点的最大输出token数
+    }
+    
+    # PDF逐页提取：扫描件中大量无文本层的页面直接跳过，页数/字符数超出预算时截断
+    PDF_EXTRACTION = {
+        "max_pages": 200,  # 最多检查的页数，0表示不限制
+        "max_chars": 200000,  # 最多提取的字符数，0表示不限制
+        "page_time_limit": 2.0,  # 单页提取超时（秒），超时的页被跳过，0表示不限制
+        "skip_image_pages": True,  # 跳过没有字体资源（含Form XObject内嵌资源）的纯图片页（不解析其内容流）
+        "incremental": True,  # 报告解读边解析边解读：每提取完一批页面即提交分段要点提取
+        "batch_pages": 8  # 每次提交给执行器提取的页数
+    }
+    
+    # 文件处理执行器：PDF/Word解析与图片转码在独立进程中执行，避免阻塞事件循环
+    FILE_PROCESSING = {
+        "executor": "process",  # process（进程池，无法创建时自动回退到线程池） 或 thread
+        "max_workers": 0,  # 工作进程数，0表示按CPU核数
+        "max_pending": 32,  # 同时提交给执行器的任务上限，超出部分在事件循环中排队
+        "job_timeout": 30.0,  # 单个任务超时（秒），进程池任务超时后回收进程池
+        "start_method": "spawn"  # 进程启动方式，避免在多线程服务进程中fork
+    }
+    
     # 服务配置
     HOST = "0.0.0.0"
     PORT = 8000
@@ -26,12 +230,33 @@ class Config:
         "document": [".docx", ".pdf", ".txt"],
         "image": [".jpg", ".jpeg", ".png", ".bmp", ".gif"]
     }
+    # 视觉模型图片预处理：qwen-vl会把图片缩放到约1280*28*28像素以内，更高分辨率只增加传输与处理开销
+    IMAGE_PREPROCESSING = {
+        "enabled": True,  # 关闭时按原分辨率JPEG q=85转码
+        "max_long_edge": 1280,  # 长边上限（像素）
+        "min_long_edge": 512,  # 为达到目标大小继续缩小时的长边下限
+        "target_bytes": 400 * 1024,  # 编码后目标大小
+        "quality": 85,  # 初始编码质量
+        "min_quality": 60,  # 为达到目标大小可降到的最低质量
+        "format": "JPEG",  # JPEG 或 WEBP（同等质量下体积更小）
+        "measure_baseline": False  # 同时按原始方式转码以统计节省的字节数与耗时（仅用于评估）
+    }
+    
+    UPLOAD = {
+        "chunk_size": 64 * 1024,  # 大文件复制到临时文件时的分块大小
+        "spool_threshold": 1024 * 1024,  # 超过该大小的上传写入临时文件
+        "spool_dir": "",  # 临时文件目录，留空使用系统默认
+        "form_overhead": 64 * 1024  # multipart表单除文件外的额外字节上限
+    }
     
     # 智能体配置
     AGENTS_CONFIG = {
         "intent_recognition": {
             "name": "意图识别智能体",
-            "description": "判断用户输入是医疗意图还是非医疗用途，并分类医疗具体用途"
+            "description": "判断用户输入是医疗意图还是非医疗用途，并分类医疗具体用途",
+            "cache": True,
+            "hedge": True,
+            "max_concurrency": 32
         },
         "chat": {
             "name": "闲聊智能体", 
@@ -51,18 +276,26 @@ class Config:
         },
         "report_interpretation": {
             "name": "报告解读智能体",
-            "description": "解读医学检查检验报告"
+            "description": "解读医学检查检验报告",
+            "max_concurrency": 4,  # 长报告占用大量token，限制并发避免挤占其他智能体配额
+            "tpm": 200000
         },
         "health_education": {
             "name": "健康科普智能体",
-            "description": "提供权威医学知识科普"
+            "description": "提供权威医学知识科普",
+            "cache": True,
+            "semantic_cache": True
         },
         "dermatology": {
             "name": "皮肤病咨询智能体",
-            "description": "分析皮肤病图片并提供诊断建议"
+            "description": "分析皮肤病图片并提供诊断建议",
+            "max_concurrency": 8,
+            "image_cache": True
         },
         "medication": {
             "name": "药物咨询智能体",
-            "description": "基于药品说明书提供用药指导"
+            "description": "基于药品说明书提供用药指导",
+            "cache": True,
+            "semantic_cache": True
         }
     }
@@ -0,0 +1,152 @@
+"""
+文档缓存 - 以上传内容的SHA-256为键缓存提取出的文本与最终解读结果
+重复上传同一份报告时无需再次解析或调用大模型；SQLite持久化，按总字节数上限做LRU淘汰
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from cache import hash_text
+from config import Config
+
+
+class DocumentCache:
+    """按内容哈希寻址的磁盘缓存"""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl: float = 7 * 86400):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_accessed ON documents(accessed_at)")
+        self._conn.execute("DELETE FROM documents WHERE expires_at < ?", (time.time(),))
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+
+    @staticmethod
+    def text_key(content_hash: str) -> str:
+        return f"text:{content_hash}"
+
+    @staticmethod
+    def result_key(content_hash: str, agent) -> str:
+        """解读结果键：内容哈希 + 智能体/模型参数 + 系统提示词摘要（提示词变更后自动失效）"""
+        raw = json.dumps([content_hash, agent.agent_name, agent.model, agent.temperature, agent.prompt_hash])
+        return f"result:{hash_text(raw)}"
+
+    def get_text(self, content_hash: str) -> Optional[str]:
+        return self.get(self.text_key(content_hash))
+
+    def set_text(self, content_hash: str, text: str):
+        self.set(self.text_key(content_hash), text)
+
+    def get_result(self, content_hash: str, agent) -> Optional[str]:
+        return self.get(self.result_key(content_hash, agent))
+
+    def set_result(self, content_hash: str, agent, result: str):
+        self.set(self.result_key(content_hash, agent), result)
+
+    def _record(self, kind: str, name: str):
+        counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0, "stores": 0})
+        counters[name] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        kind = key.split(":", 1)[0]
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, expires_at FROM documents WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[2] < now:
+                self._conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+                self._conn.commit()
+                self.total_bytes -= row[1]
+                row = None
+            if row is None:
+                self._record(kind, "misses")
+                return None
+            self._conn.execute("UPDATE documents SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._record(kind, "hits")
+        return row[0]
+
+    def set(self, key: str, value: str):
+        kind = key.split(":", 1)[0]
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM documents WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (key, kind, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, value, size, now + self.ttl, now)
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self._conn.commit()
+            self._record(kind, "stores")
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总字节数不超过上限"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM documents ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """分类型命中率与磁盘占用"""
+        with self._lock:
+            kinds = {kind: dict(values) for kind, values in self._counters.items()}
+            entries = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        for values in kinds.values():
+            lookups = values["hits"] + values["misses"]
+            values["hit_rate"] = values["hits"] / lookups if lookups else 0.0
+        return {
+            "kinds": kinds,
+            "entries": entries,
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
+
+
+_document_cache: Optional[DocumentCache] = None
+_document_cache_lock = threading.Lock()
+
+
+def get_document_cache() -> Optional[DocumentCache]:
+    """获取进程内共享的文档缓存（未启用时返回None）"""
+    global _document_cache
+    settings = Config.DOCUMENT_CACHE
+    if not settings.get("enabled", True):
+        return None
+    if _document_cache is None:
+        with _document_cache_lock:
+            if _document_cache is None:
+                _document_cache = DocumentCache(
+                    settings.get("path", "cache/documents.db"),
+                    max_bytes=settings.get("max_bytes", 256 * 1024 * 1024),
+                    ttl=settings.get("ttl", 7 * 86400)
+                )
+    return _document_cache
@@ -0,0 +1,203 @@
+"""
+文件处理执行器 - 将PDF/Word解析、图片转码等CPU密集任务放到进程池执行，避免阻塞事件循环
+进程池不可用时回退到线程池；排队任务数有上限，单个任务有超时
+进程池任务超时后替换进程池并终止旧池的工作进程，超时任务不会一直占用工作进程
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+from metrics import FILE_JOB_SECONDS
+
+
+class FileJobExecutor:
+    """有界的文件处理执行器"""
+
+    def __init__(self, mode: str = "process", max_workers: int = 0, max_pending: int = 32,
+                 job_timeout: float = 30.0, start_method: str = "spawn"):
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.start_method = start_method
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        self.mode = mode
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        # 已超时但仍在线程池中运行的任务数（线程无法中断）
+        self.stuck = 0
+        self._counters = {
+            "submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "rejected_stuck": 0,
+            "pool_restarts": 0, "pool_recycles": 0, "total_queue_ms": 0.0, "total_run_ms": 0.0
+        }
+
+    def _create_executor(self) -> Executor:
+        if self.mode == "process":
+            try:
+                return ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+            except (OSError, NotImplementedError, ImportError):
+                # 受限环境（如无/dev/shm）无法创建进程池时回退到线程池
+                self.mode = "thread"
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="file-job")
+
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _restart(self, broken: Executor):
+        """工作进程异常退出后重建进程池"""
+        with self._lock:
+            if self._executor is broken:
+                broken.shutdown(wait=False)
+                self._executor = self._create_executor()
+                self._counters["pool_restarts"] += 1
+
+    def _recycle(self, stale: Executor):
+        """
+        进程池任务超时后替换进程池：新任务提交到新池，旧池不再接收任务；
+        旧池中的任务在job_timeout内要么完成、要么调用方已超时放弃，届时终止其工作进程
+        """
+        with self._lock:
+            if self._executor is not stale:
+                return
+            self._executor = self._create_executor()
+            self._counters["pool_recycles"] += 1
+        stale.shutdown(wait=False)
+        reaper = threading.Timer(self.job_timeout, _terminate_workers, args=(stale,))
+        reaper.daemon = True
+        reaper.start()
+
+    def _track_stuck(self, future: Future):
+        """线程池任务超时后计入stuck，直到任务实际结束"""
+        def release(_):
+            with self._lock:
+                self.stuck -= 1
+
+        with self._lock:
+            self.stuck += 1
+        future.add_done_callback(release)
+
+    def _record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self._counters[name] += value
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        在执行器中运行fn(*args)，超过job_timeout时抛出异常
+        进程池任务超时后回收进程池；线程池中的任务无法中断，已超时仍在运行的任务占满全部线程时直接拒绝新任务
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if self.mode == "thread" and self.stuck >= self.max_workers:
+            self._record(rejected_stuck=1)
+            raise Exception("文件处理繁忙（已有任务超时未结束），请稍后重试")
+
+        self._record(submitted=1)
+        queued_at = time.perf_counter()
+        self.pending += 1
+        try:
+            async with self._slots:
+                executor = self.executor()
+                started_at = time.perf_counter()
+                self.running += 1
+                try:
+                    future = executor.submit(fn, *args)
+                    result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.job_timeout)
+                except asyncio.TimeoutError:
+                    self._record(timeouts=1)
+                    if isinstance(executor, ProcessPoolExecutor):
+                        self._recycle(executor)
+                    elif not future.done():
+                        self._track_stuck(future)
+                    raise Exception(f"文件处理超时（超过{self.job_timeout:g}秒）")
+                except BrokenProcessPool:
+                    self._restart(executor)
+                    self._record(failed=1)
+                    raise Exception("文件处理进程异常退出")
+                except Exception:
+                    self._record(failed=1)
+                    raise
+                finally:
+                    self.running -= 1
+        finally:
+            self.pending -= 1
+
+        finished_at = time.perf_counter()
+        job = getattr(getattr(fn, "func", fn), "__name__", "job")
+        FILE_JOB_SECONDS.observe(started_at - queued_at, job=job, phase="queue")
+        FILE_JOB_SECONDS.observe(finished_at - started_at, job=job, phase="run")
+        self._record(
+            completed=1,
+            total_queue_ms=(started_at - queued_at) * 1000,
+            total_run_ms=(finished_at - started_at) * 1000
+        )
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """执行器模式、排队深度与耗时统计"""
+        with self._lock:
+            counters = dict(self._counters)
+        completed = counters["completed"]
+        counters["avg_queue_ms"] = counters["total_queue_ms"] / completed if completed else 0.0
+        counters["avg_run_ms"] = counters["total_run_ms"] / completed if completed else 0.0
+        counters.update({
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "queue_depth": self.pending - self.running,
+            "running": self.running,
+            "stuck": self.stuck
+        })
+        return counters
+
+
+def _terminate_workers(pool: Executor):
+    """终止已退役进程池中仍在运行（超时任务）的工作进程"""
+    processes = getattr(pool, "_processes", None) or {}
+    for process in list(processes.values()):
+        if process.is_alive():
+            process.terminate()
+
+
+_file_executor: Optional[FileJobExecutor] = None
+
+
+def get_file_executor() -> FileJobExecutor:
+    """获取进程内共享的文件处理执行器"""
+    global _file_executor
+    if _file_executor is None:
+        settings = Config.FILE_PROCESSING
+        _file_executor = FileJobExecutor(
+            mode=settings.get("executor", "process"),
+            max_workers=settings.get("max_workers", 0),
+            max_pending=settings.get("max_pending", 32),
+            job_timeout=settings.get("job_timeout", 30.0),
+            start_method=settings.get("start_method", "spawn")
+        )
+    return _file_executor
+
+
+def shutdown_file_executor():
+    """关闭文件处理执行器（应用关闭时调用）"""
+    global _file_executor
+    if _file_executor is not None:
+        _file_executor.shutdown()
+    _file_executor = None
@@ -0,0 +1,208 @@
+"""
+对冲请求 - 主请求在p95延迟内未返回（流式为未收到首个分段）时发送副本，取先完成者并取消另一个
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from config import Config
+
+
+class LatencyTracker:
+    """滑动窗口延迟统计"""
+
+    def __init__(self, window: int = 500):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+class HedgePolicy:
+    """对冲策略：延迟阈值取自滑动窗口分位数，副本请求受额外负载比例限制（令牌桶）"""
+
+    def __init__(self, percentile: float = 95, min_samples: int = 20, initial_delay: float = 2.0,
+                 min_delay: float = 0.05, max_hedge_ratio: float = 0.1, window: int = 500):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.window = window
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._budget = 1.0
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "budget_denied": 0
+        }
+
+    def tracker(self, key: str) -> LatencyTracker:
+        with self._lock:
+            if key not in self._trackers:
+                self._trackers[key] = LatencyTracker(self.window)
+            return self._trackers[key]
+
+    def delay(self, key: str) -> float:
+        """对冲等待时间：样本足够时取分位数，否则取初始值"""
+        tracker = self.tracker(key)
+        if len(tracker) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self._counters[name] += value
+
+    def _accrue(self):
+        """每个请求为预算积累max_hedge_ratio，发送一次副本消耗1，从而限制额外负载比例"""
+        with self._lock:
+            self._counters["requests"] += 1
+            self._budget = min(self._budget + self.max_hedge_ratio, max(1.0, self.max_hedge_ratio * 10))
+
+    def _try_spend(self) -> bool:
+        with self._lock:
+            if self._budget >= 1.0:
+                self._budget -= 1.0
+                self._counters["hedged"] += 1
+                return True
+            self._counters["budget_denied"] += 1
+            return False
+
+    async def run(self, fn: Callable[[], Awaitable[Any]], key: str, enabled: bool = True) -> Any:
+        """
+        执行调用；enabled为False时直接调用且不记录延迟（未开启对冲的调用不应影响其他调用的阈值）
+        key应区分调用类型（智能体、模型、输出长度档位），只有成功的调用计入延迟样本
+        """
+        if not enabled:
+            return await fn()
+        start = time.perf_counter()
+
+        self._accrue()
+        primary = asyncio.ensure_future(fn())
+        hedge: Optional["asyncio.Task"] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay(key))
+            if not done and self._try_spend():
+                hedge = asyncio.ensure_future(fn())
+            winner = await self._first_success({primary, hedge} - {None})
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        if hedge is not None:
+            self._record(**{"hedge_wins" if winner is hedge else "primary_wins": 1})
+        if winner.exception() is None:
+            self.tracker(key).record(time.perf_counter() - start)
+        return winner.result()
+
+    @staticmethod
+    async def _first_success(tasks: Set["asyncio.Task"]) -> "asyncio.Task":
+        """返回最先成功完成的任务；全部失败时返回最后失败的任务"""
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task
+            if not pending:
+                return done.pop()
+
+    async def stream(self, factory: Callable[[], AsyncIterator[str]], key: str,
+                     enabled: bool = True) -> AsyncIterator[str]:
+        """流式对冲：首个分段在阈值内未到达时发送副本流，取先产出首个分段的流"""
+        start = time.perf_counter()
+        primary = self._start_stream(factory)
+        streams = [primary]
+        winner: Optional[Tuple[AsyncIterator[str], "asyncio.Task"]] = None
+        try:
+            if enabled:
+                self._accrue()
+                done, _ = await asyncio.wait({primary[1]}, timeout=self.delay(key))
+                if not done and self._try_spend():
+                    streams.append(self._start_stream(factory))
+            first_tasks = {task: (iterator, task) for iterator, task in streams}
+            winner_task = await self._first_success(set(first_tasks))
+            winner = first_tasks[winner_task]
+        finally:
+            for iterator, task in streams:
+                if winner is None or iterator is not winner[0]:
+                    await self._close_stream(iterator, task)
+
+        if len(streams) > 1:
+            self._record(**{"hedge_wins" if winner[0] is streams[1][0] else "primary_wins": 1})
+
+        iterator, task = winner
+        try:
+            try:
+                first_chunk = task.result()
+            except StopAsyncIteration:
+                return
+            if enabled:
+                self.tracker(key).record(time.perf_counter() - start)
+            yield first_chunk
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            await iterator.aclose()
+
+    @staticmethod
+    def _start_stream(factory: Callable[[], AsyncIterator[str]]) -> Tuple[AsyncIterator[str], "asyncio.Task"]:
+        iterator = factory()
+        return iterator, asyncio.ensure_future(iterator.__anext__())
+
+    @staticmethod
+    async def _close_stream(iterator: AsyncIterator[str], task: "asyncio.Task"):
+        """取消未采用的流并释放其上游连接"""
+        if not task.done():
+            task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await iterator.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """对冲率与副本胜出率"""
+        with self._lock:
+            counters = dict(self._counters)
+            trackers = dict(self._trackers)
+        counters["hedge_rate"] = counters["hedged"] / counters["requests"] if counters["requests"] else 0.0
+        counters["win_rate"] = counters["hedge_wins"] / counters["hedged"] if counters["hedged"] else 0.0
+        counters["delays"] = {key: self.delay(key) for key in trackers}
+        return counters
+
+
+_hedge_policy: Optional[HedgePolicy] = None
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """获取进程内共享的对冲策略"""
+    global _hedge_policy
+    if _hedge_policy is None:
+        settings = Config.HEDGING
+        _hedge_policy = HedgePolicy(
+            percentile=settings.get("percentile", 95),
+            min_samples=settings.get("min_samples", 20),
+            initial_delay=settings.get("initial_delay", 2.0),
+            min_delay=settings.get("min_delay", 0.05),
+            max_hedge_ratio=settings.get("max_hedge_ratio", 0.1),
+            window=settings.get("window", 500)
+        )
+    return _hedge_policy
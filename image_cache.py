@@ -0,0 +1,157 @@
+"""
+图片近似去重缓存 - 以感知哈希（pHash/dHash）+ 归一化症状描述为键，
+重新压缩、轻微缩放后的同一张照片在汉明距离阈值内直接复用已生成的回答；
+未填写症状的请求不读写缓存（否则不同患者的相似照片会共用同一个空症状桶）
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from cache import hash_text, normalize_text
+from config import Config
+
+
+@lru_cache(maxsize=4)
+def _dct_matrix(n: int) -> np.ndarray:
+    """正交DCT-II变换矩阵"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).flatten()).tobytes(), "big")
+
+
+def phash(image: Image.Image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """感知哈希：灰度缩小到32x32，取二维DCT左上角8x8低频系数与中位数比较"""
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(image.convert("L").resize((size, size), Image.Resampling.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low))
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """差值哈希：灰度缩小到9x8，比较相邻像素亮度"""
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+HASH_FUNCTIONS = {"phash": phash, "dhash": dhash}
+
+
+def perceptual_hash(image: Image.Image, algorithm: str = "phash") -> int:
+    """按配置的算法计算64位感知哈希"""
+    return HASH_FUNCTIONS[algorithm](image)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class PerceptualHashCache:
+    """近似图片缓存：按症状分桶，桶内按汉明距离查找最近的图片；全局LRU + TTL淘汰"""
+
+    def __init__(self, max_distance: int = 4, max_entries: int = 2048, ttl: float = 3600):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (症状摘要, 图片哈希) -> (过期时间, 回答)
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Any]]" = OrderedDict()
+        # 症状摘要 -> 该症状下的图片哈希集合
+        self._buckets: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "skipped_no_symptoms": 0}
+
+    @staticmethod
+    def symptoms_key(symptoms: str) -> Optional[str]:
+        """症状摘要；归一化后为空时返回None（不缓存）"""
+        normalized = normalize_text(symptoms or "")
+        return hash_text(normalized) if normalized else None
+
+    def _remove(self, key: Tuple[str, int]):
+        del self._entries[key]
+        bucket = self._buckets.get(key[0])
+        if bucket is not None:
+            bucket.discard(key[1])
+            if not bucket:
+                del self._buckets[key[0]]
+
+    def get(self, image_hash: int, symptoms: str) -> Optional[Any]:
+        """查找症状相同且图片哈希距离不超过阈值的缓存回答（取距离最近的一条）；未填写症状时不查找"""
+        symptoms_key = self.symptoms_key(symptoms)
+        now = time.time()
+        with self._lock:
+            if symptoms_key is None:
+                self._counters["skipped_no_symptoms"] += 1
+                return None
+            best: Optional[Tuple[int, Tuple[str, int]]] = None
+            for candidate in list(self._buckets.get(symptoms_key, ())):
+                key = (symptoms_key, candidate)
+                if self._entries[key][0] < now:
+                    self._remove(key)
+                    continue
+                distance = hamming_distance(image_hash, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, key)
+
+            if best is None:
+                self._counters["misses"] += 1
+                return None
+            distance, key = best
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            if distance > 0:
+                self._counters["near_hits"] += 1
+            return self._entries[key][1]
+
+    def set(self, image_hash: int, symptoms: str, value: Any):
+        symptoms_key = self.symptoms_key(symptoms)
+        if symptoms_key is None:
+            return
+        key = (symptoms_key, image_hash)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._buckets.setdefault(key[0], set()).add(image_hash)
+            self._counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计（near_hits为图片不完全相同但在距离阈值内的命中）"""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        counters["max_distance"] = self.max_distance
+        return counters
+
+
+_image_cache: Optional[PerceptualHashCache] = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> PerceptualHashCache:
+    """获取进程内共享的图片近似缓存"""
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                settings = Config.IMAGE_CACHE
+                _image_cache = PerceptualHashCache(
+                    max_distance=settings.get("max_distance", 4),
+                    max_entries=settings.get("max_entries", 2048),
+                    ttl=settings.get("ttl", 3600)
+                )
+    return _image_cache
@@ -0,0 +1,242 @@
+"""
+本地意图分类器 - 在调用大模型意图识别之前的快速通道
+规则匹配 + 字符n-gram线性模型（多分类逻辑回归），高置信度输入无需请求大模型
+"""
+import json
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+
+# 分类标签：与IntentRecognitionAgent的输出保持一致
+TRIAGE = "智能分诊智能体"
+SELF_DIAGNOSIS = "症状自诊智能体"
+CASE_GENERATION = "病例生成智能体"
+NON_MEDICAL = "闲聊"
+
+LABELS = [TRIAGE, SELF_DIAGNOSIS, CASE_GENERATION, NON_MEDICAL]
+
+# 医学锚点：症状、身体部位、疾病相关词；通用问法（“怎么回事”“什么原因导致”）须同时出现锚点才算医疗意图
+# 不收录常用于非医疗语境的词（如“发热”可指设备发热、“炎热”指天气）
+MEDICAL_ANCHOR = re.compile(
+    r"[痛疼痒肿咳喘泻晕疹癌]|炎(?!热)|发烧|低烧|高烧|发麻|麻木|呕吐|想吐|恶心|出血|贫血|便血|尿血|血压|血糖|"
+    r"感冒|过敏|肿瘤|症状|疾病|乏力|心慌|心悸|胸闷|气短|失眠|便秘|拉肚子|月经|尿|出汗|"
+    r"皮肤|关节|伤口|胸口|肚子|腹部|胃|肠|肝|肾|肺|腰|颈椎|喉咙|嗓子|眼睛|耳朵|鼻子|牙|骨头|心脏"
+)
+
+# 规则：(正则, 标签, 是否需要医学锚点)，命中即视为高置信度
+RULES: List[Tuple[re.Pattern, str, bool]] = [
+    (re.compile(r"(看|挂|去)(什么|哪个|哪一?个?)(科室|号)|挂什么号|挂号.*(科室|哪)|(属于|该去|应该去)哪个?科室"), TRIAGE, False),
+    # 单独的“科”可能是“科幻”“科技馆”“科普”的首字，须同时出现医学锚点
+    (re.compile(r"(看|挂|去)(什么|哪个|哪一?个?)科|挂号.*科|(属于|该去|应该去)哪个?科"), TRIAGE, True),
+    (re.compile(r"(整理|生成|写|出|形成|做)(一下|一份|一个)?.{0,6}(病历|病例)|(病历|病例)(整理|生成|摘要|模板)"), CASE_GENERATION, False),
+    (re.compile(r"(可能|会不会|是不是)(是|得了|患了)?(什么|啥)?(病|疾病)(?!毒)"), SELF_DIAGNOSIS, False),
+    (re.compile(r"(可能|会不会|是不是)(是|得了|患了)?(什么|啥)?问题|怎么(回事|治疗?)|什么原因(引起|导致)?"), SELF_DIAGNOSIS, True),
+    (re.compile(r"^(你好|您好|hi|hello|嗨|早上好|晚上好|谢谢|再见)[!！。.,，~]*$", re.IGNORECASE), NON_MEDICAL, False),
+]
+
+# 内置训练语料，可通过Config.INTENT_FAST_PATH["training_data"]追加JSONL语料
+SEED_CORPUS: List[Tuple[str, str]] = [
+    ("我头痛发烧，应该看什么科？", TRIAGE),
+    ("肚子疼去医院挂什么号", TRIAGE),
+    ("孩子咳嗽要挂哪个科室", TRIAGE),
+    ("眼睛红肿应该去眼科还是皮肤科", TRIAGE),
+    ("胸口闷痛该挂心内科吗", TRIAGE),
+    ("腰疼挂骨科还是康复科", TRIAGE),
+    ("月经不调去哪个科看", TRIAGE),
+    ("牙龈出血看什么科室", TRIAGE),
+    ("失眠应该挂神经内科还是精神科", TRIAGE),
+    ("尿频尿急去医院挂哪个科", TRIAGE),
+    ("推荐一下就诊科室", TRIAGE),
+    ("我该去哪个科室就诊", TRIAGE),
+    ("我最近总是头痛，可能是什么病？", SELF_DIAGNOSIS),
+    ("发烧三天了还咳嗽是怎么回事", SELF_DIAGNOSIS),
+    ("最近老是胃疼还反酸，是不是胃炎", SELF_DIAGNOSIS),
+    ("皮肤起了很多红疹子很痒，是什么原因", SELF_DIAGNOSIS),
+    ("经常头晕乏力可能是贫血吗", SELF_DIAGNOSIS),
+    ("膝盖疼了一个月，上下楼更疼", SELF_DIAGNOSIS),
+    ("拉肚子一天五六次，怎么治疗", SELF_DIAGNOSIS),
+    ("晚上睡觉出汗多，还心慌", SELF_DIAGNOSIS),
+    ("喉咙痛吞咽困难，有点发热", SELF_DIAGNOSIS),
+    ("我的症状是胸闷气短，帮我分析一下", SELF_DIAGNOSIS),
+    ("血压有点高还头疼，需要吃药吗", SELF_DIAGNOSIS),
+    ("小便有泡沫是肾有问题吗", SELF_DIAGNOSIS),
+    ("帮我整理一下病历信息", CASE_GENERATION),
+    ("根据我说的情况生成一份病历", CASE_GENERATION),
+    ("帮我写一份结构化病历", CASE_GENERATION),
+    ("把我的病情整理成病例", CASE_GENERATION),
+    ("生成病历：男，45岁，反复咳嗽两周", CASE_GENERATION),
+    ("我想把既往史和现病史整理一下", CASE_GENERATION),
+    ("请按主诉现病史的格式记录我的病情", CASE_GENERATION),
+    ("帮忙做个病历摘要", CASE_GENERATION),
+    ("整理就诊记录给医生看", CASE_GENERATION),
+    ("今天天气怎么样？", NON_MEDICAL),
+    ("给我讲个笑话吧", NON_MEDICAL),
+    ("你是谁", NON_MEDICAL),
+    ("推荐一部好看的电影", NON_MEDICAL),
+    ("周末去哪里玩比较好", NON_MEDICAL),
+    ("帮我写一首关于春天的诗", NON_MEDICAL),
+    ("Python怎么读取文件", NON_MEDICAL),
+    ("今天星期几", NON_MEDICAL),
+    ("你会做什么", NON_MEDICAL),
+    ("晚饭吃什么好呢", NON_MEDICAL),
+    ("明天会下雨吗", NON_MEDICAL),
+    ("谢谢你的帮助", NON_MEDICAL),
+]
+
+
+def _normalize(text: str) -> str:
+    """文本归一化：去空白、转小写"""
+    return re.sub(r"\s+", "", text).lower()
+
+
+def _char_ngrams(text: str, n_min: int = 1, n_max: int = 3) -> Dict[str, float]:
+    """提取字符n-gram特征（带首尾边界符）"""
+    text = f"^{_normalize(text)}$"
+    features: Dict[str, float] = {}
+    for n in range(n_min, n_max + 1):
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            features[gram] = features.get(gram, 0.0) + 1.0
+    # L2归一化，避免长文本得分被放大
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {k: v / norm for k, v in features.items()}
+
+
+class CharNgramLinearModel:
+    """字符n-gram多分类逻辑回归（稀疏权重，纯Python实现）"""
+
+    def __init__(self, labels: List[str], epochs: int = 60, learning_rate: float = 0.5, l2: float = 1e-4):
+        self.labels = labels
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.weights: Dict[str, Dict[str, float]] = {label: {} for label in labels}
+        self.bias: Dict[str, float] = {label: 0.0 for label in labels}
+
+    def _scores(self, features: Dict[str, float]) -> Dict[str, float]:
+        scores = {}
+        for label in self.labels:
+            w = self.weights[label]
+            scores[label] = self.bias[label] + sum(w.get(f, 0.0) * v for f, v in features.items())
+        return scores
+
+    @staticmethod
+    def _softmax(scores: Dict[str, float]) -> Dict[str, float]:
+        top = max(scores.values())
+        exps = {k: math.exp(v - top) for k, v in scores.items()}
+        total = sum(exps.values())
+        return {k: v / total for k, v in exps.items()}
+
+    def fit(self, samples: List[Tuple[str, str]]):
+        """随机梯度下降训练（固定顺序，结果可复现）"""
+        data = [(_char_ngrams(text), label) for text, label in samples if label in self.weights]
+        for epoch in range(self.epochs):
+            lr = self.learning_rate / (1.0 + epoch * 0.1)
+            for features, target in data:
+                probs = self._softmax(self._scores(features))
+                for label in self.labels:
+                    grad = probs[label] - (1.0 if label == target else 0.0)
+                    w = self.weights[label]
+                    for f, v in features.items():
+                        w[f] = w.get(f, 0.0) * (1.0 - lr * self.l2) - lr * grad * v
+                    self.bias[label] -= lr * grad
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """返回各标签概率"""
+        return self._softmax(self._scores(_char_ngrams(text)))
+
+
+class LocalIntentClassifier:
+    """本地意图分类器：规则 -> 线性模型，低置信度时交由大模型处理"""
+
+    def __init__(self, threshold: Optional[float] = None, extra_samples: Optional[List[Tuple[str, str]]] = None):
+        settings = Config.INTENT_FAST_PATH
+        self.enabled = settings.get("enabled", True)
+        self.threshold = threshold if threshold is not None else settings.get("threshold", 0.85)
+        self.model = CharNgramLinearModel(LABELS)
+        self.model.fit(SEED_CORPUS + (extra_samples or []))
+        self._lock = threading.Lock()
+        self._counters = {"total": 0, "rule_hits": 0, "model_hits": 0, "fallbacks": 0}
+
+    @staticmethod
+    def to_intent(label: str) -> Dict[str, str]:
+        """将标签转换为意图识别智能体的输出格式"""
+        if label == NON_MEDICAL:
+            return {"非医疗意图": ""}
+        return {"医疗意图": label}
+
+    def match_rules(self, text: str) -> Optional[str]:
+        """规则匹配，命中返回标签"""
+        normalized = _normalize(text)
+        for pattern, label, needs_anchor in RULES:
+            if pattern.search(normalized) and (not needs_anchor or MEDICAL_ANCHOR.search(normalized)):
+                return label
+        return None
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """各标签概率（规则命中时该标签概率为1）"""
+        label = self.match_rules(text)
+        if label is not None:
+            return {k: (1.0 if k == label else 0.0) for k in LABELS}
+        return self.model.predict_proba(text)
+
+    def classify(self, text: str) -> Optional[Dict[str, str]]:
+        """快速分类：置信度达到阈值时返回意图结果，否则返回None（回退到大模型）"""
+        if not self.enabled:
+            return None
+
+        label = self.match_rules(text)
+        source = "rule_hits"
+        if label is None:
+            probs = self.model.predict_proba(text)
+            best = max(probs, key=probs.get)
+            if probs[best] >= self.threshold:
+                label = best
+                source = "model_hits"
+
+        with self._lock:
+            self._counters["total"] += 1
+            self._counters[source if label is not None else "fallbacks"] += 1
+
+        return self.to_intent(label) if label is not None else None
+
+    def stats(self) -> Dict[str, float]:
+        """快速通道命中统计"""
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters["rule_hits"] + counters["model_hits"]
+        counters["hit_rate"] = hits / counters["total"] if counters["total"] else 0.0
+        counters["threshold"] = self.threshold
+        return counters
+
+
+def _load_training_data(path: str) -> List[Tuple[str, str]]:
+    """加载JSONL训练语料：每行{"text": ..., "label": ...}"""
+    samples = []
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    item = json.loads(line)
+                    samples.append((item["text"], item["label"]))
+    return samples
+
+
+_classifier: Optional[LocalIntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_local_intent_classifier() -> LocalIntentClassifier:
+    """获取进程内共享的本地意图分类器（首次调用时训练）"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                extra = _load_training_data(Config.INTENT_FAST_PATH.get("training_data", ""))
+                _classifier = LocalIntentClassifier(extra_samples=extra)
+    return _classifier
@@ -1,15 +1,40 @@
 """
 医疗智能体后端主程序
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Optional, Dict, Any, Tuple
+import asyncio
+import hmac
 import uvicorn
 
-from agents import AgentFactory
-from utils import FileProcessor, ResponseFormatter, validate_file_type, validate_file_size
+from agents import AgentFactory, report_pipeline_stats
+from utils import (
+    FileProcessor, ResponseFormatter, validate_file_type, get_http_client, close_http_client,
+    image_pipeline_stats, pdf_extraction_stats
+)
 from config import Config
+from intent_classifier import get_local_intent_classifier
+from speculative import LABEL_AGENTS, SpeculativeRouter
+from cache import get_response_cache
+from semantic_cache import semantic_cache_stats
+from concurrency import get_rate_limiter, get_single_flight
+from resilience import circuit_breaker_states
+from hedging import get_hedge_policy
+from cancellation import get_cancellation_tracker, run_until_disconnect
+from executors import get_file_executor, shutdown_file_executor
+from uploads import SpooledUpload, UploadSizeLimitMiddleware, UploadTooLarge, spool_upload, upload_stats
+from document_cache import get_document_cache
+from image_cache import get_image_cache
+from admission import AdmissionRejected, admission_controlled, get_admission_controller
+from metrics import ERRORS, STAGE_SECONDS, MetricsMiddleware, get_metrics_registry, timed
+from tracing import TracingMiddleware, get_tracer, shutdown_tracer
+from token_budget import UsageContextMiddleware, get_adaptive_max_tokens, get_token_ledger
+from profiling import ProfilerBusy, SlowRequestMiddleware, get_profiler, get_slow_request_log, render_collapsed
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -18,6 +43,13 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# 上传大小限制：请求体超过文件上限（加表单开销）时立即返回413
+# 在CORS之前注册（位于CORS内层），413响应同样带有CORS响应头
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=Config.MAX_FILE_SIZE + Config.UPLOAD["form_overhead"]
+)
+
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +59,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录当前接口，上游token用量据此按接口统计
+app.add_middleware(UsageContextMiddleware)
+
+# 链路追踪（根span覆盖整个请求）
+if Config.TRACING["enabled"]:
+    app.add_middleware(TracingMiddleware)
+
+# 慢请求记录（在链路追踪之外，可读取链路追踪回传的请求ID）
+if Config.PROFILING["enabled"]:
+    app.add_middleware(SlowRequestMiddleware, routes=Config.PROFILING["slow_request_routes"])
+
+# 请求指标（最后注册即最外层，耗时包含其余全部中间件；413等由中间件直接返回的响应同样计入）
+if Config.METRICS["enabled"]:
+    app.add_middleware(MetricsMiddleware)
+
+_metrics = get_metrics_registry()
+_executor_gauge = _metrics.gauge("medical_agent_file_executor_jobs", "文件处理执行器中排队/执行中的任务数", ["state"])
+_admission_gauge = _metrics.gauge("medical_agent_admission_requests", "准入控制中执行中/排队的请求数", ["state"])
+
+
+def collect_runtime_gauges():
+    """导出指标前刷新执行器与准入控制的瞬时值"""
+    executor = get_file_executor().stats()
+    _executor_gauge.set(executor["queue_depth"], state="queued")
+    _executor_gauge.set(executor["running"], state="running")
+    admission = get_admission_controller().stats()
+    _admission_gauge.set(admission["queue_depth"], state="queued")
+    _admission_gauge.set(admission["in_flight"], state="in_flight")
+
+
+_metrics.register_collector(collect_runtime_gauges)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """过载时快速失败：503 + Retry-After"""
+    ERRORS.inc(component="admission", type=exc.reason)
+    return JSONResponse(
+        status_code=503,
+        content=ResponseFormatter.error_response(str(exc), 503),
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.on_event("startup")
+async def startup_event():
+    """应用启动：预热共享HTTP连接池与文件处理执行器、训练本地意图分类器并创建智能体单例"""
+    get_http_client()
+    get_file_executor().executor()
+    get_local_intent_classifier()
+    AgentFactory.initialize()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭：释放共享HTTP连接池与文件处理执行器，导出剩余span并保存token用量"""
+    await close_http_client()
+    shutdown_file_executor()
+    shutdown_tracer()
+    get_token_ledger().close()
+
+
 # 请求模型
 class ChatRequest(BaseModel):
     """聊天请求模型"""
@@ -54,8 +147,84 @@ async def root():
     )
 
 
+# 医疗意图 -> (智能体类型, 智能体名称)
+MEDICAL_INTENT_AGENTS = {
+    "智能分诊智能体": "triage",
+    "症状自诊智能体": "self_diagnosis",
+    "病例生成智能体": "case_generation",
+}
+
+
+def route_intent(intent_data: Dict[str, Any]) -> Tuple[str, str]:
+    """根据意图识别结果选择下游智能体，返回(智能体类型, 智能体名称)"""
+    if "非医疗意图" in intent_data:
+        return "chat", "闲聊智能体"
+    
+    if "医疗意图" in intent_data:
+        medical_type = intent_data["医疗意图"]
+        if medical_type in MEDICAL_INTENT_AGENTS:
+            return MEDICAL_INTENT_AGENTS[medical_type], medical_type
+        raise ValueError(f"未识别的医疗意图类型: {medical_type}")
+    
+    raise ValueError("意图识别结果格式错误")
+
+
+medical_chat_router = SpeculativeRouter("medical_chat", route_intent)
+
+
+def medical_chat_admission_route(request: ChatRequest, **kwargs) -> str:
+    """准入优先级：用本地分类器预测最可能的下游智能体（分诊优先，闲聊最先被丢弃）"""
+    probs = get_local_intent_classifier().predict_proba(request.message)
+    return LABEL_AGENTS[max(probs, key=probs.get)]
+
+
+def sse_response(events: AsyncIterator[str], background: Optional[BackgroundTask] = None) -> StreamingResponse:
+    """构造text/event-stream响应（background在响应结束后执行）"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background
+    )
+
+
+async def stream_agent_events(
+    agent_key: str,
+    agent_input: Any,
+    meta: Optional[Dict[str, Any]] = None,
+    on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    method: str = "process_stream",
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    将智能体流式输出包装为SSE事件：meta -> delta... -> done / error
+    完整输出通过on_complete异步回调；method为智能体的流式方法名
+    """
+    agent = AgentFactory.create_agent(agent_key)
+    if meta is not None:
+        yield ResponseFormatter.sse_event("meta", meta)
+    
+    try:
+        chunks = []
+        with timed(f"agent.{agent_key}"):
+            async for content in getattr(agent, method)(agent_input, **kwargs):
+                chunks.append(content)
+                yield ResponseFormatter.sse_event("delta", {"content": content})
+        
+        result = {agent.result_key: "".join(chunks)}
+        if on_complete is not None:
+            await on_complete(result[agent.result_key])
+        if meta is not None:
+            result = {**meta, "response": result}
+        yield ResponseFormatter.sse_event("done", ResponseFormatter.success_response(result))
+        
+    except Exception as e:
+        yield ResponseFormatter.sse_event("error", ResponseFormatter.error_response(str(e)))
+
+
 @app.post("/api/medical-chat")
-async def medical_chat(request: ChatRequest):
+@admission_controlled("medical_chat", medical_chat_admission_route)
+async def medical_chat(request: ChatRequest, http_request: Request):
     """
     主入口：医疗智能体聊天接口
     支持意图识别 -> 智能分诊/症状自诊/病例生成/闲聊
@@ -65,45 +234,19 @@ async def medical_chat(request: ChatRequest):
         if not user_message:
             return ResponseFormatter.error_response("请输入有效的消息内容")
         
-        # 步骤1：意图识别
-        intent_agent = AgentFactory.create_agent("intent_recognition")
-        intent_result = await intent_agent.process(user_message)
+        # 意图识别 -> 下游智能体（开启推测模式时两者并行）
+        try:
+            intent_result, agent_type, final_result = await run_until_disconnect(
+                http_request, medical_chat_router.dispatch(user_message)
+            )
+        except ValueError as e:
+            return ResponseFormatter.error_response(str(e))
         
         if not intent_result["success"]:
             return intent_result
         
         intent_data = intent_result["data"]
         
-        # 步骤2：根据意图调用对应智能体
-        if "非医疗意图" in intent_data:
-            # 调用闲聊智能体
-            chat_agent = AgentFactory.create_agent("chat")
-            final_result = await chat_agent.process(user_message)
-            agent_type = "闲聊智能体"
-            
-        elif "医疗意图" in intent_data:
-            medical_type = intent_data["医疗意图"]
-            
-            if medical_type == "智能分诊智能体":
-                triage_agent = AgentFactory.create_agent("triage")
-                final_result = await triage_agent.process(user_message)
-                agent_type = "智能分诊智能体"
-                
-            elif medical_type == "症状自诊智能体":
-                diagnosis_agent = AgentFactory.create_agent("self_diagnosis")
-                final_result = await diagnosis_agent.process(user_message)
-                agent_type = "症状自诊智能体"
-                
-            elif medical_type == "病例生成智能体":
-                case_agent = AgentFactory.create_agent("case_generation")
-                final_result = await case_agent.process(user_message)
-                agent_type = "病例生成智能体"
-                
-            else:
-                return ResponseFormatter.error_response(f"未识别的医疗意图类型: {medical_type}")
-        else:
-            return ResponseFormatter.error_response("意图识别结果格式错误")
-        
         # 返回最终结果
         return ResponseFormatter.success_response({
             "intent_recognition": intent_data,
@@ -115,51 +258,223 @@ async def medical_chat(request: ChatRequest):
         return ResponseFormatter.error_response(f"处理失败: {str(e)}")
 
 
-@app.post("/api/report-interpretation")
-async def report_interpretation(file: UploadFile = File(...)):
+@app.post("/api/medical-chat/stream")
+@admission_controlled("medical_chat", medical_chat_admission_route)
+async def medical_chat_stream(request: ChatRequest):
     """
-    独立接口：报告解读智能体
-    上传office文件并解读医学报告
+    主入口（流式）：意图识别完成后以SSE逐段返回下游智能体输出
     """
-    try:
-        # 验证文件类型
-        if not validate_file_type(file.filename, "document"):
-            return ResponseFormatter.error_response("不支持的文件类型，请上传Word或PDF文件")
-        
-        # 读取文件内容
-        file_content = await file.read()
-        
-        # 验证文件大小
-        if not validate_file_size(len(file_content)):
-            return ResponseFormatter.error_response(f"文件大小超过限制 ({Config.MAX_FILE_SIZE / 1024 / 1024}MB)")
+    user_message = request.message.strip()
+    if not user_message:
+        return ResponseFormatter.error_response("请输入有效的消息内容")
+    
+    async def events() -> AsyncIterator[str]:
+        intent_agent = AgentFactory.create_agent("intent_recognition")
+        with timed("intent"):
+            intent_result = await intent_agent.process(user_message)
+        if not intent_result["success"]:
+            yield ResponseFormatter.sse_event("error", intent_result)
+            return
         
-        # 提取文本
-        file_ext = file.filename.split('.')[-1].lower()
+        intent_data = intent_result["data"]
+        try:
+            agent_key, agent_type = route_intent(intent_data)
+        except ValueError as e:
+            yield ResponseFormatter.sse_event("error", ResponseFormatter.error_response(str(e)))
+            return
         
+        meta = {"intent_recognition": intent_data, "agent_type": agent_type}
+        async for event in stream_agent_events(agent_key, user_message, meta=meta):
+            yield event
+    
+    return sse_response(events())
+
+
+async def receive_report(file: UploadFile) -> Tuple[Optional[SpooledUpload], Optional[str]]:
+    """接收上传的报告（分块读取并计算内容哈希），返回(上传文件, 错误信息)"""
+    # 验证文件类型
+    if not validate_file_type(file.filename, "document"):
+        return None, "不支持的文件类型，请上传Word或PDF文件"
+    
+    # 分块读取文件内容（超过大小限制时立即中止）
+    try:
+        return await spool_upload(file), None
+    except UploadTooLarge as e:
+        return None, str(e)
+
+
+async def extract_report_text(upload: SpooledUpload, filename: str) -> Tuple[Optional[str], Optional[str]]:
+    """提取报告文本（相同内容的报告直接复用已提取的文本），返回(报告文本, 错误信息)"""
+    document_cache = get_document_cache()
+    if document_cache is not None:
+        cached = await asyncio.to_thread(document_cache.get_text, upload.sha256)
+        if cached is not None:
+            return cached, None
+    
+    # 提取文本
+    file_ext = filename.split('.')[-1].lower()
+    
+    if file_ext not in ('docx', 'pdf', 'txt'):
+        return None, "不支持的文件格式"
+    with timed(f"parse.{file_ext}"):
         if file_ext == 'docx':
-            report_text = FileProcessor.extract_text_from_docx(file_content)
+            report_text = await get_file_executor().run(FileProcessor.extract_text_from_docx, upload.source)
         elif file_ext == 'pdf':
-            report_text = FileProcessor.extract_text_from_pdf(file_content)
-        elif file_ext == 'txt':
-            report_text = file_content.decode('utf-8', errors='ignore')
+            report_text = await get_file_executor().run(FileProcessor.extract_text_from_pdf, upload.source)
         else:
-            return ResponseFormatter.error_response("不支持的文件格式")
+            report_text = upload.read_bytes().decode('utf-8', errors='ignore')
+    
+    if not report_text.strip():
+        return None, "文件内容为空或无法解析"
+    
+    if document_cache is not None:
+        await asyncio.to_thread(document_cache.set_text, upload.sha256, report_text)
+    return report_text, None
+
+
+def incremental_report(filename: str) -> bool:
+    """PDF报告是否边解析边解读"""
+    return filename.lower().endswith(".pdf") and Config.PDF_EXTRACTION.get("incremental", True)
+
+
+async def iter_report_pages(upload: SpooledUpload) -> AsyncIterator[str]:
+    """
+    在执行器中分批提取PDF页面并逐页产出，每批提取完成即可交给报告解读，无需等待整份文档解析完成
+    已缓存文本的报告直接整体产出；结束后关闭上传文件
+    """
+    document_cache = get_document_cache()
+    try:
+        cached = await asyncio.to_thread(document_cache.get_text, upload.sha256) if document_cache is not None else None
+        if cached is not None:
+            yield cached
+            return
         
-        if not report_text.strip():
-            return ResponseFormatter.error_response("文件内容为空或无法解析")
+        pages = []
+        start_page, chars = 0, 0
+        while start_page is not None:
+            with timed("parse.pdf_batch"):
+                batch = await get_file_executor().run(
+                    FileProcessor.extract_pdf_pages, upload.source, start_page,
+                    Config.PDF_EXTRACTION.get("batch_pages", 8), chars
+                )
+            summary = batch["summary"]
+            pdf_extraction_stats.record(summary, document=start_page == 0)
+            for _, page_text in batch["pages"]:
+                pages.append(page_text)
+                yield page_text
+            chars += summary["chars"]
+            start_page = summary["next_page"]
+        
+        if not pages:
+            raise Exception("文件内容为空或无法解析")
+        if document_cache is not None:
+            await asyncio.to_thread(document_cache.set_text, upload.sha256, "\n".join(pages))
+    finally:
+        upload.close()
+
+
+async def cached_report_result(upload: SpooledUpload, agent) -> Optional[str]:
+    """同一份报告的已缓存解读结果（SQLite读写在线程中执行，不阻塞事件循环）"""
+    document_cache = get_document_cache()
+    if document_cache is None:
+        return None
+    return await asyncio.to_thread(document_cache.get_result, upload.sha256, agent)
+
+
+async def store_report_result(content_hash: str, agent, result: str):
+    """缓存报告解读结果"""
+    document_cache = get_document_cache()
+    if document_cache is not None:
+        await asyncio.to_thread(document_cache.set_result, content_hash, agent, result)
+
+
+async def cached_events(agent, result: str) -> AsyncIterator[str]:
+    """以SSE事件返回缓存结果：delta -> done"""
+    yield ResponseFormatter.sse_event("delta", {"content": result})
+    yield ResponseFormatter.sse_event("done", ResponseFormatter.success_response({agent.result_key: result}))
+
+
+@app.post("/api/report-interpretation")
+@admission_controlled("report_interpretation")
+async def report_interpretation(http_request: Request, file: UploadFile = File(...)):
+    """
+    独立接口：报告解读智能体
+    上传office文件并解读医学报告
+    """
+    try:
+        upload, error = await receive_report(file)
+        if error:
+            return ResponseFormatter.error_response(error)
         
-        # 调用报告解读智能体
         report_agent = AgentFactory.create_agent("report_interpretation")
-        result = await report_agent.process(report_text)
+        with upload:
+            # 重复上传的报告直接返回缓存的解读，无需解析与调用大模型
+            cached = await cached_report_result(upload, report_agent)
+            if cached is not None:
+                return ResponseFormatter.success_response({report_agent.result_key: cached})
+            
+            # 调用报告解读智能体（PDF边解析边解读）
+            if incremental_report(file.filename):
+                with timed("agent.report_interpretation"):
+                    result = await run_until_disconnect(
+                        http_request, report_agent.process_pages(iter_report_pages(upload))
+                    )
+            else:
+                report_text, error = await extract_report_text(upload, file.filename)
+                if error:
+                    return ResponseFormatter.error_response(error)
+                with timed("agent.report_interpretation"):
+                    result = await run_until_disconnect(http_request, report_agent.process(report_text))
         
+        if result["success"]:
+            await store_report_result(upload.sha256, report_agent, result["data"][report_agent.result_key])
         return result
         
     except Exception as e:
         return ResponseFormatter.error_response(f"报告解读失败: {str(e)}")
 
 
+@app.post("/api/report-interpretation/stream")
+@admission_controlled("report_interpretation")
+async def report_interpretation_stream(file: UploadFile = File(...)):
+    """
+    独立接口（流式）：报告解读智能体，以SSE逐段返回解读内容
+    """
+    try:
+        upload, error = await receive_report(file)
+        if error:
+            return ResponseFormatter.error_response(error)
+        
+        report_agent = AgentFactory.create_agent("report_interpretation")
+        store_result = partial(store_report_result, upload.sha256, report_agent)
+        cached = await cached_report_result(upload, report_agent)
+        if cached is not None:
+            upload.close()
+            return sse_response(cached_events(report_agent, cached))
+        
+        if incremental_report(file.filename):
+            # 上传文件在流式响应结束后才关闭（页面在响应过程中逐批提取）
+            return sse_response(
+                stream_agent_events(
+                    "report_interpretation", iter_report_pages(upload),
+                    on_complete=store_result, method="process_pages_stream"
+                ),
+                background=BackgroundTask(upload.close)
+            )
+        
+        with upload:
+            report_text, error = await extract_report_text(upload, file.filename)
+        if error:
+            return ResponseFormatter.error_response(error)
+        return sse_response(stream_agent_events("report_interpretation", report_text, on_complete=store_result))
+        
+    except Exception as e:
+        return ResponseFormatter.error_response(f"报告解读失败: {str(e)}")
+
+
 @app.post("/api/health-education")
-async def health_education(request: HealthEducationRequest):
+@admission_controlled("health_education")
+async def health_education(request: HealthEducationRequest, http_request: Request):
     """
     独立接口：健康科普智能体
     提供权威医学知识科普
@@ -171,7 +486,8 @@ async def health_education(request: HealthEducationRequest):
         
         # 调用健康科普智能体
         education_agent = AgentFactory.create_agent("health_education")
-        result = await education_agent.process(question)
+        with timed("agent.health_education"):
+            result = await run_until_disconnect(http_request, education_agent.process(question))
         
         return result
         
@@ -179,8 +495,23 @@ async def health_education(request: HealthEducationRequest):
         return ResponseFormatter.error_response(f"健康科普失败: {str(e)}")
 
 
+@app.post("/api/health-education/stream")
+@admission_controlled("health_education")
+async def health_education_stream(request: HealthEducationRequest):
+    """
+    独立接口（流式）：健康科普智能体，以SSE逐段返回科普内容
+    """
+    question = request.question.strip()
+    if not question:
+        return ResponseFormatter.error_response("请输入有效的问题")
+    
+    return sse_response(stream_agent_events("health_education", question))
+
+
 @app.post("/api/dermatology-consultation")
+@admission_controlled("dermatology")
 async def dermatology_consultation(
+    http_request: Request,
     file: UploadFile = File(...),
     symptoms: str = Form("")
 ):
@@ -193,19 +524,34 @@ async def dermatology_consultation(
         if not validate_file_type(file.filename, "image"):
             return ResponseFormatter.error_response("不支持的图片格式，请上传JPG、PNG等图片文件")
         
-        # 读取文件内容
-        file_content = await file.read()
+        # 分块读取文件内容（超过大小限制时立即中止）
+        try:
+            upload = await spool_upload(file)
+        except UploadTooLarge as e:
+            return ResponseFormatter.error_response(str(e))
         
-        # 验证文件大小
-        if not validate_file_size(len(file_content)):
-            return ResponseFormatter.error_response(f"文件大小超过限制 ({Config.MAX_FILE_SIZE / 1024 / 1024}MB)")
+        dermatology_agent = AgentFactory.create_agent("dermatology")
         
-        # 处理图片
-        image_base64 = FileProcessor.process_image_to_base64(file_content)
+        # 预处理图片（摆正、缩放到模型使用的分辨率、按目标大小编码），启用图片缓存时同时计算感知哈希
+        fingerprint = Config.IMAGE_CACHE.get("algorithm", "phash") if dermatology_agent.image_cache else None
+        with upload, timed("image.prepare") as stage:
+            image = await get_file_executor().run(
+                partial(FileProcessor.prepare_image, fingerprint=fingerprint), upload.source
+            )
+            stage.span.set_attributes(**{
+                "image.original_bytes": image["original_bytes"],
+                "image.payload_bytes": image["payload_bytes"],
+                "image.size": "x".join(map(str, image["size"]))
+            })
+        image_pipeline_stats.record(image)
+        STAGE_SECONDS.observe(image["encode_ms"] / 1000, stage="image.encode")
+        image_data = f"data:{image['mime_type']};base64,{image['data']}"
         
         # 调用皮肤病咨询智能体
-        dermatology_agent = AgentFactory.create_agent("dermatology")
-        result = await dermatology_agent.process(image_base64, symptoms)
+        with timed("agent.dermatology"):
+            result = await run_until_disconnect(
+                http_request, dermatology_agent.process(image_data, symptoms, image_hash=image["image_hash"])
+            )
         
         return result
         
@@ -214,7 +560,8 @@ async def dermatology_consultation(
 
 
 @app.post("/api/medication-consultation")
-async def medication_consultation(request: MedicationRequest):
+@admission_controlled("medication")
+async def medication_consultation(request: MedicationRequest, http_request: Request):
     """
     独立接口：药物咨询智能体
     基于药品说明书提供用药指导
@@ -226,7 +573,8 @@ async def medication_consultation(request: MedicationRequest):
         
         # 调用药物咨询智能体
         medication_agent = AgentFactory.create_agent("medication")
-        result = await medication_agent.process(question)
+        with timed("agent.medication"):
+            result = await run_until_disconnect(http_request, medication_agent.process(question))
         
         return result
         
@@ -234,10 +582,123 @@ async def medication_consultation(request: MedicationRequest):
         return ResponseFormatter.error_response(f"药物咨询失败: {str(e)}")
 
 
+@app.post("/api/medication-consultation/stream")
+@admission_controlled("medication")
+async def medication_consultation_stream(request: MedicationRequest):
+    """
+    独立接口（流式）：药物咨询智能体，以SSE逐段返回用药指导
+    """
+    question = request.question.strip()
+    if not question:
+        return ResponseFormatter.error_response("请输入有效的药物咨询问题")
+    
+    return sse_response(stream_agent_events("medication", question))
+
+
 @app.get("/api/health")
 async def health_check():
-    """健康检查接口"""
-    return ResponseFormatter.success_response({"status": "healthy"}, "服务健康")
+    """健康检查接口（包含各模型熔断器状态）"""
+    breakers = circuit_breaker_states()
+    if any(b["state"] != "closed" for b in breakers.values()):
+        return ResponseFormatter.success_response(
+            {"status": "degraded", "circuit_breakers": breakers}, "上游服务异常，部分模型熔断中"
+        )
+    return ResponseFormatter.success_response({"status": "healthy", "circuit_breakers": breakers}, "服务健康")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus指标（文本格式）"""
+    if not Config.METRICS["enabled"]:
+        raise HTTPException(status_code=404, detail="指标未启用")
+    return PlainTextResponse(get_metrics_registry().render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """运行统计信息（快速通道命中率等）"""
+    return ResponseFormatter.success_response({
+        "intent_fast_path": get_local_intent_classifier().stats(),
+        "speculative_routing": {"medical_chat": medical_chat_router.stats()},
+        "response_cache": get_response_cache().stats(),
+        "semantic_cache": semantic_cache_stats(),
+        "single_flight": get_single_flight().stats(),
+        "hedging": get_hedge_policy().stats(),
+        "rate_limit": get_rate_limiter().stats(),
+        "admission": get_admission_controller().stats(),
+        "cancellation": get_cancellation_tracker().stats(),
+        "report_pipeline": report_pipeline_stats(),
+        "file_executor": get_file_executor().stats(),
+        "uploads": upload_stats(),
+        "image_pipeline": image_pipeline_stats.stats(),
+        "image_cache": get_image_cache().stats(),
+        "document_cache": get_document_cache().stats() if get_document_cache() is not None else None,
+        "pdf_extraction": pdf_extraction_stats.stats(),
+        "tracing": get_tracer().stats() if get_tracer() is not None else None,
+        "token_usage": get_token_ledger().stats(),
+        "adaptive_max_tokens": get_adaptive_max_tokens().stats(),
+        "profiling": {
+            "profiler": get_profiler().stats(),
+            "slow_requests": get_slow_request_log().stats()
+        } if Config.PROFILING["enabled"] else None
+    })
+
+
+def require_admin(admin_token: Optional[str]):
+    """管理接口校验：未配置ADMIN_TOKEN时返回404（接口不对外暴露），令牌不匹配时返回403"""
+    expected = Config.ADMIN_TOKEN
+    if not expected:
+        raise HTTPException(status_code=404, detail="管理接口未启用")
+    if not hmac.compare_digest((admin_token or "").encode("utf-8"), expected.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+
+
+@app.get("/api/usage/daily")
+async def daily_token_usage(days: int = 7, x_admin_token: Optional[str] = Header(None)):
+    """每日token预算报告：按智能体/接口/模型的用量、预算占用与当天预计用量（需X-Admin-Token）"""
+    require_admin(x_admin_token)
+    return ResponseFormatter.success_response({
+        "daily_budget": Config.TOKEN_BUDGET["daily_tokens"] or None,
+        "days": get_token_ledger().daily_report(max(1, min(days, Config.TOKEN_BUDGET["retention_days"])))
+    })
+
+
+def require_profiling(admin_token: Optional[str]):
+    """剖析接口校验：未启用时返回404，并校验X-Admin-Token"""
+    if not Config.PROFILING["enabled"]:
+        raise HTTPException(status_code=404, detail="性能剖析未启用")
+    require_admin(admin_token)
+
+
+@app.get("/api/admin/profile")
+async def profile(seconds: float = 10.0, interval: Optional[float] = None, format: str = "collapsed",
+                  include_idle: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """
+    运行采样剖析器seconds秒（在线程中采样，事件循环照常处理请求）
+    format=collapsed返回折叠栈文本（flamegraph.pl / speedscope可直接读取），format=json返回计数与采样信息
+    注：进程池模式下文件解析在子进程中执行，不在采样范围内
+    """
+    require_profiling(x_admin_token)
+    seconds = min(max(seconds, 0.1), Config.PROFILING["max_seconds"])
+    interval = max(interval or Config.PROFILING["interval"], 0.001)
+    try:
+        result = await asyncio.to_thread(get_profiler().profile, seconds, interval, include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return ResponseFormatter.success_response(result, "剖析完成")
+    return PlainTextResponse(render_collapsed(result["stacks"]))
+
+
+@app.get("/api/admin/slow-requests")
+async def slow_requests(route: Optional[str] = None, limit: int = 50, x_admin_token: Optional[str] = Header(None)):
+    """最近的慢请求及各阶段耗时明细（新的在前）"""
+    require_profiling(x_admin_token)
+    log = get_slow_request_log()
+    return ResponseFormatter.success_response({
+        "threshold": log.threshold,
+        "requests": log.recent(route, limit)
+    })
 
 
 @app.get("/api/config")
@@ -0,0 +1,305 @@
+"""
+指标 - 以Prometheus文本格式暴露的计数器/仪表盘/直方图（不依赖prometheus_client），
+以及供各处代码使用的分阶段计时上下文timed()
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from profiling import record_stage
+from resilience import CircuitOpenError, UpstreamError
+from tracing import span
+
+# 延迟（秒）与token数的直方图分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    metric_type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数（非累积，最后一个为+Inf）, 总和, 次数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次；collector在每次导出前调用，用于刷新由其他组件统计的仪表盘"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """导出Prometheus文本格式"""
+        for collector in self._collectors:
+            collector()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取进程内共享的指标注册表"""
+    return _registry
+
+
+LLM_REQUEST_SECONDS = _registry.histogram(
+    "medical_agent_llm_request_seconds", "上游大模型调用耗时（含排队、重试与对冲）", ["agent", "model", "mode"]
+)
+LLM_TTFT_SECONDS = _registry.histogram(
+    "medical_agent_llm_ttft_seconds", "流式调用首个分段到达耗时", ["agent", "model"]
+)
+LLM_TOKENS = _registry.histogram(
+    "medical_agent_llm_tokens", "上游返回的usage token数", ["agent", "model", "kind"], buckets=TOKEN_BUCKETS
+)
+STAGE_SECONDS = _registry.histogram(
+    "medical_agent_stage_seconds", "请求处理各阶段耗时（意图识别、下游智能体、文件解析、图片编码等）", ["stage"]
+)
+FILE_JOB_SECONDS = _registry.histogram(
+    "medical_agent_file_job_seconds", "文件处理任务在执行器中的排队/执行耗时", ["job", "phase"]
+)
+HTTP_REQUEST_SECONDS = _registry.histogram(
+    "medical_agent_http_request_seconds", "HTTP请求耗时（流式响应到最后一个分段）", ["route", "method", "status"]
+)
+HTTP_IN_FLIGHT = _registry.gauge("medical_agent_http_requests_in_flight", "正在处理的HTTP请求数")
+LLM_TOKENS_TOTAL = _registry.counter(
+    "medical_agent_llm_tokens_total", "按智能体与接口累计的usage token数", ["agent", "endpoint", "kind"]
+)
+ERRORS = _registry.counter("medical_agent_errors_total", "按组件与类型统计的错误数", ["component", "type"])
+
+
+def error_type(error: BaseException) -> str:
+    """错误分类：上游HTTP状态码、熔断、超时、网络错误，其余取异常类名"""
+    if isinstance(error, UpstreamError):
+        return f"http_{error.status_code}"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "network"
+    return type(error).__name__
+
+
+def record_llm_usage(agent: str, model: str, usage: Optional[Dict[str, int]], endpoint: str = "internal"):
+    """记录上游返回的usage"""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind) is not None:
+            LLM_TOKENS.observe(usage[kind], agent=agent, model=model, kind=kind.split("_")[0])
+            LLM_TOKENS_TOTAL.inc(usage[kind], agent=agent, endpoint=endpoint, kind=kind.split("_")[0])
+
+
+class timed:
+    """
+    分阶段计时上下文：with timed("report_parse") as stage: ...
+    结束时记录到medical_agent_stage_seconds{stage}，异常退出时计入medical_agent_errors_total{component=stage}；
+    启用链路追踪时同时创建同名span（stage.span，可附加属性），在慢请求记录的路由内同时计入该请求的阶段明细
+    """
+
+    def __init__(self, stage: str, **attributes):
+        self.stage = stage
+        self.start = 0.0
+        self.elapsed = 0.0
+        self._span_context = span(stage, **attributes)
+        self.span = None
+
+    def __enter__(self) -> "timed":
+        self.span = self._span_context.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(self.elapsed, stage=self.stage)
+        error = None
+        if isinstance(exc, Exception):
+            error = error_type(exc)
+            ERRORS.inc(component=self.stage, type=error)
+        elif exc is not None:
+            error = "cancelled"
+        record_stage(self.stage, self.start, self.elapsed, error)
+        return self._span_context.__exit__(exc_type, exc, tb)
+
+
+class MetricsMiddleware:
+    """ASGI中间件：统计进行中的请求数与按路由模板的请求耗时（流式响应计到响应结束）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, tracked_send)
+        except Exception as e:
+            ERRORS.inc(component="http", type=error_type(e))
+            raise
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                route=getattr(route, "path", "unmatched"),
+                method=scope.get("method", ""),
+                status=status["code"]
+            )
@@ -0,0 +1,212 @@
+"""
+性能剖析 - 按需运行的采样剖析器（输出折叠栈，可直接生成火焰图）与慢请求记录
+采样剖析器定时读取各线程的调用栈（sys._current_frames），不插桩，开销只与采样频率有关；
+慢请求记录收集请求内各阶段（timed()与大模型调用）的耗时，超过阈值的请求保存在有界环形缓冲区中
+"""
+import collections
+import contextvars
+import os
+import sys
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+from config import Config
+
+
+class ProfilerBusy(Exception):
+    """已有剖析在运行"""
+
+
+class SamplingProfiler:
+    """采样剖析器：同一时间只允许一个剖析任务"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = 0
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _collapse(self, frame) -> List[str]:
+        stack = []
+        while frame is not None:
+            stack.append(self._frame_label(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def profile(self, seconds: float, interval: float = 0.005, include_idle: bool = False) -> Dict[str, Any]:
+        """
+        阻塞采样seconds秒（应在线程中调用，事件循环线程照常被采样）
+        返回折叠栈计数：{"thread;frame1;frame2": 次数}；默认丢弃线程空闲等待的样本
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("已有剖析任务在运行")
+        try:
+            self._runs += 1
+            own = threading.get_ident()
+            names = {}
+            stacks: Dict[str, int] = collections.Counter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            started = time.perf_counter()
+            while time.perf_counter() < deadline:
+                for thread in threading.enumerate():
+                    names[thread.ident] = thread.name
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = self._collapse(frame)
+                    if not include_idle and _is_idle(stack):
+                        continue
+                    stacks[";".join([names.get(ident, str(ident))] + stack)] += 1
+                samples += 1
+                time.sleep(interval)
+            return {
+                "duration": time.perf_counter() - started,
+                "samples": samples,
+                "interval": interval,
+                "stacks": dict(stacks)
+            }
+        finally:
+            self._lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"runs": self._runs, "running": self._lock.locked()}
+
+
+# 栈顶为这些函数时视为线程空闲（事件循环等待IO、线程池/后台线程等待任务）
+_IDLE_FUNCTIONS = ("select (selectors.py", "poll (selectors.py", "wait (threading.py", "wait (connection.py",
+                   "get (queue.py", "_worker (thread.py", "_wait_for_tstate_lock")
+
+
+def _is_idle(stack: List[str]) -> bool:
+    return bool(stack) and stack[-1].startswith(_IDLE_FUNCTIONS)
+
+
+def render_collapsed(stacks: Dict[str, int]) -> str:
+    """Brendan Gregg折叠栈格式（flamegraph.pl / speedscope / inferno可直接读取）"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+
+_profiler = SamplingProfiler()
+
+
+def get_profiler() -> SamplingProfiler:
+    """获取进程内共享的采样剖析器"""
+    return _profiler
+
+
+# 当前请求的阶段耗时列表（由SlowRequestMiddleware为被记录的路由设置）
+_request_stages: contextvars.ContextVar = contextvars.ContextVar("request_stages", default=None)
+
+
+def record_stage(stage: str, start: float, elapsed: float, error: Optional[str] = None, **details):
+    """把一个阶段（perf_counter起点与耗时）计入当前请求；不在被记录的请求内时为空操作"""
+    stages = _request_stages.get()
+    if stages is not None:
+        stages["items"].append({
+            "stage": stage,
+            "start_ms": round((start - stages["start"]) * 1000, 2),
+            "duration_ms": round(elapsed * 1000, 2),
+            "error": error,
+            **details
+        })
+
+
+class SlowRequestLog:
+    """最近的慢请求（有界环形缓冲区）"""
+
+    def __init__(self, threshold: float, capacity: int):
+        self.threshold = threshold
+        self._entries: Deque[Dict[str, Any]] = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._counters = {"observed": 0, "captured": 0}
+
+    def observe(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._counters["observed"] += 1
+            if entry["duration_ms"] >= self.threshold * 1000:
+                self._counters["captured"] += 1
+                self._entries.append(entry)
+
+    def recent(self, route: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的慢请求，新的在前"""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if route:
+            entries = [entry for entry in entries if entry["route"] == route]
+        return entries[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "buffered": len(self._entries), "threshold": self.threshold}
+
+
+_slow_request_log: Optional[SlowRequestLog] = None
+
+
+def get_slow_request_log() -> SlowRequestLog:
+    """获取进程内共享的慢请求记录"""
+    global _slow_request_log
+    if _slow_request_log is None:
+        settings = Config.PROFILING
+        _slow_request_log = SlowRequestLog(
+            settings.get("slow_request_threshold", 2.0),
+            settings.get("slow_request_capacity", 100)
+        )
+    return _slow_request_log
+
+
+class SlowRequestMiddleware:
+    """
+    ASGI中间件：对配置的路由收集各阶段耗时，请求结束（流式响应到最后一个分段）后交给慢请求记录；
+    请求ID取自X-Request-ID（未携带时取链路追踪生成并回传的ID），便于与链路追踪关联
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = set(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        response = {"status": 500, "request_id": headers.get(b"x-request-id", b"").decode("latin-1")}
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                if not response["request_id"]:
+                    response["request_id"] = dict(message.get("headers") or []).get(
+                        b"x-request-id", b""
+                    ).decode("latin-1")
+            await send(message)
+
+        stages = {"start": time.perf_counter(), "items": []}
+        token = _request_stages.set(stages)
+        error = None
+        try:
+            await self.app(scope, receive, tracked_send)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _request_stages.reset(token)
+            duration = time.perf_counter() - stages["start"]
+            get_slow_request_log().observe({
+                "route": scope["path"],
+                "method": scope.get("method", ""),
+                "request_id": response["request_id"],
+                "status": response["status"],
+                "started_at": time.time() - duration,
+                "duration_ms": round(duration * 1000, 2),
+                "error": error,
+                "stages": sorted(stages["items"], key=lambda item: item["start_ms"])
+            })
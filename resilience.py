@@ -0,0 +1,218 @@
+"""
+上游调用容错 - 指数退避重试（带抖动、遵循Retry-After）与按模型划分的熔断器
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from config import Config
+
+
+class UpstreamError(Exception):
+    """上游返回非200状态码"""
+
+    def __init__(self, status_code: int, body: str, retry_after: Optional[float] = None):
+        super().__init__(f"API调用失败: {status_code} - {body}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，快速失败"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"上游服务熔断中({name})，请{max(1, math.ceil(retry_in))}秒后重试")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def upstream_error(response: httpx.Response, body: str) -> UpstreamError:
+    """根据上游响应构造异常"""
+    return UpstreamError(response.status_code, body, parse_retry_after(response.headers.get("Retry-After")))
+
+
+class CircuitBreaker:
+    """熔断器：closed -> (连续失败达到阈值) -> open -> (冷却结束) -> half_open -> (探测成功) -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """调用前检查，熔断打开时抛出CircuitOpenError"""
+        with self._lock:
+            if self.state == self.OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                if elapsed < self.recovery_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+                self.state = self.HALF_OPEN
+                self.half_open_calls = 0
+
+            if self.state == self.HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self.half_open_calls += 1
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.half_open_calls = 0
+
+    def release(self):
+        """调用未产生结论（如被取消、客户端错误）时释放半开探测名额"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self.state
+            if state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                state = self.HALF_OPEN
+            return {"state": state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class RetryPolicy:
+    """指数退避重试：full jitter，上游给出Retry-After时以其为准"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 max_retry_after: float = 30.0, retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = set(retry_statuses)
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, UpstreamError):
+            return error.status_code in self.retry_statuses
+        return isinstance(error, httpx.TransportError)
+
+    @staticmethod
+    def is_breaker_failure(error: Exception) -> bool:
+        """只有上游故障（429/5xx/网络错误）计入熔断，客户端错误不计入"""
+        if isinstance(error, UpstreamError):
+            return error.status_code == 429 or error.status_code >= 500
+        return isinstance(error, httpx.TransportError)
+
+    def delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """第attempt次失败后的等待时间；Retry-After超过上限时返回None（放弃重试）"""
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, fn: Callable[[], Awaitable[Any]], breaker: Optional[CircuitBreaker] = None) -> Any:
+        """执行调用，按策略重试，并向熔断器汇报结果"""
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_call()
+            try:
+                result = await fn()
+            except Exception as e:
+                if breaker is not None:
+                    if self.is_breaker_failure(e):
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                attempt += 1
+                wait = self.delay(attempt - 1, e) if self.is_retryable(e) else None
+                if attempt >= self.max_attempts or wait is None:
+                    raise
+                await asyncio.sleep(wait)
+                continue
+            except BaseException:
+                if breaker is not None:
+                    breaker.release()
+                raise
+
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_retry_policy: Optional[RetryPolicy] = None
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """按模型获取熔断器"""
+    with _breakers_lock:
+        if model not in _breakers:
+            settings = Config.CIRCUIT_BREAKER
+            _breakers[model] = CircuitBreaker(
+                model,
+                failure_threshold=settings.get("failure_threshold", 5),
+                recovery_timeout=settings.get("recovery_timeout", 30.0),
+                half_open_max_calls=settings.get("half_open_max_calls", 1)
+            )
+        return _breakers[model]
+
+
+def get_retry_policy() -> RetryPolicy:
+    """获取全局重试策略"""
+    global _retry_policy
+    if _retry_policy is None:
+        settings = Config.LLM_RETRY
+        _retry_policy = RetryPolicy(
+            max_attempts=settings.get("max_attempts", 3),
+            base_delay=settings.get("base_delay", 0.5),
+            max_delay=settings.get("max_delay", 8.0),
+            max_retry_after=settings.get("max_retry_after", 30.0),
+            retry_statuses=settings.get("retry_statuses", (429, 500, 502, 503, 504))
+        )
+    return _retry_policy
+
+
+def circuit_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """所有熔断器的当前状态"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {model: breaker.snapshot() for model, breaker in breakers.items()}
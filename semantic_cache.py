@@ -0,0 +1,237 @@
+"""
+语义缓存 - 基于向量相似度复用相近问题的回答（如"布洛芬怎么吃" / "布洛芬的服用方法"）
+需要配置真正的向量模型（sentence-transformers），未配置时不启用；可选hnswlib近似索引
+除相似度阈值外，数量/单位（年龄、体重、剂量）与否定词必须完全一致才会命中
+"""
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import normalize_text
+from config import Config
+
+
+# 数量：阿拉伯数字（可带单位）或中文数字 + 单位（年龄、体重、剂量、频次等），任何一处不同都不能复用回答
+_UNITS = r"mg|ml|kg|g|μg|ug|iu|%|毫克|微克|克|毫升|升|公斤|千克|斤|周岁|岁|个月|月|周|天|日|小时|次|片|粒|袋|支|滴|瓶|盒|单位"
+QUANTITY = re.compile(
+    rf"(\d+(?:\.\d+)?)\s*({_UNITS})?|([零一二两三四五六七八九十百千半]+)\s*({_UNITS})",
+    re.IGNORECASE
+)
+# 否定/禁止词：“可以喝酒”与“不可以喝酒”必须视为不同问题
+NEGATION = re.compile(r"不|没|无|未|别|勿|禁|忌|非|否")
+
+
+def critical_terms(text: str) -> Tuple[str, ...]:
+    """
+    提取问题中决定回答内容的关键项（数量及单位、否定词），作为语义匹配的硬性条件：
+    向量相似度再高，关键项不一致（如2岁12公斤 vs 6岁20公斤、300mg vs 200mg）也不命中
+    """
+    text = normalize_text(text).replace(" ", "")
+    terms = [f"{number or cn_number}{(unit or cn_unit).lower()}"
+             for number, unit, cn_number, cn_unit in QUANTITY.findall(text)]
+    terms.extend(NEGATION.findall(text))
+    return tuple(sorted(terms))
+
+
+class SentenceTransformerEmbedder:
+    """sentence-transformers本地模型（可选依赖）"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = self.model.encode(normalize_text(text), normalize_embeddings=True)
+        return np.asarray(vector, dtype=np.float32)
+
+
+def create_embedder(settings: Dict[str, Any]):
+    """
+    根据配置创建向量模型；未配置模型或未安装sentence-transformers时返回None（语义缓存不启用）
+    字符n-gram之类的浅层向量会把“2岁12公斤”与“6岁20公斤”判为高度相似，不能用于医疗回答复用
+    """
+    model_name = settings.get("model", "")
+    if not model_name:
+        return None
+    try:
+        return SentenceTransformerEmbedder(model_name)
+    except ImportError:
+        return None
+
+
+class NumpyVectorIndex:
+    """预分配的NumPy向量索引：矩阵乘法暴力检索，容量满时淘汰最久未访问的条目"""
+
+    def __init__(self, dim: int, capacity: int):
+        self.dim = dim
+        self.capacity = capacity
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.last_access = np.full(capacity, -np.inf)
+        self.size = 0
+
+    def search(self, vector: np.ndarray) -> Tuple[int, float]:
+        """返回(最相似条目的槽位, 相似度)，索引为空时槽位为-1"""
+        if self.size == 0:
+            return -1, 0.0
+        scores = self.vectors[:self.size] @ vector
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def allocate(self) -> int:
+        """分配一个槽位（未满时追加，已满时复用最久未访问的槽位）"""
+        if self.size < self.capacity:
+            self.size += 1
+            return self.size - 1
+        return int(np.argmin(self.last_access[:self.size]))
+
+    def put(self, slot: int, vector: np.ndarray):
+        self.vectors[slot] = vector
+        self.touch(slot)
+
+    def touch(self, slot: int):
+        self.last_access[slot] = time.monotonic()
+
+    def remove(self, slot: int):
+        """使槽位失效（相似度永远不会达到阈值）"""
+        self.vectors[slot] = 0.0
+        self.last_access[slot] = -np.inf
+
+
+class HnswVectorIndex(NumpyVectorIndex):
+    """hnswlib近似最近邻索引（可选依赖），适用于数十万条以上的规模"""
+
+    def __init__(self, dim: int, capacity: int):
+        import hnswlib
+        super().__init__(dim, capacity)
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(max_elements=capacity, ef_construction=100, M=16)
+        self.index.set_ef(64)
+
+    def search(self, vector: np.ndarray) -> Tuple[int, float]:
+        if self.index.get_current_count() == 0:
+            return -1, 0.0
+        try:
+            labels, distances = self.index.knn_query(vector, k=1)
+        except RuntimeError:
+            # 所有条目均已删除
+            return -1, 0.0
+        # inner product空间下 distance = 1 - 内积
+        return int(labels[0][0]), 1.0 - float(distances[0][0])
+
+    def put(self, slot: int, vector: np.ndarray):
+        super().put(slot, vector)
+        self.index.add_items(vector.reshape(1, -1), np.array([slot]))
+
+    def remove(self, slot: int):
+        super().remove(slot)
+        try:
+            self.index.mark_deleted(slot)
+        except RuntimeError:
+            pass
+
+
+def create_vector_index(dim: int, capacity: int, kind: str = "numpy"):
+    """根据配置创建向量索引，未安装hnswlib时回退到NumPy暴力检索"""
+    if kind == "hnsw":
+        try:
+            return HnswVectorIndex(dim, capacity)
+        except ImportError:
+            pass
+    return NumpyVectorIndex(dim, capacity)
+
+
+class SemanticCache:
+    """语义缓存：相似度超过阈值时返回已缓存的回答，容量有界，支持TTL"""
+
+    def __init__(self, embedder, threshold: float = 0.92, max_entries: int = 10000,
+                 ttl: float = 3600, index: str = "numpy"):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.index = create_vector_index(self.embedder.dim, max_entries, index)
+        # 槽位 -> (过期时间, 原问题, 关键项, 回答)
+        self.values: List[Optional[Tuple[float, str, Tuple[str, ...], Any]]] = [None] * max_entries
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "guard_rejects": 0}
+
+    def get(self, text: str) -> Optional[Any]:
+        vector = self.embedder.embed(text)
+        terms = critical_terms(text)
+        with self._lock:
+            slot, score = self.index.search(vector)
+            entry = self.values[slot] if slot >= 0 else None
+            if entry is not None and entry[0] < time.time():
+                self.index.remove(slot)
+                self.values[slot] = None
+                entry = None
+            if entry is None or score < self.threshold:
+                self._counters["misses"] += 1
+                return None
+            if entry[2] != terms:
+                self._counters["guard_rejects"] += 1
+                self._counters["misses"] += 1
+                return None
+            self.index.touch(slot)
+            self._counters["hits"] += 1
+            return entry[3]
+
+    def set(self, text: str, value: Any):
+        vector = self.embedder.embed(text)
+        terms = critical_terms(text)
+        with self._lock:
+            slot, score = self.index.search(vector)
+            # 几乎相同（且关键项一致）的问题复用原槽位，避免重复条目
+            if slot < 0 or score < 0.999 or self.values[slot] is None or self.values[slot][2] != terms:
+                slot = self.index.allocate()
+                if self.values[slot] is not None:
+                    self._counters["evictions"] += 1
+                    self.index.remove(slot)
+            self.index.put(slot, vector)
+            self.values[slot] = (time.time() + self.ttl, text, terms, value)
+            self._counters["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = sum(1 for v in self.values[:self.index.size] if v is not None)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        counters["threshold"] = self.threshold
+        return counters
+
+
+_embedder = None
+_semantic_caches: Dict[str, SemanticCache] = {}
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache(namespace: str) -> Optional[SemanticCache]:
+    """按命名空间（智能体+模型参数）获取语义缓存，向量模型全局共享；未配置向量模型时返回None"""
+    global _embedder
+    with _semantic_cache_lock:
+        if namespace not in _semantic_caches:
+            settings = Config.SEMANTIC_CACHE
+            if _embedder is None:
+                _embedder = create_embedder(settings)
+            if _embedder is None:
+                return None
+            _semantic_caches[namespace] = SemanticCache(
+                embedder=_embedder,
+                threshold=settings.get("threshold", 0.92),
+                max_entries=settings.get("max_entries", 10000),
+                ttl=settings.get("ttl", 3600),
+                index=settings.get("index", "numpy")
+            )
+        return _semantic_caches[namespace]
+
+
+def semantic_cache_stats() -> Dict[str, Any]:
+    """所有语义缓存的统计信息"""
+    with _semantic_cache_lock:
+        caches = dict(_semantic_caches)
+    return {namespace: cache.stats() for namespace, cache in caches.items()}
@@ -0,0 +1,179 @@
+"""
+推测式并行路由 - 意图识别与最可能的下游智能体同时启动
+猜中时直接使用下游结果（延迟约为两次调用中较长者），猜错时取消推测调用
+"""
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agents import AgentFactory
+from config import Config
+from intent_classifier import (
+    CASE_GENERATION, NON_MEDICAL, SELF_DIAGNOSIS, TRIAGE, get_local_intent_classifier
+)
+from metrics import STAGE_SECONDS, timed
+from tracing import span
+from utils import estimate_messages_tokens, estimate_tokens
+
+# 本地分类器标签 -> 智能体类型
+LABEL_AGENTS = {
+    TRIAGE: "triage",
+    SELF_DIAGNOSIS: "self_diagnosis",
+    CASE_GENERATION: "case_generation",
+    NON_MEDICAL: "chat",
+}
+
+
+class SpeculativeRouter:
+    """推测式路由器：先验 = 本地分类器概率 与 近期流量分布 的加权"""
+
+    def __init__(self, route_name: str, route: Callable[[Dict[str, Any]], Tuple[str, str]]):
+        self.route_name = route_name
+        self.route = route
+        settings = Config.SPECULATIVE_ROUTING.get(route_name, {})
+        self.enabled = settings.get("enabled", False)
+        self.max_branches = settings.get("max_branches", 1)
+        self.min_prior = settings.get("min_prior", 0.3)
+        self.traffic_weight = settings.get("traffic_weight", 0.3)
+        self.recent = deque(maxlen=settings.get("traffic_window", 200))
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "speculated": 0,
+            "hits": 0,
+            "misses": 0,
+            "cancelled_branches": 0,
+            "wasted_tokens": 0,
+            "latency_saved_ms": 0.0,
+        }
+
+    def prior(self, user_message: str) -> Dict[str, float]:
+        """计算各下游智能体的先验概率"""
+        probs = get_local_intent_classifier().predict_proba(user_message)
+        prior = {LABEL_AGENTS[label]: p for label, p in probs.items()}
+
+        with self._lock:
+            traffic = Counter(self.recent)
+        total = sum(traffic.values())
+        if total:
+            w = self.traffic_weight
+            prior = {key: (1 - w) * p + w * traffic[key] / total for key, p in prior.items()}
+        return prior
+
+    def choose_branches(self, user_message: str) -> Dict[str, float]:
+        """选择需要推测启动的下游智能体；本地快速通道可命中时无需推测"""
+        classifier = get_local_intent_classifier()
+        if classifier.enabled:
+            probs = classifier.predict_proba(user_message)
+            if max(probs.values()) >= classifier.threshold:
+                return {}
+
+        prior = self.prior(user_message)
+        ranked = sorted(prior.items(), key=lambda item: item[1], reverse=True)
+        return {key: p for key, p in ranked[:self.max_branches] if p >= self.min_prior}
+
+    def _record(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._counters[key] += value
+
+    @staticmethod
+    def _wasted_tokens(agent_key: str, user_message: str, task: "asyncio.Task") -> int:
+        """估算被丢弃的推测调用消耗的token（提示词 + 已完成的输出）"""
+        agent = AgentFactory.create_agent(agent_key)
+        tokens = estimate_messages_tokens(agent.build_messages(user_message))
+        if task.done() and not task.cancelled() and task.exception() is None:
+            result, _ = task.result()
+            if result.get("success"):
+                tokens += estimate_tokens(str(result["data"].get(agent.result_key, "")))
+        return tokens
+
+    @staticmethod
+    async def _timed(stage: str, process: Callable, user_message: str) -> Tuple[Dict[str, Any], float]:
+        """
+        执行智能体处理并计时（在任务内部创建协程，避免任务被提前取消时协程未被等待）
+        阶段耗时由调用方在结果被采用时记录，span则对被丢弃的分支同样保留（标记为cancelled）
+        """
+        start = time.perf_counter()
+        with span(stage, speculative=True):
+            result = await process(user_message)
+        return result, time.perf_counter() - start
+
+    async def dispatch(self, user_message: str) -> Tuple[Dict[str, Any], Optional[str], Optional[Dict[str, Any]]]:
+        """
+        执行意图识别并调用下游智能体
+        返回(意图识别结果, 智能体名称, 下游结果)；意图识别失败时后两项为None
+        """
+        self._record(requests=1)
+        intent_agent = AgentFactory.create_agent("intent_recognition")
+        branches = self.choose_branches(user_message) if self.enabled else {}
+
+        if not branches:
+            with timed("intent"):
+                intent_result = await intent_agent.process(user_message)
+            if not intent_result["success"]:
+                return intent_result, None, None
+            agent_key, agent_type = self.route(intent_result["data"])
+            with timed(f"agent.{agent_key}"):
+                final_result = await AgentFactory.create_agent(agent_key).process(user_message)
+            with self._lock:
+                self.recent.append(agent_key)
+            return intent_result, agent_type, final_result
+
+        # 同时启动意图识别与推测分支
+        self._record(speculated=1)
+        speculative = {
+            key: asyncio.ensure_future(self._timed(f"agent.{key}", AgentFactory.create_agent(key).process, user_message))
+            for key in branches
+        }
+        try:
+            intent_result, intent_elapsed = await self._timed("intent", intent_agent.process, user_message)
+            STAGE_SECONDS.observe(intent_elapsed, stage="intent")
+            agent_key, agent_type = None, None
+            if intent_result["success"]:
+                agent_key, agent_type = self.route(intent_result["data"])
+        except BaseException:
+            self._discard(speculative, user_message, keep=None)
+            raise
+
+        self._discard(speculative, user_message, keep=agent_key)
+        if agent_key is None:
+            return intent_result, None, None
+
+        with self._lock:
+            self.recent.append(agent_key)
+        if agent_key in speculative:
+            final_result, agent_elapsed = await speculative[agent_key]
+            STAGE_SECONDS.observe(agent_elapsed, stage=f"agent.{agent_key}")
+            # 串行耗时 = 意图 + 下游，并行耗时 ≈ max(意图, 下游)
+            self._record(hits=1, latency_saved_ms=min(intent_elapsed, agent_elapsed) * 1000)
+        else:
+            self._record(misses=1)
+            with timed(f"agent.{agent_key}"):
+                final_result = await AgentFactory.create_agent(agent_key).process(user_message)
+
+        return intent_result, agent_type, final_result
+
+    def _discard(self, speculative: Dict[str, "asyncio.Task"], user_message: str, keep: Optional[str]):
+        """取消未被采用的推测分支并计入浪费的token"""
+        for key, task in speculative.items():
+            if key == keep:
+                continue
+            if not task.done():
+                task.cancel()
+            self._record(
+                cancelled_branches=1,
+                wasted_tokens=self._wasted_tokens(key, user_message, task)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """推测命中率、浪费token与节省延迟统计"""
+        with self._lock:
+            counters = dict(self._counters)
+        speculated = counters["speculated"]
+        counters["hit_rate"] = counters["hits"] / speculated if speculated else 0.0
+        counters["enabled"] = self.enabled
+        counters["max_branches"] = self.max_branches
+        return counters
@@ -0,0 +1,35 @@
+"""本地意图规则：通用问法须有医学锚点，非医疗语境不得被规则直接分流"""
+import pytest
+
+from intent_classifier import SELF_DIAGNOSIS, TRIAGE, LocalIntentClassifier
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return LocalIntentClassifier()
+
+
+@pytest.mark.parametrize("text", [
+    "推荐看什么科幻电影",
+    "周末去哪个科技馆玩",
+    "我想看什么科普书",
+    "应该去哪个科技馆",
+    "手机什么原因导致发热",
+    "今年夏天为什么这么炎热，什么原因",
+    "电脑开不了机是怎么回事",
+    "这个bug可能是什么问题",
+])
+def test_non_medical_text_does_not_match_rules(classifier, text):
+    assert classifier.match_rules(text) is None
+
+
+@pytest.mark.parametrize("text, label", [
+    ("我头痛发烧，应该看什么科？", TRIAGE),
+    ("我该去哪个科室就诊", TRIAGE),
+    ("月经不调去哪个科看", TRIAGE),
+    ("肚子疼去医院挂什么号", TRIAGE),
+    ("发烧三天了还咳嗽是怎么回事", SELF_DIAGNOSIS),
+    ("最近总是头痛，可能是什么病？", SELF_DIAGNOSIS),
+])
+def test_medical_text_matches_rules(classifier, text, label):
+    assert classifier.match_rules(text) == label
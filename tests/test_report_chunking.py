@@ -0,0 +1,48 @@
+"""报告分段解读：任何分段都不超过max_chunk_tokens"""
+import asyncio
+
+from agents import AgentFactory
+from config import Config
+from utils import estimate_tokens
+
+
+def _report(paragraphs: int) -> str:
+    return "\n\n".join(f"第{i}项 白细胞计数偏高，建议复查血常规并结合临床表现判断。" * 40 for i in range(paragraphs))
+
+
+def _mapped_chunks(agent, pages):
+    chunks = []
+
+    async def extract_chunk(label, chunk, semaphore):
+        chunks.append(chunk)
+        return label
+
+    async def iterate():
+        for page in pages:
+            yield page
+
+    agent.extract_chunk = extract_chunk
+    _, notes, truncated = asyncio.run(agent.map_pages(iterate()))
+    return chunks, notes, truncated
+
+
+def test_single_oversized_page_is_bounded():
+    """文档缓存命中时整份报告作为一页产出，最后一段同样受max_chunk_tokens限制"""
+    agent = AgentFactory.create_agent("report_interpretation")
+    report = _report(200)
+    assert estimate_tokens(report) > 200000
+
+    chunks, notes, truncated = _mapped_chunks(agent, [report])
+
+    limit = Config.REPORT_CHUNKING["max_chunk_tokens"]
+    assert len(notes) == len(chunks) <= Config.REPORT_CHUNKING["max_chunks"]
+    assert max(estimate_tokens(chunk) for chunk in chunks) <= limit
+    assert truncated
+
+
+def test_split_report_grows_chunks_before_truncating():
+    agent = AgentFactory.create_agent("report_interpretation")
+    chunks, truncated = agent.split_report(_report(30))
+    assert chunks is not None and not truncated
+    assert len(chunks) <= Config.REPORT_CHUNKING["max_chunks"]
+    assert max(estimate_tokens(chunk) for chunk in chunks) <= Config.REPORT_CHUNKING["max_chunk_tokens"]
@@ -0,0 +1,323 @@
+"""
+token用量与输出长度 - 按智能体/接口/日期累计上游返回的usage，生成每日token预算报告；
+自适应max_tokens：按近期实际输出长度的分位数（区分输入规模）设定非流式调用的max_tokens，
+智能体原有的max_tokens作为上限，输出被截断时以原上限重新请求；
+流式调用已产出的内容无法撤回，始终使用原上限（只贡献输出长度样本）
+"""
+import collections
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from config import Config
+
+# 当前请求的接口路径（由UsageContextMiddleware设置，用于按接口统计）
+_current_endpoint: contextvars.ContextVar = contextvars.ContextVar("current_endpoint", default="")
+
+
+def current_endpoint() -> str:
+    """当前请求的接口路径（不在请求内时为internal）"""
+    return _current_endpoint.get() or "internal"
+
+
+class UsageContextMiddleware:
+    """ASGI中间件：记录当前请求的接口路径，上游调用的token用量据此归属到接口"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_endpoint.set(scope.get("path", ""))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_endpoint.reset(token)
+
+
+def _empty_totals() -> Dict[str, int]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "estimated": 0, "truncated": 0}
+
+
+def _add(totals: Dict[str, int], prompt_tokens: int, completion_tokens: int, estimated: bool, truncated: bool):
+    totals["calls"] += 1
+    totals["prompt_tokens"] += prompt_tokens
+    totals["completion_tokens"] += completion_tokens
+    totals["total_tokens"] += prompt_tokens + completion_tokens
+    totals["estimated"] += int(estimated)
+    totals["truncated"] += int(truncated)
+
+
+class TokenUsageLedger:
+    """按日期累计token用量（总计 / 按智能体 / 按接口），保留最近retention_days天"""
+
+    def __init__(self, retention_days: int = 30, path: str = "", flush_interval: float = 60.0):
+        self.retention_days = retention_days
+        self.path = path
+        self.flush_interval = flush_interval
+        self._days: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._save_lock = threading.Lock()
+        self._stopped = threading.Event()
+        if path and os.path.exists(path):
+            self.load()
+        if path and flush_interval > 0:
+            # 定期写入，进程异常退出时最多丢失一个间隔内的用量
+            threading.Thread(target=self._flush_loop, name="token-ledger-flush", daemon=True).start()
+
+    @staticmethod
+    def _new_day() -> Dict[str, Any]:
+        return {"total": _empty_totals(), "by_agent": {}, "by_endpoint": {}, "by_model": {}}
+
+    def record(self, agent: str, endpoint: str, model: str, prompt_tokens: int, completion_tokens: int,
+               estimated: bool = False, truncated: bool = False):
+        """记录一次上游调用的用量（estimated：上游未返回usage，按文本估算）"""
+        day = time.strftime("%Y-%m-%d")
+        with self._lock:
+            entry = self._days.get(day)
+            if entry is None:
+                entry = self._days[day] = self._new_day()
+                for expired in sorted(self._days)[:-self.retention_days]:
+                    del self._days[expired]
+            _add(entry["total"], prompt_tokens, completion_tokens, estimated, truncated)
+            self._dirty = True
+            for group, key in (("by_agent", agent), ("by_endpoint", endpoint), ("by_model", model)):
+                totals = entry[group].get(key)
+                if totals is None:
+                    totals = entry[group][key] = _empty_totals()
+                _add(totals, prompt_tokens, completion_tokens, estimated, truncated)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return json.loads(json.dumps(self._days))
+
+    def daily_report(self, days: int = 7) -> List[Dict[str, Any]]:
+        """
+        每日预算报告（新的在前）：用量、按智能体/接口明细、预算占用；
+        当天额外给出按已过时间线性外推的全天预计用量
+        """
+        budget = Config.TOKEN_BUDGET
+        daily_budget = budget.get("daily_tokens", 0)
+        agent_budgets = budget.get("per_agent", {})
+        snapshot = self.snapshot()
+        today = time.strftime("%Y-%m-%d")
+        report = []
+        for day in sorted(snapshot, reverse=True)[:days]:
+            entry = snapshot[day]
+            used = entry["total"]["total_tokens"]
+            item = {"date": day, **entry, "budget": daily_budget or None}
+            if daily_budget:
+                item["budget_used_ratio"] = round(used / daily_budget, 4)
+                item["over_budget"] = used > daily_budget
+            if day == today:
+                now = time.localtime()
+                elapsed = (now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec) / 86400
+                item["projected_total_tokens"] = int(used / max(elapsed, 1 / 24))
+            for agent, limit in agent_budgets.items():
+                totals = item["by_agent"].get(agent)
+                if totals is not None and limit:
+                    totals["budget"] = limit
+                    totals["budget_used_ratio"] = round(totals["total_tokens"] / limit, 4)
+                    totals["over_budget"] = totals["total_tokens"] > limit
+            report.append(item)
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        """当天用量概览"""
+        with self._lock:
+            entry = self._days.get(time.strftime("%Y-%m-%d")) or self._new_day()
+            return {
+                "today": dict(entry["total"]),
+                "by_agent": {name: totals["total_tokens"] for name, totals in entry["by_agent"].items()},
+                "days_retained": len(self._days)
+            }
+
+    def load(self):
+        """从文件恢复（进程重启后当天用量不丢失）"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                days = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self._days.update(days)
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            if self._dirty:
+                try:
+                    self.save()
+                except OSError:
+                    pass
+
+    def close(self):
+        """停止定期写入并保存（应用关闭时调用）"""
+        self._stopped.set()
+        self.save()
+
+    def save(self):
+        """写入文件（原子替换）"""
+        if not self.path:
+            return
+        with self._save_lock:
+            self._dirty = False
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+
+
+_ledger: Optional[TokenUsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_token_ledger() -> TokenUsageLedger:
+    """获取进程内共享的token用量账本"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                settings = Config.TOKEN_BUDGET
+                _ledger = TokenUsageLedger(
+                    settings.get("retention_days", 30), settings.get("path", ""), settings.get("flush_interval", 60)
+                )
+    return _ledger
+
+
+class OutputLimit(NamedTuple):
+    """一次调用的输出上限决策（观测结果时按相同的智能体/上限/输入规模归档）"""
+
+    agent: str
+    ceiling: int
+    limit: int
+    prompt_tokens: int
+
+    @property
+    def adapted(self) -> bool:
+        return self.limit < self.ceiling
+
+
+def _size_bucket(prompt_tokens: int) -> int:
+    """输入规模分桶（按2的幂）"""
+    return int(math.log2(max(prompt_tokens, 1)))
+
+
+class OutputLengthModel:
+    """
+    某智能体在某个max_tokens上限下的输出长度分布（例如报告解读的分段提取与最终汇总分别统计）
+    按输入规模分桶保存最近window次的输出token数；同桶样本不足时使用全部样本
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._buckets: Dict[int, Deque[int]] = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self._all: Deque[int] = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self._buckets[_size_bucket(prompt_tokens)].append(completion_tokens)
+            self._all.append(completion_tokens)
+
+    def percentile(self, prompt_tokens: Optional[int], quantile: float, min_samples: int) -> Optional[int]:
+        """输出长度分位数（prompt_tokens为None时不区分输入规模）；样本不足时返回None"""
+        with self._lock:
+            samples = None if prompt_tokens is None else self._buckets.get(_size_bucket(prompt_tokens))
+            if samples is None or len(samples) < min_samples:
+                samples = self._all
+            if len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def samples(self) -> int:
+        with self._lock:
+            return len(self._all)
+
+
+class AdaptiveMaxTokens:
+    """自适应max_tokens：max(下限, 分位数 × 余量)，不超过智能体原有上限；样本不足时使用原上限"""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self._models: Dict[Tuple[str, int], OutputLengthModel] = {}
+        self._lock = threading.Lock()
+        self._counters = {"adapted": 0, "tokens_reserved_saved": 0, "truncated": 0, "reissued": 0}
+
+    def enabled(self, agent: str) -> bool:
+        default = self.settings.get("enabled", False)
+        return Config.AGENTS_CONFIG.get(agent, {}).get("adaptive_max_tokens", default)
+
+    def _model(self, agent: str, ceiling: int) -> OutputLengthModel:
+        with self._lock:
+            model = self._models.get((agent, ceiling))
+            if model is None:
+                model = self._models[(agent, ceiling)] = OutputLengthModel(self.settings.get("window", 500))
+            return model
+
+    def decide(self, agent: str, ceiling: int, prompt_tokens: int, adapt: bool = True) -> OutputLimit:
+        """确定本次调用的max_tokens（adapt=False时使用原上限，如流式调用）"""
+        limit = ceiling
+        if adapt and self.enabled(agent):
+            observed = self._model(agent, ceiling).percentile(
+                prompt_tokens, self.settings.get("percentile", 0.99), self.settings.get("min_samples", 50)
+            )
+            if observed is not None:
+                limit = min(ceiling, max(self.settings.get("min_tokens", 256),
+                                         int(observed * self.settings.get("headroom", 1.25))))
+        if limit < ceiling:
+            with self._lock:
+                self._counters["adapted"] += 1
+                self._counters["tokens_reserved_saved"] += ceiling - limit
+        return OutputLimit(agent, ceiling, limit, prompt_tokens)
+
+    def observe(self, decision: OutputLimit, completion_tokens: int, truncated: bool):
+        """
+        记录实际输出长度；被自适应上限截断的输出真实长度未知，按两倍上限（不超过原上限）计入，
+        使分位数尽快回升而不是停留在截断值
+        """
+        if truncated and decision.adapted:
+            completion_tokens = min(decision.ceiling, decision.limit * 2)
+            with self._lock:
+                self._counters["truncated"] += 1
+        self._model(decision.agent, decision.ceiling).observe(decision.prompt_tokens, completion_tokens)
+
+    def record_reissued(self):
+        with self._lock:
+            self._counters["reissued"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            models = dict(self._models)
+        quantile = self.settings.get("percentile", 0.99)
+        min_samples = self.settings.get("min_samples", 50)
+        counters["models"] = {
+            f"{agent}:{ceiling}": {
+                "samples": model.samples(),
+                "percentile": model.percentile(None, quantile, min_samples)
+            }
+            for (agent, ceiling), model in models.items()
+        }
+        return counters
+
+
+_adaptive: Optional[AdaptiveMaxTokens] = None
+
+
+def get_adaptive_max_tokens() -> AdaptiveMaxTokens:
+    """获取进程内共享的自适应max_tokens策略"""
+    global _adaptive
+    if _adaptive is None:
+        _adaptive = AdaptiveMaxTokens(Config.ADAPTIVE_MAX_TOKENS)
+    return _adaptive
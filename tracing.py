@@ -0,0 +1,356 @@
+"""
+链路追踪 - OpenTelemetry风格的span（trace_id/span_id/父子关系/属性/状态），以contextvars在协程间传递
+前端的X-Request-ID作为关联ID（映射为trace_id），也接受W3C traceparent；
+span由后台线程批量导出到本地JSONL文件或OTLP/HTTP采集器（OTLP JSON编码，无需opentelemetry-sdk）
+"""
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from config import Config
+
+_HEX32 = re.compile(r"^[0-9a-f]{32}$")
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    """一个计时单元：结束时交给导出器"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.status = "ok"
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def set_error(self, message: str):
+        self.status = "error"
+        self.status_message = message[:500]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "status": self.status,
+            "status_message": self.status_message,
+            "attributes": self.attributes
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2 if self.status == "error" else 1, "message": self.status_message}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class _NoopSpan:
+    """未启用追踪或未被采样时使用，所有操作为空"""
+
+    trace_id = ""
+    span_id = ""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class FileSpanExporter:
+    """每个span一行JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False) + "\n")
+
+    def shutdown(self):
+        pass
+
+
+class OTLPHttpSpanExporter:
+    """以OTLP/HTTP JSON编码发送到采集器（POST {endpoint}/v1/traces）"""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=timeout)
+
+    def export(self, spans: List[Span]):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "medical-agent"}, "spans": [span.to_otlp() for span in spans]}]
+        }]}
+        self._client.post(self.url, json=body).raise_for_status()
+
+    def shutdown(self):
+        self._client.close()
+
+
+class Tracer:
+    """创建span并由后台线程批量导出（导出失败只计数，不影响请求）"""
+
+    def __init__(self, exporter, sample_rate: float = 1.0, batch_size: int = 256,
+                 flush_interval: float = 2.0, max_queue: int = 10000):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self._counters = {"spans": 0, "exported": 0, "dropped": 0, "export_errors": 0}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._worker.start()
+
+    def _record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self._counters[name] += value
+
+    def sampled(self, trace_id: str) -> bool:
+        """按trace_id确定性采样，同一链路的span要么全部保留要么全部丢弃"""
+        return self.sample_rate >= 1.0 or int(trace_id[:8], 16) / 0xFFFFFFFF < self.sample_rate
+
+    def finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        self._record(spans=1)
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self._record(dropped=1)
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+            self._record(exported=len(batch))
+        except Exception:
+            self._record(export_errors=1, dropped=len(batch))
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                self._export(batch)
+
+    def shutdown(self):
+        """停止后台线程并导出剩余span"""
+        self._stopped.set()
+        self._worker.join(timeout=self.flush_interval + 1)
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._export(batch)
+        self.exporter.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["queued"] = self._queue.qsize()
+        counters["sample_rate"] = self.sample_rate
+        return counters
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Optional[Tracer]:
+    """获取进程内共享的追踪器（未启用时返回None）"""
+    global _tracer
+    settings = Config.TRACING
+    if not settings.get("enabled") or settings.get("exporter", "file") == "none":
+        return None
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                if settings.get("exporter") == "otlp":
+                    exporter = OTLPHttpSpanExporter(
+                        settings.get("otlp_endpoint", "http://localhost:4318"),
+                        settings.get("service_name", "medical-agent")
+                    )
+                else:
+                    exporter = FileSpanExporter(settings.get("file_path", "logs/traces.jsonl"))
+                _tracer = Tracer(
+                    exporter,
+                    sample_rate=settings.get("sample_rate", 1.0),
+                    batch_size=settings.get("batch_size", 256),
+                    flush_interval=settings.get("flush_interval", 2.0)
+                )
+    return _tracer
+
+
+def shutdown_tracer():
+    """导出剩余span并关闭追踪器（应用关闭时调用）"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.shutdown()
+    _tracer = None
+
+
+def trace_id_from_request_id(request_id: str) -> str:
+    """X-Request-ID映射为32位十六进制trace_id（本身已是trace_id格式时直接使用）"""
+    request_id = request_id.strip().lower()
+    if _HEX32.match(request_id) and request_id != "0" * 32:
+        return request_id
+    return hashlib.sha256(request_id.encode("utf-8")).hexdigest()[:32]
+
+
+def current_span():
+    """当前span（没有时返回空操作span）"""
+    return _current_span.get() or NOOP_SPAN
+
+
+class span:
+    """
+    在当前span下创建子span：with span("llm.completion", model=...) as s: s.set_attribute(...)
+    没有上级span（不在请求链路内）、未启用或未被采样时为空操作
+    """
+
+    def __init__(self, name: str, root: bool = False, trace_id: str = "", parent_id: Optional[str] = None,
+                 **attributes):
+        self.name = name
+        self.root = root
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self._span = None
+        self._parent = None
+
+    def __enter__(self):
+        tracer = get_tracer()
+        parent = _current_span.get()
+        if tracer is None or (parent is None and not self.root):
+            return NOOP_SPAN
+        if parent is not None and not self.root:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id = self.trace_id or os.urandom(16).hex()
+            parent_id = self.parent_id
+            if not tracer.sampled(trace_id):
+                return NOOP_SPAN
+        self._span = Span(self.name, trace_id, parent_id, self.attributes)
+        # 退出时直接恢复上级span而非使用reset(token)：异步生成器中的span可能在另一个上下文中结束
+        self._parent = parent
+        _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is None:
+            return False
+        _current_span.set(self._parent)
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            if exc_type.__name__ == "CancelledError":
+                self._span.set_attribute("cancelled", True)
+            else:
+                self._span.set_error(f"{exc_type.__name__}: {exc}")
+        get_tracer().finish(self._span)
+        return False
+
+
+class TracingMiddleware:
+    """
+    ASGI中间件：为每个请求创建根span，X-Request-ID作为关联ID（缺失时生成），并在响应头中回传；
+    请求带W3C traceparent时沿用其trace_id与父span
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or os.urandom(8).hex()
+        trace_id, parent_id = trace_id_from_request_id(request_id), None
+        traceparent = _TRACEPARENT.match(headers.get(b"traceparent", b"").decode("latin-1"))
+        if traceparent:
+            trace_id, parent_id = traceparent.group(1), traceparent.group(2)
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.set_error(f"HTTP {message['status']}")
+            await send(message)
+
+        with span(f"{scope.get('method', '')} {scope.get('path', '')}", root=True, trace_id=trace_id,
+                  parent_id=parent_id, **{"request.id": request_id, "http.method": scope.get("method", ""),
+                                          "http.target": scope.get("path", "")}) as root:
+            await self.app(scope, receive, traced_send)
+            route = scope.get("route")
+            if route is not None and isinstance(root, Span):
+                root.name = f"{scope.get('method', '')} {route.path}"
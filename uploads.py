@@ -0,0 +1,224 @@
+"""
+上传处理 - 请求体超过大小限制时立即中止；直接使用Starlette已接收的上传文件，大文件复制到具名临时文件
+文件处理器直接接收内存数据或临时文件路径，避免整文件缓冲与多次复制
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+from fastapi import UploadFile
+
+from config import Config
+from utils import ResponseFormatter, validate_file_size
+
+
+class UploadTooLarge(Exception):
+    """上传内容超过大小限制"""
+
+    def __init__(self):
+        super().__init__(f"文件大小超过限制 ({Config.MAX_FILE_SIZE / 1024 / 1024}MB)")
+
+
+class SpooledUpload:
+    """已读取的上传文件：小文件保存在内存，大文件保存在临时文件"""
+
+    def __init__(self, size: int, sha256: str, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.size = size
+        self.sha256 = sha256
+        self.data = data
+        self.path = path
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """交给FileProcessor的数据源：内存数据或临时文件路径（传给子进程时无需序列化整个文件）"""
+        return self.data if self.data is not None else self.path
+
+    def read_bytes(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class UploadStats:
+    """上传统计：落盘次数、拒绝次数与内存占用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"uploads": 0, "spooled_to_disk": 0, "rejected_too_large": 0,
+                          "bytes_received": 0, "max_in_memory_bytes": 0}
+
+    def record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                if name == "max_in_memory_bytes":
+                    self._counters[name] = max(self._counters[name], value)
+                else:
+                    self._counters[name] += value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        try:
+            import resource
+        except ImportError:
+            # resource仅在POSIX系统可用（Windows下不统计峰值内存）
+            counters["peak_rss_mb"] = None
+            return counters
+        # Linux下ru_maxrss单位为KB
+        counters["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return counters
+
+
+_upload_stats = UploadStats()
+
+
+def upload_stats() -> Dict[str, Any]:
+    """上传处理统计"""
+    return _upload_stats.stats()
+
+
+def _uploaded_size(stream: BinaryIO) -> int:
+    """上传内容的字节数（Starlette已把请求体写入临时文件，直接定位到末尾）"""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def _spool_to_path(stream: BinaryIO, chunk_size: int, spool_dir: Optional[str]) -> Tuple[str, str]:
+    """
+    把上传内容分块复制到具名临时文件，同时计算内容哈希，返回(路径, sha256)
+    Starlette落盘的是匿名临时文件，进程池中的解析任务需要可按路径打开的文件
+    """
+    digest = hashlib.sha256()
+    spool = tempfile.NamedTemporaryFile(prefix="upload-", dir=spool_dir or None, delete=False)
+    try:
+        with spool:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        os.unlink(spool.name)
+        raise
+    return spool.name, digest.hexdigest()
+
+
+async def spool_upload(file: UploadFile) -> SpooledUpload:
+    """
+    读取Starlette已接收的上传文件：先按文件大小检查MAX_FILE_SIZE（超过时不读取内容，直接抛出UploadTooLarge），
+    不超过spool_threshold的文件一次读入内存，更大的文件分块复制到具名临时文件；读取的同时计算内容哈希
+    """
+    settings = Config.UPLOAD
+    chunk_size = settings.get("chunk_size", 64 * 1024)
+    threshold = settings.get("spool_threshold", 1024 * 1024)
+
+    stream = file.file
+    # 较早版本的Starlette没有UploadFile.size
+    size = getattr(file, "size", None)
+    if size is None:
+        size = await asyncio.to_thread(_uploaded_size, stream)
+    if not validate_file_size(size):
+        _upload_stats.record(rejected_too_large=1)
+        raise UploadTooLarge()
+    await file.seek(0)
+
+    _upload_stats.record(uploads=1, bytes_received=size)
+    if size > threshold:
+        path, sha256 = await asyncio.to_thread(_spool_to_path, stream, chunk_size, settings.get("spool_dir"))
+        _upload_stats.record(spooled_to_disk=1)
+        return SpooledUpload(size, sha256, path=path)
+    data = await file.read()
+    _upload_stats.record(max_in_memory_bytes=len(data))
+    return SpooledUpload(len(data), hashlib.sha256(data).hexdigest(), data=data)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI中间件：multipart请求体超过上限时立即返回413，不再继续接收
+    有Content-Length时在读取前拒绝，分块传输时在累计超限的那一刻中止
+    """
+
+    def __init__(self, app, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            _upload_stats.record(rejected_too_large=1)
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                # 丢弃应用针对解析失败生成的响应，统一返回413
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+
+        if exceeded and not started:
+            _upload_stats.record(rejected_too_large=1)
+            await self._reject(send)
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps(ResponseFormatter.error_response(str(UploadTooLarge()), 413), ensure_ascii=False)
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"connection", b"close")]
+        })
+        await send({"type": "http.response.body", "body": body.encode("utf-8")})
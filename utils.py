@@ -2,20 +2,76 @@
 工具类 - 使用HTTP请求直接调用阿里云百炼API
 """
 import json
+import math
+import re
 import asyncio
-import requests
-from typing import Dict, List, Any, Optional, Union
+import threading
+import time
+import httpx
+from typing import AsyncIterator, Dict, Iterator, List, Any, Optional, Tuple, Union
 import docx
 import PyPDF2
 import io
 import base64
-from PIL import Image
+from PIL import Image, ImageOps
 from config import Config
+from concurrency import get_rate_limiter, get_single_flight, payload_key
+from resilience import get_circuit_breaker, get_retry_policy, upstream_error
+from hedging import get_hedge_policy
+from image_cache import perceptual_hash
+from cancellation import get_cancellation_tracker
+from metrics import ERRORS, LLM_REQUEST_SECONDS, LLM_TTFT_SECONDS, error_type, record_llm_usage
+from profiling import record_stage
+from token_budget import OutputLimit, current_endpoint, get_adaptive_max_tokens, get_token_ledger
+from tracing import current_span, span
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """检查是否安装了HTTP/2依赖"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取进程内共享的异步HTTP客户端（保持长连接，复用TCP/TLS握手）"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.HTTP_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                connect=Config.HTTP_CONNECT_TIMEOUT,
+                read=Config.HTTP_READ_TIMEOUT,
+                write=Config.HTTP_WRITE_TIMEOUT,
+                pool=Config.HTTP_POOL_TIMEOUT
+            ),
+            http2=Config.HTTP2_ENABLED and _http2_available()
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """关闭共享HTTP客户端（应用关闭时调用）"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
 
 class LLMClient:
     """大语言模型客户端 - 直接调用阿里云百炼API"""
     
-    def __init__(self):
+    def __init__(self, agent_name: str = ""):
+        self.agent_name = agent_name
+        self.hedge_enabled = Config.AGENTS_CONFIG.get(agent_name, {}).get("hedge", False)
         self.api_key = Config.DASHSCOPE_API_KEY
         self.base_url = Config.DASHSCOPE_BASE_URL
         self.headers = {
@@ -23,6 +79,240 @@ class LLMClient:
             "Content-Type": "application/json"
         }
     
+    def _output_limit(self, payload: Dict[str, Any], adapt: bool = True) -> Tuple[Dict[str, Any], OutputLimit]:
+        """按近期输出长度确定本次调用的max_tokens（调用方传入的max_tokens为上限）"""
+        decision = get_adaptive_max_tokens().decide(
+            self.agent_name, payload.get("max_tokens", 2000), estimate_messages_tokens(payload["messages"]), adapt
+        )
+        return {**payload, "max_tokens": decision.limit}, decision
+    
+    async def _post_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送补全请求（并发的相同请求合并为一次上游调用）；回答被自适应上限截断时以原上限重新请求"""
+        limited, decision = self._output_limit(payload)
+        result = await get_single_flight().do(
+            payload_key(limited), lambda: self._send_completion(limited, decision)
+        )
+        if decision.adapted and _finish_reason(result) == "length":
+            get_adaptive_max_tokens().record_reissued()
+            decision = decision._replace(limit=decision.ceiling)
+            result = await get_single_flight().do(
+                payload_key(payload), lambda: self._send_completion(payload, decision)
+            )
+        return result
+    
+    def _record_usage(self, payload: Dict[str, Any], decision: OutputLimit, usage: Optional[Dict[str, int]],
+                      finish_reason: Optional[str], generated_tokens: int):
+        """记录一次完成调用的token用量（上游未返回usage时按文本估算）并更新输出长度分布"""
+        estimated = not usage
+        if estimated:
+            usage = {"prompt_tokens": decision.prompt_tokens, "completion_tokens": generated_tokens}
+        else:
+            record_llm_usage(self.agent_name, payload["model"], usage, current_endpoint())
+        get_token_ledger().record(
+            self.agent_name, current_endpoint(), payload["model"],
+            usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+            estimated=estimated, truncated=finish_reason == "length"
+        )
+        get_adaptive_max_tokens().observe(decision, usage.get("completion_tokens", 0), finish_reason == "length")
+        get_cancellation_tracker().record_completion(self.agent_name, usage)
+    
+    async def _send_completion(self, payload: Dict[str, Any], decision: OutputLimit) -> Dict[str, Any]:
+        """发送补全请求：慢请求对冲（按智能体开启），失败时按策略重试，按模型熔断"""
+        tracker = get_cancellation_tracker()
+        start = time.perf_counter()
+        with span("llm.completion", **self._span_attributes(payload)) as llm_span:
+            try:
+                result = await get_hedge_policy().run(
+                    lambda: self._limited_completion(payload),
+                    key=self._hedge_key(payload),
+                    enabled=self.hedge_enabled
+                )
+            except asyncio.CancelledError:
+                # 所有调用方都已离开，上游请求随之取消（连接被关闭）
+                tracker.record_cancelled(self.agent_name, payload.get("max_tokens", 0))
+                self._record_stage(payload, start, "cancelled")
+                raise
+            except Exception as e:
+                ERRORS.inc(component="llm", type=error_type(e))
+                llm_span.set_attribute("llm.error_type", error_type(e))
+                self._record_stage(payload, start, error_type(e))
+                raise
+            self._set_usage_attributes(llm_span, result.get("usage"))
+        LLM_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, agent=self.agent_name, model=payload["model"], mode="completion"
+        )
+        self._record_stage(payload, start, usage=result.get("usage"))
+        self._record_usage(
+            payload, decision, result.get("usage"), _finish_reason(result),
+            estimate_tokens(result["choices"][0]["message"].get("content") or "")
+        )
+        return result
+    
+    def _hedge_key(self, payload: Dict[str, Any]) -> str:
+        """对冲延迟统计键：按智能体、模型与max_tokens档位（2的幂）区分，长文本生成不会拉高短调用的阈值"""
+        max_tokens = payload.get("max_tokens", 0)
+        return f"{self.agent_name}:{payload['model']}:{1 << max(0, max_tokens - 1).bit_length()}"
+    
+    def _record_stage(self, payload: Dict[str, Any], start: float, error: Optional[str] = None, **details):
+        """计入当前请求的阶段明细（慢请求记录）"""
+        record_stage(f"llm.{self.agent_name}", start, time.perf_counter() - start, error,
+                     model=payload["model"], **details)
+    
+    def _span_attributes(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "llm.agent": self.agent_name,
+            "llm.model": payload["model"],
+            "llm.max_tokens": payload.get("max_tokens", 0),
+            "llm.prompt_tokens_estimate": estimate_messages_tokens(payload["messages"])
+        }
+    
+    @staticmethod
+    def _set_usage_attributes(llm_span, usage: Optional[Dict[str, int]]):
+        if usage:
+            llm_span.set_attributes(**{
+                f"llm.usage.{kind}": usage[kind]
+                for kind in ("prompt_tokens", "completion_tokens", "total_tokens") if kind in usage
+            })
+    
+    def _estimate_payload_tokens(self, payload: Dict[str, Any]) -> int:
+        """估算一次调用占用的token配额（提示词 + 最大输出）"""
+        return estimate_messages_tokens(payload["messages"]) + payload.get("max_tokens", 0)
+    
+    async def _limited_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """在RPM/TPM配额与智能体并发限制内发送补全请求（排队等待而非触发上游429）"""
+        async with get_rate_limiter().limit(self.agent_name, self._estimate_payload_tokens(payload)):
+            return await get_retry_policy().run(
+                lambda: self._request_completion(payload),
+                get_circuit_breaker(payload["model"])
+            )
+    
+    async def _request_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """通过共享连接池发送一次补全请求（每次尝试一个span，重试与对冲副本各自可见）"""
+        with span("llm.http", **{"llm.model": payload["model"]}) as http_span:
+            response = await get_http_client().post(
+                f"{self.base_url}/chat/completions",
+                headers=self.headers,
+                json=payload
+            )
+            http_span.set_attribute("http.status_code", response.status_code)
+            
+            if response.status_code == 200:
+                return response.json()
+            raise upstream_error(response, response.text)
+    
+    async def _stream_completion(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """以流式方式发送补全请求（并发的相同请求共享上游流并扇出；要求上游在末尾返回usage）"""
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        # 已推送给用户的内容无法重新生成，流式调用不降低max_tokens，避免回答（尤其末尾的注意事项）被截断
+        limited, decision = self._output_limit(payload, adapt=False)
+        async for content in get_single_flight().stream(
+            payload_key(limited), lambda: self._tracked_stream(limited, decision)
+        ):
+            yield content
+    
+    async def _tracked_stream(self, payload: Dict[str, Any], decision: OutputLimit) -> AsyncIterator[str]:
+        """记录首个分段耗时与总耗时；上游流在结束前被关闭（所有订阅者都已断开）时计入取消统计"""
+        generated = 0
+        ttft = None
+        start = time.perf_counter()
+        with span("llm.stream", **self._span_attributes(payload)) as llm_span:
+            try:
+                async for content in self._send_stream(payload, decision):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        LLM_TTFT_SECONDS.observe(ttft, agent=self.agent_name, model=payload["model"])
+                        llm_span.set_attribute("llm.ttft_ms", ttft * 1000)
+                    generated += estimate_tokens(content)
+                    yield content
+            except (asyncio.CancelledError, GeneratorExit):
+                get_cancellation_tracker().record_cancelled(self.agent_name, payload.get("max_tokens", 0), generated)
+                llm_span.set_attribute("llm.generated_tokens_estimate", generated)
+                self._record_stage(payload, start, "cancelled", stream=True, ttft_ms=_ms(ttft))
+                raise
+            except Exception as e:
+                ERRORS.inc(component="llm", type=error_type(e))
+                llm_span.set_attribute("llm.error_type", error_type(e))
+                self._record_stage(payload, start, error_type(e), stream=True, ttft_ms=_ms(ttft))
+                raise
+        LLM_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, agent=self.agent_name, model=payload["model"], mode="stream"
+        )
+        self._record_stage(payload, start, stream=True, ttft_ms=_ms(ttft))
+    
+    async def _open_stream(self, payload: Dict[str, Any]) -> httpx.Response:
+        """建立一次流式请求，返回尚未读取响应体的响应"""
+        client = get_http_client()
+        request = client.build_request(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            headers=self.headers,
+            json=payload
+        )
+        with span("llm.http", **{"llm.model": payload["model"], "llm.stream": True}) as http_span:
+            response = await client.send(request, stream=True)
+            http_span.set_attribute("http.status_code", response.status_code)
+        if response.status_code != 200:
+            body = (await response.aread()).decode("utf-8", errors="ignore")
+            await response.aclose()
+            raise upstream_error(response, body)
+        return response
+    
+    def _send_stream(self, payload: Dict[str, Any], decision: OutputLimit) -> AsyncIterator[str]:
+        """发送流式补全请求：首个分段过慢时对冲（按智能体开启）"""
+        return get_hedge_policy().stream(
+            lambda: self._read_stream(payload, decision),
+            key=f"{self.agent_name}:{payload['model']}:ttft",
+            enabled=self.hedge_enabled
+        )
+    
+    async def _read_stream(self, payload: Dict[str, Any], decision: OutputLimit) -> AsyncIterator[str]:
+        """以流式（SSE）方式发送补全请求，逐段产出增量文本（仅在收到首个分段前重试）"""
+        async with get_rate_limiter().limit(self.agent_name, self._estimate_payload_tokens(payload)):
+            response = await get_retry_policy().run(
+                lambda: self._open_stream(payload),
+                get_circuit_breaker(payload["model"])
+            )
+            usage, finish_reason, generated = None, None, 0
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                        self._set_usage_attributes(current_span(), usage)
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    finish_reason = choices[0].get("finish_reason") or finish_reason
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        generated += estimate_tokens(content)
+                        yield content
+                self._record_usage(payload, decision, usage, finish_reason, generated)
+            finally:
+                await response.aclose()
+    
+    @staticmethod
+    def _build_vision_messages(text_prompt: str, image_data: str) -> List[Dict[str, Any]]:
+        """构造图文混合消息（image_data为JPEG的base64编码，或带MIME类型的完整data URL）"""
+        url = image_data if image_data.startswith("data:") else f"data:image/jpeg;base64,{image_data}"
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": text_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": url}
+                    }
+                ]
+            }
+        ]
+    
     async def chat_completion(
         self, 
         messages: List[Dict[str, str]], 
@@ -39,23 +329,30 @@ class LLMClient:
                 "max_tokens": max_tokens
             }
             
-            # 在线程池中运行同步HTTP请求
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json=payload,
-                    timeout=30
-                )
-            )
+            result = await self._post_completion(payload)
+            return result['choices'][0]['message']['content']
+                
+        except Exception as e:
+            raise Exception(f"LLM调用失败: {str(e)}")
+    
+    async def chat_completion_stream(
+        self, 
+        messages: List[Dict[str, str]], 
+        model: str = Config.TEXT_MODEL,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """文本对话完成（流式）"""
+        try:
+            payload = {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
             
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                raise Exception(f"API调用失败: {response.status_code} - {response.text}")
+            async for content in self._stream_completion(payload):
+                yield content
                 
         except Exception as e:
             raise Exception(f"LLM调用失败: {str(e)}")
@@ -70,56 +367,59 @@ class LLMClient:
     ) -> str:
         """视觉理解完成"""
         try:
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": text_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                        }
-                    ]
-                }
-            ]
-            
             payload = {
                 "model": model,
-                "messages": messages,
+                "messages": self._build_vision_messages(text_prompt, image_data),
                 "temperature": temperature,
                 "max_tokens": max_tokens
             }
             
-            # 在线程池中运行同步HTTP请求
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json=payload,
-                    timeout=30
-                )
-            )
+            result = await self._post_completion(payload)
+            return result['choices'][0]['message']['content']
+                
+        except Exception as e:
+            raise Exception(f"视觉模型调用失败: {str(e)}")
+    
+    async def vision_completion_stream(
+        self, 
+        text_prompt: str, 
+        image_data: str,
+        model: str = Config.VISION_MODEL,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """视觉理解完成（流式）"""
+        try:
+            payload = {
+                "model": model,
+                "messages": self._build_vision_messages(text_prompt, image_data),
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
             
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                raise Exception(f"API调用失败: {response.status_code} - {response.text}")
+            async for content in self._stream_completion(payload):
+                yield content
                 
         except Exception as e:
             raise Exception(f"视觉模型调用失败: {str(e)}")
 
 
 class FileProcessor:
-    """文件处理器"""
+    """文件处理器（数据源可以是bytes/memoryview，也可以是临时文件路径）"""
+    
+    @staticmethod
+    def open_source(source: Union[bytes, bytearray, memoryview, str]):
+        """打开数据源：路径直接按文件读取，内存数据包装为只读流（bytes不会被复制）"""
+        if isinstance(source, str):
+            return open(source, "rb")
+        return io.BytesIO(source)
     
     @staticmethod
-    def extract_text_from_docx(file_content: bytes) -> str:
+    def extract_text_from_docx(source: Union[bytes, memoryview, str]) -> str:
         """从Word文档提取文本"""
         try:
-            doc = docx.Document(io.BytesIO(file_content))
+            with FileProcessor.open_source(source) as stream:
+                doc = docx.Document(stream)
             text = []
             for paragraph in doc.paragraphs:
                 text.append(paragraph.text)
@@ -128,35 +428,299 @@ class FileProcessor:
             raise Exception(f"Word文档解析失败: {str(e)}")
     
     @staticmethod
-    def extract_text_from_pdf(file_content: bytes) -> str:
-        """从PDF文档提取文本"""
+    def _resources_have_font(resources, seen: set, depth: int = 0) -> bool:
+        """资源字典（含嵌套的Form XObject资源）中是否有字体"""
+        if resources is None or depth > 8:
+            return False
+        resources = resources.get_object()
+        if "/Font" in resources:
+            return True
+        xobjects = resources.get("/XObject")
+        if xobjects is None:
+            return False
+        for ref in xobjects.get_object().values():
+            key = (ref.idnum, ref.generation) if hasattr(ref, "idnum") else id(ref)
+            if key in seen:
+                continue
+            seen.add(key)
+            xobject = ref.get_object()
+            if xobject.get("/Subtype") == "/Form" and FileProcessor._resources_have_font(
+                xobject.get("/Resources"), seen, depth + 1
+            ):
+                return True
+        return False
+    
+    @staticmethod
+    def _page_has_text_layer(page) -> bool:
+        """
+        页面资源（含Form XObject的嵌套资源）中没有字体即不可能有文本层（扫描件的纯图片页），无需解析内容流
+        """
+        node = page
+        while node is not None and "/Resources" not in node:
+            node = node.get("/Parent")
+            node = node.get_object() if node is not None else None
+        if node is None:
+            return False
+        return FileProcessor._resources_have_font(node["/Resources"], set())
+    
+    @staticmethod
+    def _extract_page_text(page, time_limit: float) -> Optional[str]:
+        """提取单页文本，超过time_limit秒时放弃该页返回None（在每个内容流操作符处检查）"""
+        deadline = time.perf_counter() + time_limit
+        
+        def check_deadline(*_):
+            if time.perf_counter() > deadline:
+                raise _PageTimeout()
+        
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            text = []
-            for page in pdf_reader.pages:
-                text.append(page.extract_text())
+            return page.extract_text(visitor_operand_before=check_deadline if time_limit else None)
+        except _PageTimeout:
+            return None
+    
+    @staticmethod
+    def iter_pdf_pages(source: Union[bytes, memoryview, str], settings: Optional[Dict[str, Any]] = None,
+                       start_page: int = 0, page_count: int = 0, chars_before: int = 0,
+                       summary: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[int, str]]:
+        """
+        逐页惰性提取PDF文本，产出(页码, 文本)，只产出有文本的页
+        达到max_pages/max_chars预算时停止；纯图片页跳过，单页超过page_time_limit时放弃该页
+        start_page/page_count/chars_before用于分批提取；summary（可选）记录检查页数、跳过/超时页数、字符数、
+        下一批起始页（next_page，已结束为None）与是否因预算截断
+        """
+        settings = settings if settings is not None else Config.PDF_EXTRACTION
+        max_pages = settings.get("max_pages", 0)
+        max_chars = settings.get("max_chars", 0)
+        time_limit = settings.get("page_time_limit", 0)
+        summary = summary if summary is not None else {}
+        summary.update({"total_pages": 0, "pages": 0, "text_pages": 0, "image_pages": 0,
+                        "timed_out_pages": 0, "chars": 0, "next_page": None, "truncated": False})
+        
+        with FileProcessor.open_source(source) as stream:
+            pdf_reader = PyPDF2.PdfReader(stream)
+            total_pages = len(pdf_reader.pages)
+            summary["total_pages"] = total_pages
+            end_page = min(total_pages, max_pages) if max_pages else total_pages
+            batch_end = min(end_page, start_page + page_count) if page_count else end_page
+            for index in range(start_page, batch_end):
+                page = pdf_reader.pages[index]
+                summary["pages"] += 1
+                if settings.get("skip_image_pages", True) and not FileProcessor._page_has_text_layer(page):
+                    summary["image_pages"] += 1
+                    continue
+                text = FileProcessor._extract_page_text(page, time_limit)
+                if text is None:
+                    summary["timed_out_pages"] += 1
+                    continue
+                if not text.strip():
+                    continue
+                used = chars_before + summary["chars"]
+                if max_chars and used + len(text) >= max_chars:
+                    # 本页文本被截断或后面还有页未检查，都算作因预算截断
+                    summary["truncated"] = used + len(text) > max_chars or index + 1 < total_pages
+                    text = text[:max_chars - used]
+                    summary["chars"] += len(text)
+                    summary["text_pages"] += 1
+                    yield index + 1, text
+                    return
+                summary["chars"] += len(text)
+                summary["text_pages"] += 1
+                yield index + 1, text
+            if batch_end < end_page:
+                summary["next_page"] = batch_end
+            else:
+                summary["truncated"] = end_page < total_pages
+    
+    @staticmethod
+    def extract_pdf_pages(source: Union[bytes, memoryview, str], start_page: int, page_count: int,
+                          chars_before: int = 0) -> Dict[str, Any]:
+        """
+        提取从start_page开始的最多page_count页（供执行器分批调用，每批结果可立即交给报告解读）
+        chars_before为此前各批已提取的字符数，用于整份文档的字符预算
+        返回{"pages": [(页码, 文本)], "summary": 本批统计（含next_page）}
+        """
+        summary: Dict[str, Any] = {}
+        try:
+            pages = list(FileProcessor.iter_pdf_pages(
+                source, Config.PDF_EXTRACTION, start_page, page_count, chars_before, summary
+            ))
+        except Exception as e:
+            raise Exception(f"PDF文档解析失败: {str(e)}")
+        return {"pages": pages, "summary": summary}
+    
+    @staticmethod
+    def extract_text_from_pdf(source: Union[bytes, memoryview, str]) -> str:
+        """从PDF文档提取文本（受Config.PDF_EXTRACTION的页数/字符预算限制）"""
+        try:
+            text = [page_text for _, page_text in FileProcessor.iter_pdf_pages(source)]
             return "\n".join(text)
         except Exception as e:
             raise Exception(f"PDF文档解析失败: {str(e)}")
     
     @staticmethod
-    def process_image_to_base64(file_content: bytes) -> str:
-        """将图片转换为base64编码"""
+    def _encode_legacy(image: Image.Image) -> bytes:
+        """原始转码方式：原分辨率JPEG q=85（关闭预处理时使用，也作为节省量的对照）"""
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        return buffer.getvalue()
+    
+    @staticmethod
+    def _downscale(image: Image.Image, max_long_edge: int) -> Image.Image:
+        """按EXIF方向摆正并缩放到长边不超过max_long_edge（JPEG先用draft在解码阶段按1/2~1/8缩小）"""
+        scale = max_long_edge / max(image.size)
+        if image.format == 'JPEG' and scale < 1:
+            image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if max(image.size) > max_long_edge:
+            # reducing_gap：先用reduce()整数倍快速缩小，再做高质量重采样
+            image.thumbnail((max_long_edge, max_long_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return image
+    
+    @staticmethod
+    def _encode_to_target(image: Image.Image, settings: Dict[str, Any]) -> Tuple[bytes, int, Image.Image]:
+        """编码到目标字节数以内：先逐步降低质量，仍超出时继续缩小尺寸"""
+        image_format = settings.get("format", "JPEG").upper()
+        quality = settings.get("quality", 85)
+        min_quality = settings.get("min_quality", 60)
+        min_long_edge = settings.get("min_long_edge", 512)
+        target_bytes = settings.get("target_bytes", 400 * 1024)
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, quality=quality)
+            if buffer.tell() <= target_bytes:
+                break
+            if quality > min_quality:
+                quality = max(min_quality, quality - 10)
+            elif max(image.size) * 0.75 >= min_long_edge:
+                image = image.resize(
+                    (int(image.width * 0.75), int(image.height * 0.75)), Image.Resampling.LANCZOS
+                )
+            else:
+                break
+        return buffer.getvalue(), quality, image
+    
+    @staticmethod
+    def prepare_image(
+        source: Union[bytes, memoryview, str],
+        settings: Optional[Dict[str, Any]] = None,
+        fingerprint: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        为视觉模型预处理图片：EXIF摆正 -> 缩放到模型实际使用的分辨率 -> 按目标大小编码（JPEG/WebP）
+        返回base64数据、MIME类型以及载荷大小与耗时（开启measure_baseline时附带原始转码方式的对照）
+        指定fingerprint（phash/dhash）时在摆正缩放后的图片上计算感知哈希
+        """
+        settings = settings if settings is not None else Config.IMAGE_PREPROCESSING
         try:
-            # 打开图片并转换为RGB格式
-            image = Image.open(io.BytesIO(file_content))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            start = time.perf_counter()
+            with FileProcessor.open_source(source) as stream:
+                original_bytes = stream.seek(0, io.SEEK_END)
+                stream.seek(0)
+                image = Image.open(stream)
+                original_size = image.size
+                if settings.get("enabled", True):
+                    image = FileProcessor._downscale(image, settings.get("max_long_edge", 1280))
+                    image_hash = perceptual_hash(image, fingerprint) if fingerprint else None
+                    payload, quality, image = FileProcessor._encode_to_target(image, settings)
+                    image_format = settings.get("format", "JPEG").upper()
+                else:
+                    payload, quality, image_format = FileProcessor._encode_legacy(image), 85, 'JPEG'
+                    image_hash = perceptual_hash(ImageOps.exif_transpose(image), fingerprint) if fingerprint else None
+            encode_ms = (time.perf_counter() - start) * 1000
             
-            # 压缩图片以减少大小
-            buffer = io.BytesIO()
-            image.save(buffer, format='JPEG', quality=85)
+            result = {
+                "data": base64.b64encode(payload).decode('utf-8'),
+                "mime_type": f"image/{image_format.lower()}",
+                "original_size": original_size,
+                "size": image.size,
+                "quality": quality,
+                "original_bytes": original_bytes,
+                "payload_bytes": len(payload),
+                "encode_ms": encode_ms,
+                "image_hash": image_hash
+            }
             
-            # 转换为base64
-            image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            return image_base64
+            if settings.get("measure_baseline"):
+                start = time.perf_counter()
+                with FileProcessor.open_source(source) as stream:
+                    baseline = FileProcessor._encode_legacy(Image.open(stream))
+                result["baseline_bytes"] = len(baseline)
+                result["baseline_ms"] = (time.perf_counter() - start) * 1000
+            return result
         except Exception as e:
             raise Exception(f"图片处理失败: {str(e)}")
+    
+    @staticmethod
+    def process_image_to_base64(source: Union[bytes, memoryview, str]) -> str:
+        """将图片预处理后转换为base64编码（JPEG）"""
+        settings = {**Config.IMAGE_PREPROCESSING, "format": "JPEG", "measure_baseline": False}
+        return FileProcessor.prepare_image(source, settings)["data"]
+
+
+class ImagePipelineStats:
+    """图片预处理统计：载荷字节数与编码耗时，及相对原始转码方式的节省量"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "images": 0, "original_bytes": 0, "payload_bytes": 0, "encode_ms": 0.0,
+            "baseline_samples": 0, "bytes_saved": 0, "encode_ms_saved": 0.0
+        }
+    
+    def record(self, result: Dict[str, Any]):
+        with self._lock:
+            self._counters["images"] += 1
+            self._counters["original_bytes"] += result["original_bytes"]
+            self._counters["payload_bytes"] += result["payload_bytes"]
+            self._counters["encode_ms"] += result["encode_ms"]
+            if "baseline_bytes" in result:
+                self._counters["baseline_samples"] += 1
+                self._counters["bytes_saved"] += result["baseline_bytes"] - result["payload_bytes"]
+                self._counters["encode_ms_saved"] += result["baseline_ms"] - result["encode_ms"]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        images, samples = counters["images"], counters["baseline_samples"]
+        counters["avg_payload_bytes"] = counters["payload_bytes"] / images if images else 0
+        counters["avg_encode_ms"] = counters["encode_ms"] / images if images else 0.0
+        counters["avg_bytes_saved"] = counters["bytes_saved"] / samples if samples else None
+        counters["avg_encode_ms_saved"] = counters["encode_ms_saved"] / samples if samples else None
+        return counters
+
+
+image_pipeline_stats = ImagePipelineStats()
+
+
+class _PageTimeout(Exception):
+    """单页文本提取超时"""
+
+
+class PdfExtractionStats:
+    """PDF逐页提取统计：跳过的纯图片页、超时页与因预算截断的文档数"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"documents": 0, "pages": 0, "text_pages": 0, "image_pages": 0,
+                          "timed_out_pages": 0, "chars": 0, "truncated_documents": 0}
+    
+    def record(self, summary: Dict[str, Any], document: bool = True):
+        """记录一批页面的提取结果（document=True时计入文档数）"""
+        with self._lock:
+            self._counters["documents"] += 1 if document else 0
+            for name in ("pages", "text_pages", "image_pages", "timed_out_pages", "chars"):
+                self._counters[name] += summary.get(name, 0)
+            self._counters["truncated_documents"] += 1 if summary.get("truncated") else 0
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters)
+
+
+pdf_extraction_stats = PdfExtractionStats()
 
 
 class ResponseFormatter:
@@ -182,6 +746,12 @@ class ResponseFormatter:
             "success": False
         }
     
+    @staticmethod
+    def sse_event(event: str, data: Any) -> str:
+        """SSE事件格式（text/event-stream）"""
+        payload = json.dumps(data, ensure_ascii=False)
+        return f"event: {event}\ndata: {payload}\n\n"
+    
     @staticmethod
     def parse_json_response(text: str) -> Dict[str, Any]:
         """解析JSON响应"""
@@ -201,6 +771,91 @@ class ResponseFormatter:
             return {"content": text.strip()}
 
 
+def _finish_reason(result: Dict[str, Any]) -> Optional[str]:
+    choices = result.get("choices") or [{}]
+    return choices[0].get("finish_reason")
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约1字1token，其余约4字符1token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    """估算消息列表的token数（忽略图片内容）"""
+    total = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        else:
+            total += sum(estimate_tokens(part.get("text", "")) for part in content if part.get("type") == "text")
+    return total
+
+
+def _pack_units(units: List[str], max_tokens: int) -> List[str]:
+    """把切分单元贪心合并到不超过max_tokens的分段"""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for unit in units:
+        tokens = estimate_tokens(unit)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def split_text_chunks(text: str, max_tokens: int, max_chunks: Optional[int] = None,
+                      max_chunk_tokens: Optional[int] = None) -> Tuple[List[str], bool]:
+    """
+    按段落（空行）切分文本并贪心合并到不超过max_tokens的分段；超长段落再按行切分，超长行按字符切分
+    分段数超过max_chunks时均匀增大每段大小（不超过max_chunk_tokens）；仍放不下时只保留前max_chunks段
+    返回(分段列表, 是否截断)，任何分段都不会超过max(max_tokens, max_chunk_tokens)
+    """
+    limit = max(max_tokens, max_chunk_tokens or 0)
+    units = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if not paragraph.strip():
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for line in paragraph.splitlines():
+            if not line.strip():
+                continue
+            if estimate_tokens(line) <= limit:
+                units.append(line)
+            else:
+                # 按字符切分时每字符至多1个token
+                units.extend(line[i:i + limit] for i in range(0, len(line), limit))
+    
+    chunks = _pack_units(units, max_tokens)
+    if not max_chunks or len(chunks) <= max_chunks:
+        return chunks, False
+    
+    size = max(max_tokens, math.ceil(sum(estimate_tokens(unit) for unit in units) / max_chunks))
+    while size < limit:
+        chunks = _pack_units(units, size)
+        if len(chunks) <= max_chunks:
+            return chunks, False
+        # 贪心合并在分段边界处留有空隙，逐步放大直至放下或达到上限
+        size = min(limit, math.ceil(size * 1.1))
+    chunks = _pack_units(units, limit)
+    return chunks[:max_chunks], len(chunks) > max_chunks
+
+
 def validate_file_type(filename: str, file_type: str) -> bool:
     """验证文件类型"""
     if file_type not in Config.ALLOWED_FILE_TYPES: